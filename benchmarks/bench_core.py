@@ -0,0 +1,263 @@
+'''Offline benchmarks of the website analysis functions on synthetic dbBact payloads
+
+For each scale (number of sequences), a synthetic get_fast_annotations payload is created (see synthetic.py) and
+the following are timed:
+enrichment.enrichment (term and annotation), mini_dsfdr.dsfdr, term_pairs.get_enrichment_score / get_recall / get_precision,
+scores.calculate_score, draw_annotation_table and draw_cloud.
+The rest-api calls are answered from the payload (by a requests adapter mounted on the rest_client session), so no network is needed.
+The benchmarked code is run as is: cases that cannot be imported are reported as skipped, and cases that fail are reported
+with their error.
+
+usage:
+python -m benchmarks.bench_core [--scales 10 1000 10000 100000] [--repeat 3] [--cases enrichment_term dsfdr ...] [--output results.json]
+'''
+import sys
+import json
+import time
+import argparse
+import urllib.parse
+import platform
+import datetime
+import subprocess
+
+import numpy as np
+import requests
+from requests.adapters import BaseAdapter
+
+from dbbact_website import utils
+from dbbact_website import enrichment
+from dbbact_website import mini_dsfdr
+from dbbact_website import term_pairs
+from dbbact_website import rest_client
+from benchmarks import synthetic
+
+DEFAULT_SCALES = [10, 1000, 10000, 100000]
+
+CASES = ['enrichment_term', 'enrichment_annotation', 'dsfdr', 'get_enrichment_score', 'get_recall', 'get_precision',
+         'calculate_score', 'draw_annotation_table', 'draw_cloud']
+
+
+class PayloadAdapter(BaseAdapter):
+    '''A requests transport adapter answering the rest-api calls from a synthetic payload
+    '''
+    def __init__(self, payload):
+        super().__init__()
+        self.payload = payload
+
+    def send(self, request, **kwargs):
+        path = urllib.parse.urlparse(request.url).path
+        data = None
+        if request.body:
+            data = json.loads(request.body)
+        status, res_json = synthetic.api_response(self.payload, path, data)
+        res = requests.Response()
+        res.status_code = status
+        res.reason = 'OK' if status == 200 else 'Not Found'
+        res._content = json.dumps(res_json).encode()
+        res.headers['Content-Type'] = 'application/json'
+        res.url = request.url
+        res.request = request
+        return res
+
+    def close(self):
+        pass
+
+
+def _time_case(func, repeat, max_time):
+    '''Time func() repeat times (stopping early if the total time is above max_time seconds)
+
+    Returns
+    -------
+    dict of {'min', 'median', 'mean' (seconds), 'runs' (int)}, or {'error': str} if func() failed
+    '''
+    times = []
+    total = 0
+    for idx in range(repeat):
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception as err:
+            return {'error': '%s: %s' % (type(err).__name__, err)}
+        ctime = time.perf_counter() - start
+        times.append(ctime)
+        total += ctime
+        if total > max_time:
+            break
+    return {'min': min(times), 'median': float(np.median(times)), 'mean': float(np.mean(times)), 'runs': len(times)}
+
+
+def _get_site_functions():
+    '''Import the website functions (need the full website environment: flask, matplotlib, wordcloud, calour)
+
+    Returns
+    -------
+    (module, flask.Flask) or raises ImportError
+    '''
+    from flask import Flask
+    from dbbact_website import Site_Main_Flask
+
+    app = Flask('dbbact_website')
+    app.register_blueprint(Site_Main_Flask.Site_Main_Flask_Obj)
+    return Site_Main_Flask, app
+
+
+def get_cases(payload):
+    '''Get the benchmark case functions for a payload
+
+    Parameters
+    ----------
+    payload: dict
+        from synthetic.make_payload()
+
+    Returns
+    -------
+    dict of {case name (str): function (no arguments)}
+    '''
+    sequences = payload['sequences']
+    half = max(1, len(sequences) // 2)
+    seqs1 = sequences[:half]
+    seqs2 = sequences[half:]
+    annotations = payload['annotations']
+    seqannotations = [(sequences[pos], cids) for pos, cids in payload['seqannotations']]
+    term_info = payload['term_info']
+
+    # the term X sequence matrix used by enrichment
+    sequence_annotations = {cseq: payload['seq_annotation_ids'][cseq] for cseq in sequences}
+    int_annotations = {int(cid): cann for cid, cann in annotations.items()}
+    feature_terms = enrichment._get_all_term_counts(sequences, sequence_annotations, int_annotations)
+    term_matrix, _ = enrichment._get_term_features(sequences, feature_terms)
+    labels = np.zeros(len(sequences))
+    labels[:half] = 1
+
+    cases = {}
+    cases['enrichment_term'] = lambda: enrichment.enrichment(seqs1, seqs2, term_type='term')
+    cases['enrichment_annotation'] = lambda: enrichment.enrichment(seqs1, seqs2, term_type='annotation')
+    cases['dsfdr'] = lambda: mini_dsfdr.dsfdr(term_matrix, labels, method='meandiff', transform_type=None, alpha=0.1, numperm=1000,
+                                              fdr_method='dsfdr', random_seed=2018)
+    cases['get_enrichment_score'] = lambda: term_pairs.get_enrichment_score(annotations, seqannotations, term_info=term_info)
+    cases['get_recall'] = lambda: term_pairs.get_recall(annotations, seqannotations, term_info=term_info)
+    cases['get_precision'] = lambda: term_pairs.get_precision(annotations, seqannotations)
+
+    try:
+        from dbbact_website import scores
+        score_seqannotations = [(pos, cids) for pos, cids in payload['seqannotations']]
+        cases['calculate_score'] = lambda: scores.calculate_score(int_annotations, score_seqannotations, term_info)
+    except ImportError as err:
+        cases['calculate_score'] = err
+
+    try:
+        site, app = _get_site_functions()
+    except ImportError as err:
+        for ccase in ['draw_annotation_table', 'draw_cloud']:
+            cases[ccase] = err
+        return cases
+
+    # annotations list as shown in the sequence list results (with the observed sequences for each annotation)
+    annotation_seqs = {}
+    for cseq, cids in seqannotations:
+        for cid in cids:
+            annotation_seqs.setdefault(cid, []).append(cseq)
+    table_annotations = []
+    for cid, cseqs in annotation_seqs.items():
+        cann = dict(annotations[str(cid)])
+        cann['website_sequences'] = cseqs
+        table_annotations.append(cann)
+
+    def draw_table():
+        with app.test_request_context():
+            site.draw_annotation_table(table_annotations)
+    cases['draw_annotation_table'] = draw_table
+
+    fscore, recall, precision, term_count, reduced_f = term_pairs.get_enrichment_score(annotations, seqannotations, term_info=term_info)
+    cases['draw_cloud'] = lambda: site.draw_cloud(fscore, recall, precision, term_count)
+    return cases
+
+
+def run(scales=DEFAULT_SCALES, repeat=3, max_time=60, cases=CASES, seed=0):
+    '''Run the benchmarks
+
+    Parameters
+    ----------
+    scales: list of int, optional
+        the number of sequences in each payload
+    repeat: int, optional
+        number of times to run each case
+    max_time: float, optional
+        stop repeating a case after max_time seconds
+    cases: list of str, optional
+        the cases to run (from CASES)
+    seed: int, optional
+        the random seed for the synthetic payloads
+
+    Returns
+    -------
+    dict of {'meta': dict, 'results': {scale (str): {case (str): timing (dict)}}}
+    '''
+    res = {'meta': _get_meta(repeat, seed), 'results': {}}
+    session = rest_client.get_session()
+    orig_adapters = dict(session.adapters)
+    orig_level = utils.debuglevel
+    # debug messages are not part of what we measure
+    utils.SetDebugLevel(11)
+    try:
+        for cscale in scales:
+            print('scale %d: creating payload' % cscale, file=sys.stderr)
+            start = time.perf_counter()
+            payload = synthetic.make_payload(cscale, seed=seed)
+            scale_res = {'payload': {'num_sequences': cscale, 'num_annotations': len(payload['annotations']),
+                                     'num_terms': len(payload['term_info']),
+                                     'num_seq_annotations': sum(len(x[1]) for x in payload['seqannotations']),
+                                     'create_time': time.perf_counter() - start}}
+            # all the rest-api calls of this process are answered from the payload
+            adapter = PayloadAdapter(payload)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            case_funcs = get_cases(payload)
+            for ccase in cases:
+                cfunc = case_funcs[ccase]
+                if isinstance(cfunc, Exception):
+                    scale_res[ccase] = {'skipped': '%s: %s' % (type(cfunc).__name__, cfunc)}
+                    continue
+                print('scale %d: %s' % (cscale, ccase), file=sys.stderr)
+                scale_res[ccase] = _time_case(cfunc, repeat, max_time)
+            res['results'][str(cscale)] = scale_res
+    finally:
+        utils.SetDebugLevel(orig_level)
+        # restore the network adapters
+        session.adapters.clear()
+        session.adapters.update(orig_adapters)
+    return res
+
+
+def _get_meta(repeat, seed):
+    '''Get the benchmark run details (for comparing results across commits)
+    '''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = 'unknown'
+    return {'commit': commit, 'date': datetime.datetime.now().isoformat(), 'python': platform.python_version(),
+            'numpy': np.__version__, 'platform': platform.platform(), 'repeat': repeat, 'seed': seed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='dbBact website offline benchmarks')
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES, help='number of sequences in each payload')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs of each case')
+    parser.add_argument('--max-time', type=float, default=60, help='stop repeating a case after this many seconds')
+    parser.add_argument('--cases', nargs='+', default=CASES, choices=CASES, help='the cases to run')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the synthetic payloads')
+    parser.add_argument('--output', help='json output file (default is stdout)')
+    args = parser.parse_args(argv)
+
+    res = run(scales=args.scales, repeat=args.repeat, max_time=args.max_time, cases=args.cases, seed=args.seed)
+    if args.output:
+        with open(args.output, 'w') as fl:
+            json.dump(res, fl, indent=2)
+    else:
+        json.dump(res, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+'''Microbenchmark of the utils.debug() logging path
+
+Compares the previous inspect.stack() based caller lookup with the current sys._getframe() path
+(in the 'sync', 'buffered' and 'async' log modes), for emitted and for filtered (below debug level) messages.
+Messages are written to os.devnull.
+
+usage:
+python -m benchmarks.bench_logging [--num N] [--output results.json]
+'''
+import sys
+import json
+import time
+import inspect
+import argparse
+import datetime
+
+from dbbact_website import utils
+
+
+def _debug_inspect(level, msg, request=None):
+    '''The previous utils.debug() implementation (for comparison)
+    '''
+    if level >= utils.debuglevel:
+        try:
+            cf = inspect.stack()[1]
+            cfile = cf.filename.split('/')[-1]
+            cline = cf.lineno
+            cfunction = cf.function
+        except:
+            cfile = 'NA'
+            cline = 'NA'
+            cfunction = 'NA'
+        omsg = '[%s] [%d] [%s:%s:%s] ' % (datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), level, cfile, cfunction, cline)
+        omsg += '%s' % msg
+        print(omsg, file=utils.log_file, flush=True)
+
+
+def _time_calls(func, num):
+    '''Get the mean time (in microseconds) of func()
+    '''
+    start = time.perf_counter()
+    for idx in range(num):
+        func(idx)
+    return (time.perf_counter() - start) / num * 1e6
+
+
+def run(num=10000):
+    '''Run the logging benchmark
+
+    Parameters
+    ----------
+    num: int, optional
+        number of debug calls for each case
+
+    Returns
+    -------
+    dict of {case(str): mean time per call in microseconds (float)}
+    '''
+    res = {}
+    orig_file = utils.log_file
+    orig_level = utils.debuglevel
+    orig_mode = utils.log_mode
+    with open('/dev/null', 'w') as devnull:
+        utils.log_file = devnull
+        try:
+            utils.SetDebugLevel(5)
+            res['inspect_emitted'] = _time_calls(lambda idx: _debug_inspect(6, 'got request for page %s' % idx), num)
+            res['inspect_filtered'] = _time_calls(lambda idx: _debug_inspect(1, 'got request for page %s' % idx), num)
+            for cmode in ['sync', 'buffered', 'async']:
+                utils.SetLogMode(cmode)
+                res['%s_emitted' % cmode] = _time_calls(lambda idx: utils.debug(6, 'got request for page %s', idx), num)
+                utils.flush_log()
+            res['filtered'] = _time_calls(lambda idx: utils.debug(1, 'got request for page %s', idx), num)
+        finally:
+            utils.SetLogMode(orig_mode)
+            utils.SetDebugLevel(orig_level)
+            utils.log_file = orig_file
+    return res
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='utils.debug() logging microbenchmark')
+    parser.add_argument('--num', type=int, default=10000, help='number of debug calls per case')
+    parser.add_argument('--output', help='json output file (default is stdout)')
+    args = parser.parse_args(argv)
+
+    res = run(num=args.num)
+    if args.output:
+        with open(args.output, 'w') as fl:
+            json.dump(res, fl, indent=2)
+    else:
+        json.dump(res, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
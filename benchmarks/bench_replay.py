@@ -0,0 +1,234 @@
+'''Deterministic benchmark of the website pages, replaying recorded rest-api responses
+
+The website requests (from a json lines requests file) are run in-process through the flask test client, and the
+rest-api calls are answered from a cassette file (see cassette.py) recorded beforehand. Since no network is used,
+the render time and memory of each page can be compared across commits.
+For each request, the render time of the first (cold) run and the median/min of all the runs are reported,
+together with the peak memory allocated during the request (using tracemalloc, in a separate run so it does not
+slow the timing runs) and the maximal resident memory of the process.
+The on-disk term stats and enrichment caches are disabled (unless --keep-disk-caches), so results do not depend on
+previous runs. Note that the rest-api calls of the background refreshes (database stats, term index) are replayed
+from the cassette too.
+
+usage:
+# create a requests file (for the synthetic payload served by fake_api.py)
+python -m benchmarks.bench_replay make-requests requests.jsonl [--num-requests 100] [--num-seqs 1000] [--seed 0]
+# record the rest-api responses (from the rest-api server set by DBBACT_SERVER_HOST/DBBACT_SERVER_PORT etc.)
+python -m benchmarks.bench_replay record requests.jsonl cassette.sqlite
+# replay them, timing each request
+python -m benchmarks.bench_replay replay requests.jsonl cassette.sqlite [--repeat 5] [--output results.json]
+'''
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tracemalloc
+from collections import defaultdict
+
+import numpy as np
+
+from benchmarks import synthetic
+from benchmarks.loadgen import get_route_requests
+from benchmarks.bench_core import _get_meta
+
+
+def make_requests(payload, num_requests, seed=0, routes=None):
+    '''Create random website requests for a synthetic payload
+
+    Parameters
+    ----------
+    payload: dict
+        the synthetic payload (from synthetic.make_payload())
+    num_requests: int
+        number of requests for each route
+    seed: int
+    routes: list of str or None
+        the routes to use (from loadgen.get_route_requests()). None to use all routes
+
+    Returns
+    -------
+    list of dict with keys 'route', 'method', 'path', 'data'
+    '''
+    rng = random.Random(seed)
+    route_requests = get_route_requests(payload, rng)
+    if routes is None:
+        routes = list(route_requests.keys())
+    requests_list = []
+    for idx in range(num_requests):
+        for croute in routes:
+            method, path, data = route_requests[croute]()
+            requests_list.append({'route': croute, 'method': method, 'path': path, 'data': data})
+    return requests_list
+
+
+def save_requests(requests_list, requests_file):
+    with open(requests_file, 'w') as fl:
+        for creq in requests_list:
+            fl.write(json.dumps(creq) + '\n')
+
+
+def load_requests(requests_file):
+    '''Load a json lines requests file
+
+    Each line is a dict with the keys 'method', 'path' and optional 'data' (the form data) and 'route' (the name used in the summary)
+    '''
+    requests_list = []
+    with open(requests_file) as fl:
+        for cline in fl:
+            if not cline.strip():
+                continue
+            creq = json.loads(cline)
+            creq.setdefault('method', 'GET')
+            creq.setdefault('data', None)
+            creq.setdefault('route', creq['path'])
+            requests_list.append(creq)
+    return requests_list
+
+
+def _get_client(cassette_file, mode, keep_disk_caches=False):
+    '''Get the website test client, with the rest-api session using the cassette
+
+    The environment is set before the website is imported, since the rest-api session is created on the first call
+    '''
+    os.environ['DBBACT_REST_CASSETTE'] = cassette_file
+    os.environ['DBBACT_REST_CASSETTE_MODE'] = mode
+    if not keep_disk_caches:
+        os.environ['DBBACT_TERM_STATS_CACHE_DIR'] = ''
+        os.environ['DBBACT_ENRICHMENT_CACHE_DIR'] = ''
+    from dbbact_website.Server_Main import app
+    return app.test_client()
+
+
+def _run_request(client, creq):
+    return client.open(creq['path'], method=creq['method'], data=creq['data']).status_code
+
+
+def record(requests_list, cassette_file):
+    '''Record the rest-api responses of the requests to the cassette file
+
+    Returns
+    -------
+    dict of {status code (int): number of requests}
+    '''
+    client = _get_client(cassette_file, 'record')
+    statuses = defaultdict(int)
+    for creq in requests_list:
+        statuses[_run_request(client, creq)] += 1
+    return dict(statuses)
+
+
+def replay(requests_list, cassette_file, repeat=5, keep_disk_caches=False):
+    '''Time the requests, replaying the rest-api responses from the cassette file
+
+    Parameters
+    ----------
+    requests_list: list of dict
+        the requests (from load_requests())
+    cassette_file: str
+        the cassette recorded by record()
+    repeat: int
+        number of timing runs of all the requests
+    keep_disk_caches: bool
+        False to disable the on-disk term stats and enrichment caches
+
+    Returns
+    -------
+    dict with the results of each request, a summary for each route and the run details
+    '''
+    if not os.path.exists(cassette_file):
+        raise FileNotFoundError('cassette file %s not found. record it first' % cassette_file)
+    client = _get_client(cassette_file, 'replay', keep_disk_caches=keep_disk_caches)
+
+    times = [[] for creq in requests_list]
+    statuses = [None] * len(requests_list)
+    for crun in range(repeat):
+        for idx, creq in enumerate(requests_list):
+            start = time.perf_counter()
+            status = _run_request(client, creq)
+            times[idx].append(time.perf_counter() - start)
+            if crun == 0:
+                statuses[idx] = status
+
+    # a separate run for the memory, since tracemalloc slows the code
+    peaks = []
+    tracemalloc.start()
+    try:
+        for creq in requests_list:
+            tracemalloc.reset_peak()
+            start_size = tracemalloc.get_traced_memory()[0]
+            _run_request(client, creq)
+            peaks.append(tracemalloc.get_traced_memory()[1] - start_size)
+    finally:
+        tracemalloc.stop()
+
+    results = []
+    route_results = defaultdict(lambda: defaultdict(list))
+    for creq, ctimes, cstatus, cpeak in zip(requests_list, times, statuses, peaks):
+        cres = {'route': creq['route'], 'method': creq['method'], 'path': creq['path'], 'status': cstatus,
+                'first': ctimes[0], 'median': float(np.median(ctimes)), 'min': min(ctimes), 'peak_alloc': cpeak}
+        results.append(cres)
+        for ckey in ['first', 'median', 'peak_alloc']:
+            route_results[creq['route']][ckey].append(cres[ckey])
+        route_results[creq['route']]['errors'].append(cstatus != 200)
+
+    routes = {}
+    for croute, cres in route_results.items():
+        routes[croute] = {'num_requests': len(cres['median']), 'errors': sum(cres['errors']),
+                          'first_total': sum(cres['first']), 'median_total': sum(cres['median']),
+                          'median_p50': float(np.median(cres['median'])), 'median_max': max(cres['median']),
+                          'peak_alloc_max': max(cres['peak_alloc'])}
+    # ru_maxrss is in kilobytes on linux (bytes on macOS)
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        max_rss *= 1024
+    return {'meta': _get_meta(repeat, None), 'cassette': cassette_file, 'routes': routes, 'requests': results,
+            'median_total': sum(x['median'] for x in results), 'max_rss': max_rss}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='dbBact website cassette replay benchmark')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    make_parser = subparsers.add_parser('make-requests', help='create a requests file for a synthetic payload')
+    make_parser.add_argument('requests', help='the json lines requests file to create')
+    make_parser.add_argument('--payload', help='json payload fixture (from synthetic.save_payload())')
+    make_parser.add_argument('--num-seqs', type=int, default=1000, help='number of sequences for a generated payload (if no --payload)')
+    make_parser.add_argument('--num-requests', type=int, default=10, help='number of requests for each route')
+    make_parser.add_argument('--routes', nargs='+', help='the routes to use (default is all the loadgen routes)')
+    make_parser.add_argument('--seed', type=int, default=0, help='random seed for the payload and the requests')
+    record_parser = subparsers.add_parser('record', help='record the rest-api responses of the requests')
+    record_parser.add_argument('requests', help='json lines requests file')
+    record_parser.add_argument('cassette', help='the cassette file to record to')
+    replay_parser = subparsers.add_parser('replay', help='time the requests replaying the recorded rest-api responses')
+    replay_parser.add_argument('requests', help='json lines requests file')
+    replay_parser.add_argument('cassette', help='the recorded cassette file')
+    replay_parser.add_argument('--repeat', type=int, default=5, help='number of runs of all the requests')
+    replay_parser.add_argument('--keep-disk-caches', action='store_true', help='use the on-disk term stats and enrichment caches')
+    replay_parser.add_argument('--output', help='json output file (default is stdout)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'make-requests':
+        if args.payload:
+            payload = synthetic.load_payload(args.payload)
+        else:
+            payload = synthetic.make_payload(args.num_seqs, seed=args.seed)
+        requests_list = make_requests(payload, args.num_requests, seed=args.seed, routes=args.routes)
+        save_requests(requests_list, args.requests)
+        print('saved %d requests to %s' % (len(requests_list), args.requests), file=sys.stderr)
+    elif args.command == 'record':
+        statuses = record(load_requests(args.requests), args.cassette)
+        print('recorded to %s. request status codes: %s' % (args.cassette, statuses), file=sys.stderr)
+    else:
+        res = replay(load_requests(args.requests), args.cassette, repeat=args.repeat, keep_disk_caches=args.keep_disk_caches)
+        if args.output:
+            with open(args.output, 'w') as fl:
+                json.dump(res, fl, indent=2)
+        else:
+            json.dump(res, sys.stdout, indent=2)
+            print()
+
+
+if __name__ == '__main__':
+    main()
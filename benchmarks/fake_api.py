@@ -0,0 +1,258 @@
+'''A lightweight stand-in dbBact rest-api server for load testing the website
+
+The server answers the rest-api endpoints used by the main website pages from a synthetic payload
+(see synthetic.py), either loaded from a json fixture (synthetic.save_payload()) or created at startup.
+A latency (with optional random jitter) can be added to each response, to simulate the real api server.
+
+usage:
+python -m benchmarks.fake_api [--payload fixture.json | --num-seqs 1000] [--port 7001] [--latency 0.02] [--jitter 0.01]
+
+and run the website with:
+export DBBACT_SERVER_HOST=127.0.0.1
+export DBBACT_SERVER_PORT=7001
+'''
+import sys
+import time
+import random
+import argparse
+from collections import defaultdict
+
+from flask import Flask, request, jsonify
+
+from benchmarks import synthetic
+
+
+class FakeDatabase:
+    '''Indexes over a synthetic payload used to answer the rest-api calls
+
+    Sequence ids are the position of the sequence in the payload + 1
+    '''
+    def __init__(self, payload):
+        self.payload = payload
+        self.sequences = payload['sequences']
+        self.seq_ids = {cseq.upper(): idx + 1 for idx, cseq in enumerate(self.sequences)}
+        self.annotations = {int(cid): cann for cid, cann in payload['annotations'].items()}
+        self.exp_annotations = defaultdict(list)
+        self.term_annotations = defaultdict(list)
+        self.annotation_seqs = defaultdict(list)
+        for cid, cann in self.annotations.items():
+            self.exp_annotations[cann['expid']].append(cid)
+            for ctype, cterm in cann['details']:
+                self.term_annotations[cterm].append(cid)
+        for pos, cids in payload['seqannotations']:
+            for cid in cids:
+                self.annotation_seqs[cid].append(pos + 1)
+        self.terms = sorted(set(x.lstrip('-') for x in payload['term_info']))
+
+    def get_taxonomy(self, seqid):
+        '''A deterministic fake taxonomy string for a sequence id
+        '''
+        return 'k__Bacteria;p__Phylum%d;c__Class%d;o__Order%d;f__Family%d;g__Genus%d' % (seqid % 5, seqid % 11, seqid % 17, seqid % 23, seqid % 31)
+
+    def get_species(self, seqid):
+        '''A deterministic fake species name (matching the fake taxonomy genus) for a sequence id
+        '''
+        return 'Genus%d species%d' % (seqid % 31, seqid % 7)
+
+    def get_taxonomy_seqids(self, taxonomy):
+        '''Get the ids of the sequences containing the taxonomy (case insensitive substring, as in the rest-api)
+        '''
+        taxonomy = taxonomy.lower()
+        if not taxonomy:
+            return []
+        return [cid for cid in range(1, len(self.sequences) + 1) if taxonomy in self.get_taxonomy(cid).lower()]
+
+    def get_species_seqids(self, species):
+        species = species.lower()
+        return [cid for cid in range(1, len(self.sequences) + 1) if self.get_species(cid).lower() == species]
+
+    def get_seq_info(self, seqid):
+        '''The sequence info as in the /sequences/get_info response
+        '''
+        cannotations = self.get_seq_annotations(seqid)
+        return {'seq': self.sequences[seqid - 1], 'taxonomy': self.get_taxonomy(seqid), 'total_annotations': len(cannotations),
+                'total_experiments': len(set(x['expid'] for x in cannotations))}
+
+    def get_seqid(self, sequence):
+        return self.seq_ids.get(sequence.upper())
+
+    def get_seq_annotations(self, seqid):
+        return [self.annotations[cid] for cid in self.payload['seq_annotation_ids'][self.sequences[seqid - 1]]]
+
+
+def create_app(payload, latency=0, jitter=0):
+    '''Create the fake rest-api flask app
+
+    Parameters
+    ----------
+    payload: dict
+        from synthetic.make_payload() / synthetic.load_payload()
+    latency: float, optional
+        seconds to wait before each response
+    jitter: float, optional
+        maximal random seconds added to the latency
+
+    Returns
+    -------
+    flask.Flask
+    '''
+    app = Flask(__name__)
+    db = FakeDatabase(payload)
+
+    def get_data():
+        data = request.get_json(force=True, silent=True) or {}
+        data.update(request.args.to_dict())
+        return data
+
+    @app.before_request
+    def add_latency():
+        if latency or jitter:
+            time.sleep(latency + random.random() * jitter)
+
+    @app.route('/stats/stats', methods=['GET', 'POST'])
+    @app.route('/sequences/get_fast_annotations', methods=['GET', 'POST'])
+    @app.route('/ontology/get_term_stats', methods=['GET', 'POST'])
+    def payload_endpoint():
+        status, res = synthetic.api_response(payload, request.path, get_data())
+        return jsonify(res), status
+
+    @app.route('/sequences/getid', methods=['GET', 'POST'])
+    def sequences_getid():
+        seqid = db.get_seqid(get_data().get('sequence', ''))
+        return jsonify({'seqId': [seqid] if seqid is not None else []})
+
+    @app.route('/sequences/getid_list', methods=['GET', 'POST'])
+    def sequences_getid_list():
+        seqids = [db.get_seqid(x) for x in get_data().get('sequences', [])]
+        return jsonify({'seqIds': [[x] if x is not None else [] for x in seqids]})
+
+    @app.route('/sequences/get_annotations', methods=['GET', 'POST'])
+    def sequences_get_annotations():
+        seqid = db.get_seqid(get_data().get('sequence', ''))
+        if seqid is None:
+            return jsonify({'annotations': []})
+        return jsonify({'annotations': db.get_seq_annotations(seqid)})
+
+    @app.route('/sequences/get_taxonomy_str', methods=['GET', 'POST'])
+    def sequences_get_taxonomy_str():
+        seqid = db.get_seqid(get_data().get('sequence', ''))
+        if seqid is None:
+            return 'sequence not found', 400
+        return jsonify({'taxonomy': db.get_taxonomy(seqid)})
+
+    @app.route('/sequences/get_whole_seq_taxonomy', methods=['GET', 'POST'])
+    def sequences_get_whole_seq_taxonomy():
+        return jsonify({'species': [], 'ids': [], 'names': []})
+
+    @app.route('/sequences/get_info', methods=['GET', 'POST'])
+    def sequences_get_info():
+        res = []
+        for cid in get_data().get('seqids', []):
+            cid = int(cid)
+            if cid < 1 or cid > len(db.sequences):
+                continue
+            res.append(db.get_seq_info(cid))
+        return jsonify({'sequences': res})
+
+    @app.route('/sequences/get_taxonomy_annotations', methods=['GET', 'POST'])
+    def sequences_get_taxonomy_annotations():
+        seqids = db.get_taxonomy_seqids(get_data().get('taxonomy', ''))
+        counts = defaultdict(int)
+        for cid in seqids:
+            for cannotation_id in db.payload['seq_annotation_ids'][db.sequences[cid - 1]]:
+                counts[int(cannotation_id)] += 1
+        return jsonify({'seqids': seqids, 'annotations': [[db.annotations[x], ccount] for x, ccount in counts.items()]})
+
+    @app.route('/sequences/get_taxonomy_sequences', methods=['GET', 'POST'])
+    def sequences_get_taxonomy_sequences():
+        return jsonify({'sequences': [db.get_seq_info(x) for x in db.get_taxonomy_seqids(get_data().get('taxonomy', ''))]})
+
+    @app.route('/sequences/get_species_seqs', methods=['GET', 'POST'])
+    def sequences_get_species_seqs():
+        return jsonify({'ids': db.get_species_seqids(get_data().get('species', ''))})
+
+    @app.route('/annotations/get_annotation', methods=['GET', 'POST'])
+    def annotations_get_annotation():
+        cid = int(get_data().get('annotationid', -1))
+        if cid not in db.annotations:
+            return 'annotation %d not found' % cid, 400
+        return jsonify(db.annotations[cid])
+
+    @app.route('/annotations/get_annotation_ontology_parents', methods=['GET', 'POST'])
+    def annotations_get_annotation_ontology_parents():
+        cid = int(get_data().get('annotationid', -1))
+        if cid not in db.annotations:
+            return 'annotation %d not found' % cid, 400
+        return jsonify({'parents': db.annotations[cid]['parents']})
+
+    @app.route('/annotations/get_full_sequences', methods=['GET', 'POST'])
+    def annotations_get_full_sequences():
+        cid = int(get_data().get('annotationid', -1))
+        seqs = [{'seq': db.sequences[x - 1], 'taxonomy': db.get_taxonomy(x)} for x in db.annotation_seqs.get(cid, [])]
+        return jsonify({'sequences': seqs})
+
+    @app.route('/annotations/get_list_sequences', methods=['GET', 'POST'])
+    def annotations_get_list_sequences():
+        ids = get_data().get('annotation_ids', [])
+        return jsonify({'annotation_seqs': {str(x): db.annotation_seqs.get(int(x), []) for x in ids}})
+
+    @app.route('/experiments/get_details', methods=['GET', 'POST'])
+    def experiments_get_details():
+        expid = int(get_data().get('expId', -1))
+        if expid not in db.exp_annotations:
+            return 'experiment %d not found' % expid, 400
+        return jsonify({'details': [['name', 'synthetic experiment %d' % expid], ['sra', 'PRJNA%d' % expid]]})
+
+    @app.route('/experiments/get_annotations', methods=['GET', 'POST'])
+    def experiments_get_annotations():
+        expid = int(get_data().get('expId', -1))
+        return jsonify({'annotations': [db.annotations[x] for x in db.exp_annotations.get(expid, [])]})
+
+    @app.route('/ontology/get_annotations', methods=['GET', 'POST'])
+    def ontology_get_annotations():
+        term = get_data().get('term', '')
+        if term not in db.term_annotations:
+            return 'term %s not found' % term, 400
+        return jsonify({'annotations': [db.annotations[x] for x in db.term_annotations[term]]})
+
+    @app.route('/ontology/get_term_children', methods=['GET', 'POST'])
+    def ontology_get_term_children():
+        term = get_data().get('term', '')
+        return jsonify({'terms': {'0': term}})
+
+    @app.route('/ontology/get_all_terms', methods=['GET', 'POST'])
+    def ontology_get_all_terms():
+        return jsonify(db.terms)
+
+    @app.route('/ontology/get_all_synonyms', methods=['GET', 'POST'])
+    def ontology_get_all_synonyms():
+        return jsonify([])
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='fake dbBact rest-api server for load testing')
+    parser.add_argument('--payload', help='json payload fixture (from synthetic.save_payload())')
+    parser.add_argument('--num-seqs', type=int, default=1000, help='number of sequences for a generated payload (if no --payload)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the generated payload')
+    parser.add_argument('--save-payload', help='save the generated payload to this json file (i.e. to use as a fixture)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7001)
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to each response')
+    parser.add_argument('--jitter', type=float, default=0, help='maximal random seconds added to the latency')
+    args = parser.parse_args(argv)
+
+    if args.payload:
+        payload = synthetic.load_payload(args.payload)
+    else:
+        print('creating payload with %d sequences' % args.num_seqs, file=sys.stderr)
+        payload = synthetic.make_payload(args.num_seqs, seed=args.seed)
+        if args.save_payload:
+            synthetic.save_payload(payload, args.save_payload)
+    app = create_app(payload, latency=args.latency, jitter=args.jitter)
+    app.run(host=args.host, port=args.port, threaded=True, use_reloader=False)
+
+
+if __name__ == '__main__':
+    main()
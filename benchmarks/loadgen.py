@@ -0,0 +1,183 @@
+'''Load generator for the dbBact website
+
+Sends requests to the main website routes at a target request rate (open loop: requests are sent on schedule
+even if previous ones did not finish), and reports the latency percentiles for each route.
+The latency is measured from the scheduled send time, so waiting for a free client thread is included.
+
+The request urls (sequences, terms, annotation and experiment ids) are taken from the same synthetic payload
+used by the fake rest-api server (fake_api.py), so use the same --payload or --num-seqs/--seed for both.
+
+usage:
+python -m benchmarks.loadgen --url http://127.0.0.1:7000 [--rate 5] [--duration 60] [--routes main sequence ...] [--output results.json]
+'''
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from benchmarks import synthetic
+
+ROUTES = ['main', 'search_sequence', 'search_term', 'sequence_annotations', 'annotation_info', 'exp_info', 'ontology_info']
+
+PERCENTILES = [50, 90, 95, 99]
+
+
+def get_route_requests(payload, rng):
+    '''Get the functions creating a random request for each route
+
+    Parameters
+    ----------
+    payload: dict
+        the synthetic payload (from synthetic.make_payload())
+    rng: random.Random
+
+    Returns
+    -------
+    dict of {route (str): function returning (method (str), path (str), data (dict or None))}
+    '''
+    sequences = payload['sequences']
+    annotation_ids = list(payload['annotations'].keys())
+    exp_ids = sorted(set(x['expid'] for x in payload['annotations'].values()))
+    terms = sorted(x for x in payload['term_info'] if not x.startswith('-'))
+    return {
+        'main': lambda: ('GET', '/main', None),
+        'search_sequence': lambda: ('POST', '/search_results', {'sequence': rng.choice(sequences)}),
+        'search_term': lambda: ('POST', '/search_results', {'sequence': rng.choice(terms)}),
+        'sequence_annotations': lambda: ('GET', '/sequence_annotations/%s' % rng.choice(sequences), None),
+        'annotation_info': lambda: ('GET', '/annotation_info/%s' % rng.choice(annotation_ids), None),
+        'exp_info': lambda: ('GET', '/exp_info/%s' % rng.choice(exp_ids), None),
+        'ontology_info': lambda: ('GET', '/ontology_info/%s' % rng.choice(terms), None),
+    }
+
+
+def summarize(latencies, errors, duration):
+    '''Get the latency percentiles for a list of latencies
+
+    Parameters
+    ----------
+    latencies: list of float
+        the latency (seconds) of each successful request
+    errors: int
+        number of failed requests
+    duration: float
+        the test duration (seconds)
+
+    Returns
+    -------
+    dict
+    '''
+    res = {'count': len(latencies), 'errors': errors, 'rate': len(latencies) / duration}
+    if latencies:
+        for cperc in PERCENTILES:
+            res['p%d' % cperc] = float(np.percentile(latencies, cperc))
+        res['mean'] = float(np.mean(latencies))
+        res['max'] = float(np.max(latencies))
+    return res
+
+
+def run(url, payload, rate=5, duration=60, routes=ROUTES, max_threads=50, timeout=300, seed=0):
+    '''Run the load test
+
+    Parameters
+    ----------
+    url: str
+        the website address (i.e. 'http://127.0.0.1:7000')
+    payload: dict
+        the synthetic payload served by the fake rest-api server
+    rate: float, optional
+        requests per second (the routes are chosen at random)
+    duration: float, optional
+        test duration in seconds
+    routes: list of str, optional
+        the routes to test (from ROUTES)
+    max_threads: int, optional
+        maximal number of requests waiting at the same time
+    timeout: float, optional
+        request timeout (seconds). timed out requests are counted as errors
+    seed: int, optional
+        random seed for choosing the routes and request parameters
+
+    Returns
+    -------
+    dict of {'total': summary (dict), 'routes': {route: summary (dict)}} (see summarize())
+    '''
+    rng = random.Random(seed)
+    route_requests = get_route_requests(payload, rng)
+    session = requests.Session()
+    session.mount('http://', HTTPAdapter(pool_connections=max_threads, pool_maxsize=max_threads))
+    session.mount('https://', HTTPAdapter(pool_connections=max_threads, pool_maxsize=max_threads))
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def send(route, method, path, data, scheduled):
+        try:
+            res = session.request(method, url + path, data=data, timeout=timeout)
+            ok = res.status_code < 500
+        except requests.RequestException:
+            ok = False
+        latency = time.perf_counter() - scheduled
+        with lock:
+            if ok:
+                latencies[route].append(latency)
+            else:
+                errors[route] += 1
+
+    start = time.perf_counter()
+    num_requests = int(rate * duration)
+    with ThreadPoolExecutor(max_workers=max_threads) as executor:
+        for idx in range(num_requests):
+            scheduled = start + idx / rate
+            wait = scheduled - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            route = rng.choice(routes)
+            method, path, data = route_requests[route]()
+            executor.submit(send, route, method, path, data, scheduled)
+    total_time = time.perf_counter() - start
+
+    res = {'url': url, 'target_rate': rate, 'duration': total_time, 'routes': {}}
+    for croute in routes:
+        res['routes'][croute] = summarize(latencies[croute], errors[croute], total_time)
+    all_latencies = [x for croute in routes for x in latencies[croute]]
+    res['total'] = summarize(all_latencies, sum(errors.values()), total_time)
+    return res
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='dbBact website load generator')
+    parser.add_argument('--url', default='http://127.0.0.1:7000', help='the website address')
+    parser.add_argument('--payload', help='json payload fixture used by the fake rest-api server')
+    parser.add_argument('--num-seqs', type=int, default=1000, help='number of sequences for a generated payload (if no --payload)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the generated payload')
+    parser.add_argument('--rate', type=float, default=5, help='requests per second')
+    parser.add_argument('--duration', type=float, default=60, help='test duration (seconds)')
+    parser.add_argument('--routes', nargs='+', default=ROUTES, choices=ROUTES, help='the routes to test')
+    parser.add_argument('--max-threads', type=int, default=50, help='maximal number of concurrent requests')
+    parser.add_argument('--output', help='json output file (default is stdout)')
+    args = parser.parse_args(argv)
+
+    if args.payload:
+        payload = synthetic.load_payload(args.payload)
+    else:
+        payload = synthetic.make_payload(args.num_seqs, seed=args.seed)
+    res = run(args.url, payload, rate=args.rate, duration=args.duration, routes=args.routes, max_threads=args.max_threads, seed=args.seed)
+    if args.output:
+        with open(args.output, 'w') as fl:
+            json.dump(res, fl, indent=2)
+    else:
+        json.dump(res, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+'''Synthetic dbBact rest-api payloads for the offline benchmarks
+
+make_payload() creates a set of sequences with annotations, shaped like the dbBact
+/sequences/get_fast_annotations response (annotations, seqannotations, term_info).
+Term and annotation popularity follow a Zipf-like distribution (a few very common terms like
+"feces" / "homo sapiens", and a long tail of rare terms), as in the real database.
+'''
+import json
+import datetime
+
+import numpy as np
+
+ANNOTATION_TYPES = ['common', 'dominant', 'other', 'diffexp', 'contamination', 'positive association', 'negative association']
+ANNOTATION_TYPE_FREQS = [0.35, 0.15, 0.1, 0.3, 0.02, 0.04, 0.04]
+PRIMERS = ['v4', 'v3', 'v1']
+
+
+def _zipf_probs(num, exponent=1.1):
+    '''Get Zipf-like selection probabilities for num items
+    '''
+    probs = 1 / np.arange(1, num + 1) ** exponent
+    return probs / probs.sum()
+
+
+def make_sequences(num_seqs, rng, seq_len=150):
+    '''Create random unique ACGT sequences
+
+    Parameters
+    ----------
+    num_seqs: int
+    rng: np.random.Generator
+    seq_len: int, optional
+
+    Returns
+    -------
+    list of str
+    '''
+    bases = np.array(list('ACGT'))
+    seqs = set()
+    while len(seqs) < num_seqs:
+        cseqs = bases[rng.integers(0, 4, size=(num_seqs - len(seqs), seq_len))]
+        seqs.update(''.join(x) for x in cseqs)
+    return sorted(seqs)
+
+
+def make_payload(num_seqs, num_annotations=None, num_terms=None, num_experiments=None, annotations_per_seq=20, seed=0):
+    '''Create a synthetic get_fast_annotations payload
+
+    Parameters
+    ----------
+    num_seqs: int
+        number of sequences
+    num_annotations: int or None, optional
+        number of annotations in the database. None to scale with num_seqs
+    num_terms: int or None, optional
+        number of ontology terms. None to scale with num_seqs
+    num_experiments: int or None, optional
+        number of experiments. None to scale with num_seqs
+    annotations_per_seq: float, optional
+        mean number of annotations for each sequence
+    seed: int, optional
+        the random seed (the payload is deterministic given the parameters)
+
+    Returns
+    -------
+    dict with:
+        'sequences': list of str - the sequences
+        'annotations': dict of {annotationid (str): annotation (dict)} (as in the rest-api json)
+        'seq_annotation_ids': dict of {sequence (str): list of annotation ids (int)}
+        'seqannotations': list of [position in sequences (int), list of annotation ids (int)]
+        'term_info': dict of {term (str): {'total_annotations', 'total_sequences', 'total_experiments'}}
+    '''
+    rng = np.random.default_rng(seed)
+    if num_annotations is None:
+        num_annotations = int(min(20000, max(50, num_seqs // 4)))
+    if num_terms is None:
+        num_terms = int(min(5000, max(30, num_seqs // 20)))
+    if num_experiments is None:
+        num_experiments = int(min(1500, max(5, num_annotations // 10)))
+
+    sequences = make_sequences(num_seqs, rng)
+    terms = ['term%d' % idx for idx in range(num_terms)]
+    term_cdf = np.cumsum(_zipf_probs(num_terms))
+    term_cdf[-1] = 1
+    base_date = datetime.date(2018, 1, 1)
+
+    annotations = {}
+    term_annotations = {}
+    term_exps = {}
+    for cid in range(1, num_annotations + 1):
+        ctype = rng.choice(ANNOTATION_TYPES, p=ANNOTATION_TYPE_FREQS)
+        cexp = int(rng.integers(1, num_experiments + 1))
+        num_details = int(rng.integers(1, 8))
+        cterms = [terms[x] for x in set(np.searchsorted(term_cdf, rng.random(num_details)))]
+        details = []
+        parents = {}
+        for cterm in cterms:
+            if ctype == 'diffexp':
+                cdetail_type = str(rng.choice(['high', 'low']))
+            else:
+                cdetail_type = 'all'
+            details.append([cdetail_type, str(cterm)])
+            # the parents include the term and some more general terms
+            cparents = [str(cterm)] + [terms[x] for x in rng.integers(0, min(20, num_terms), size=2)]
+            parents.setdefault(cdetail_type, []).extend(cparents)
+            cterm_name = '-' + str(cterm) if cdetail_type == 'low' else str(cterm)
+            term_annotations[cterm_name] = term_annotations.get(cterm_name, 0) + 1
+            term_exps.setdefault(cterm_name, set()).add(cexp)
+        annotations[str(cid)] = {'annotationid': cid, 'annotationtype': str(ctype), 'expid': cexp,
+                                 'userid': int(rng.integers(1, 50)), 'username': 'user%d' % rng.integers(1, 50),
+                                 'description': 'synthetic annotation %d' % cid, 'details': details, 'parents': parents,
+                                 'date': str(base_date + datetime.timedelta(days=int(rng.integers(0, 2000)))),
+                                 'primer': str(rng.choice(PRIMERS)), 'num_sequences': int(rng.integers(1, 5000)),
+                                 'review_status': int(rng.integers(0, 2)), 'flags': [], 'method': 'na', 'agenttype': 'na'}
+
+    # assign annotations to sequences (popular annotations are observed on more sequences)
+    annotation_probs = _zipf_probs(num_annotations, exponent=0.8)
+    # draw all the sequence annotations at once (duplicates within a sequence are removed)
+    num_seq_annotations = rng.poisson(annotations_per_seq, size=num_seqs)
+    all_ids = rng.choice(num_annotations, size=num_seq_annotations.sum(), p=annotation_probs) + 1
+    seq_ids = np.split(all_ids, np.cumsum(num_seq_annotations)[:-1])
+    seq_annotation_ids = {}
+    seqannotations = []
+    for pos, cseq in enumerate(sequences):
+        cids = sorted(set(int(x) for x in seq_ids[pos]))
+        seq_annotation_ids[cseq] = cids
+        if cids:
+            seqannotations.append([pos, cids])
+
+    term_info = {}
+    for cterm, cnum in term_annotations.items():
+        term_info[cterm] = {'total_annotations': cnum, 'total_sequences': cnum * int(rng.integers(10, 1000)),
+                            'total_experiments': len(term_exps[cterm])}
+    term_info['contamination'] = {'total_annotations': 10, 'total_sequences': 1000, 'total_experiments': 5}
+
+    return {'sequences': sequences, 'annotations': annotations, 'seq_annotation_ids': seq_annotation_ids,
+            'seqannotations': seqannotations, 'term_info': term_info}
+
+
+def get_fast_annotations_response(payload, sequences):
+    '''Get the /sequences/get_fast_annotations json response for a list of sequences from a payload
+
+    Parameters
+    ----------
+    payload: dict
+        from make_payload()
+    sequences: list of str
+        the requested sequences (sequences not in the payload have no annotations)
+
+    Returns
+    -------
+    dict
+    '''
+    seqannotations = []
+    used_ids = set()
+    for pos, cseq in enumerate(sequences):
+        cids = payload['seq_annotation_ids'].get(cseq)
+        if cids:
+            seqannotations.append([pos, cids])
+            used_ids.update(cids)
+    annotations = {str(cid): payload['annotations'][str(cid)] for cid in used_ids}
+    # the terms appearing in the annotations (as in the real response term_info)
+    term_info = {}
+    for cannotation in annotations.values():
+        for ctype, cterm in cannotation['details']:
+            cterm_name = '-' + cterm if ctype == 'low' else cterm
+            if cterm_name in payload['term_info']:
+                term_info[cterm_name] = payload['term_info'][cterm_name]
+    return {'annotations': annotations, 'seqannotations': seqannotations, 'term_info': term_info, 'taxonomy': []}
+
+
+def get_stats(payload):
+    '''Get the /stats/stats json response for a payload
+    '''
+    num_seq_annotations = sum(len(x[1]) for x in payload['seqannotations'])
+    experiments = set(x['expid'] for x in payload['annotations'].values())
+    return {'stats': {'NumSequences': len(payload['sequences']), 'NumAnnotations': len(payload['annotations']),
+                      'NumSeqAnnotations': num_seq_annotations, 'NumExperiments': len(experiments),
+                      'NumOntologyTerms': len(payload['term_info']), 'Database': 'synthetic'}}
+
+
+def api_response(payload, path, data):
+    '''Get the rest-api response for a request, based on the payload
+
+    Supports the endpoints needed by the benchmarks (/sequences/get_fast_annotations, /ontology/get_term_stats, /stats/stats)
+
+    Parameters
+    ----------
+    payload: dict
+        from make_payload()
+    path: str
+        the rest-api endpoint (i.e. '/stats/stats')
+    data: dict or None
+        the request json
+
+    Returns
+    -------
+    (int, dict)
+        the http status code and the response json
+    '''
+    if data is None:
+        data = {}
+    if path == '/sequences/get_fast_annotations':
+        return 200, get_fast_annotations_response(payload, data.get('sequences', []))
+    if path == '/ontology/get_term_stats':
+        term_info = {cterm: payload['term_info'][cterm] for cterm in data.get('terms', []) if cterm in payload['term_info']}
+        return 200, {'term_info': term_info}
+    if path == '/stats/stats':
+        return 200, get_stats(payload)
+    return 404, {'error': 'endpoint %s not supported by the synthetic payload' % path}
+
+
+def save_payload(payload, fname):
+    '''Save a payload as json (used as a fixture, i.e. for the fake rest-api server)
+    '''
+    with open(fname, 'w') as fl:
+        json.dump(payload, fl)
+
+
+def load_payload(fname):
+    '''Load a payload saved by save_payload()
+    '''
+    with open(fname) as fl:
+        return json.load(fl)
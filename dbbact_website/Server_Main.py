@@ -1,7 +1,12 @@
-from flask import Flask, request
+from flask import Flask, request, g
 from .Site_Main_Flask import Site_Main_Flask_Obj
 import os
+import time
 from .utils import debug, SetDebugLevel
+from . import metrics
+from . import profiler
+from . import stats_cache
+from . import term_index
 
 dbDefaultUser = "na"  # anonymos user in case the field is empty
 dbDefaultPwd = ""
@@ -16,10 +21,50 @@ app.register_blueprint(Site_Main_Flask_Obj)
 # whenever a new request arrives, log the originating ip for debugging
 @app.before_request
 def before_request():
+    g.request_start_time = time.perf_counter()
     if request.remote_addr != '127.0.0.1':
-        debug(6, 'got request for page %s' % request.url, request=request)
+        debug(6, 'got request for page %s', request.url, request=request)
     else:
-        debug(6, 'got local request for page %s' % request.url, request=request)
+        debug(6, 'got local request for page %s', request.url, request=request)
+    # profile the request if asked to (see profiler.should_profile())
+    if profiler.should_profile(request):
+        g.request_profiler = profiler.start_profile()
+
+
+# record the request latency by route (the url rule, so /term_info/<string:term> is one route)
+# and save the request profile (if profiled)
+@app.after_request
+def after_request(response):
+    if 'request_start_time' in g:
+        if request.url_rule is not None:
+            route = request.url_rule.rule
+        else:
+            route = 'unknown'
+        metrics.observe('dbbact_website_request_duration_seconds', time.perf_counter() - g.request_start_time,
+                        route=route, method=request.method, status=response.status_code)
+    if g.get('request_profiler') is not None:
+        profile_file = profiler.stop_profile(g.pop('request_profiler'), request)
+        if profile_file is not None:
+            response.headers['X-Dbbact-Profile-File'] = os.path.basename(profile_file)
+    return response
+
+
+# stop the profiler if the request failed before after_request
+@app.teardown_request
+def teardown_request(exc):
+    if g.get('request_profiler') is not None:
+        profiler.stop_profile(g.pop('request_profiler'), request)
+
+
+@app.route('/metrics')
+def metrics_page():
+    '''The website metrics (for all gunicorn workers if DBBACT_METRICS_DIR is set) in prometheus text format
+
+    Only for local requests, or requests with the DBBACT_METRICS_TOKEN bearer token (see metrics.is_request_allowed())
+    '''
+    if not metrics.is_request_allowed(request):
+        return 'Forbidden', 403, {'Content-Type': 'text/plain; charset=utf-8'}
+    return metrics.get_metrics_text(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
 
 def gunicorn(debug_level=6):
@@ -45,6 +90,11 @@ def gunicorn(debug_level=6):
     # ignore proxies for local communication
     os.environ['NO_PROXY']='127.0.0.1'
 
+    # start filling the statistics and term index caches in the background, so the first requests of the worker
+    # do not wait for them (gunicorn calls this in each worker, unless using --preload)
+    stats_cache.get_stats(wait=False)
+    term_index.get_indexes(wait=False)
+
     return app
 
 
@@ -5,7 +5,6 @@ from io import TextIOWrapper
 import os
 import json
 import requests
-import re
 from io import BytesIO
 import base64
 import hashlib
@@ -15,20 +14,24 @@ mpl.use('Agg')
 import numpy as np
 import scipy.stats
 
-from flask import Blueprint, request, render_template, make_response, redirect, url_for, Markup, render_template_string, send_from_directory, current_app, session, send_file, current_app
+from flask import Blueprint, request, render_template, make_response, redirect, url_for, Markup, render_template_string, send_from_directory, current_app, session, send_file, current_app, jsonify
 
 from .utils import debug, get_fasta_seqs, get_dbbact_server_address, get_dbbact_server_color
-from . import enrichment
+from . import rest_client
+from . import enrichment_jobs
+from . import metrics
+from . import stats_cache
+from . import term_index
+from . import term_stats_cache
+from . import search_resolver
+from .primers import DEFAULT_PRIMERS, get_primer_matcher
+from .seq_index import get_sequence_index
 import calour as ca
 import dbbact_calour.dbbact
 
 Site_Main_Flask_Obj = Blueprint('Site_Main_Flask_Obj', __name__, template_folder='templates')
 
 
-# the dbbact rest-api server address
-dbbact_server_address = get_dbbact_server_address()
-
-
 # robots.txt file for google/other web crawlers
 @Site_Main_Flask_Obj.route("/robots.txt")
 def robots_txt():
@@ -96,25 +99,20 @@ def main_html():
     URL: dbbact.org/main
     Method: GET
     """
-    # get the dbbact statistics from the dbbact rest-api server
-    debug(2, 'getting stats from %s' % dbbact_server_address)
+    # get the dbbact statistics (cached, refreshed in the background)
     NumAnnotation = 0
     NumSequences = 0
     NumSequenceAnnotation = 0
     NumExperiments = 0
     dbbact_api_server_type = 'unknown'
-    try:
-        httpRes = requests.get(dbbact_server_address + '/stats/stats')
-        if httpRes.status_code == 200:
-            jsonRes = httpRes.json()
-            # NumOntologyTerms = jsonRes.get("stats").get('NumOntologyTerms')
-            NumAnnotation = jsonRes.get("stats").get('NumAnnotations')
-            NumSequences = jsonRes.get("stats").get('NumSequences')
-            NumSequenceAnnotation = jsonRes.get("stats").get('NumSeqAnnotations')
-            NumExperiments = jsonRes.get("stats").get('NumExperiments')
-            dbbact_api_server_type = jsonRes.get("stats").get("Database")
-    except:
-        pass
+    stats = stats_cache.get_stats()
+    if stats is not None:
+        # NumOntologyTerms = stats.get('NumOntologyTerms')
+        NumAnnotation = stats.get('NumAnnotations')
+        NumSequences = stats.get('NumSequences')
+        NumSequenceAnnotation = stats.get('NumSeqAnnotations')
+        NumExperiments = stats.get('NumExperiments')
+        dbbact_api_server_type = stats.get("Database")
     # NumOntologyTerms = 0
 
     webPage = render_template('searchpage.html',
@@ -133,19 +131,18 @@ def test_enrichment():
     Redirect to enrichment page
     '''
     # TODO: fix to non hard-coded
-    httpRes = requests.get(dbbact_server_address + '/stats/stats')
+    stats = stats_cache.get_stats()
     # NumOntologyTerms = 0
     NumAnnotation = 0
     NumSequences = 0
     NumSequenceAnnotation = 0
     NumExperiments = 0
-    if httpRes.status_code == 200:
-        jsonRes = httpRes.json()
-        # NumOntologyTerms = jsonRes.get("stats").get('NumOntologyTerms')
-        NumAnnotation = jsonRes.get("stats").get('NumAnnotations')
-        NumSequences = jsonRes.get("stats").get('NumSequences')
-        NumSequenceAnnotation = jsonRes.get("stats").get('NumSeqAnnotations')
-        NumExperiments = jsonRes.get("stats").get('NumExperiments')
+    if stats is not None:
+        # NumOntologyTerms = stats.get('NumOntologyTerms')
+        NumAnnotation = stats.get('NumAnnotations')
+        NumSequences = stats.get('NumSequences')
+        NumSequenceAnnotation = stats.get('NumSeqAnnotations')
+        NumExperiments = stats.get('NumExperiments')
 
     webPage = render_template('enrichment.html',
                               numAnnot=(str(NumAnnotation).replace('.0', '')),
@@ -239,6 +236,13 @@ def add_data_results():
         webpage = build_res_html(False, -1, False, -1, 'Invalid region value')
         return(webpage, 400)
 
+    # if requested, remove the forward primer of the selected region, so the sequences are added without it
+    # (only the primer of the selected region is removed, so the sequences match the region they are added with)
+    if request.form.get('trimPrimersCb'):
+        region_primers = {cprimer: cregion for cprimer, cregion in DEFAULT_PRIMERS.items() if cregion == hiddenRegionStr.strip().lower()}
+        if len(region_primers) > 0:
+            seqs1, _ = get_primer_matcher(region_primers).trim_all(seqs1)
+
     if hiddenOntType is None or len(hiddenOntType.strip()) == 0:
         webpage = build_res_html(False, -1, False, -1, 'Invalid Input (error code: -1)')
         return(webpage, 400)
@@ -272,7 +276,7 @@ def add_data_results():
     rdata = {}
     rdata['nameStrArr'] = expDataNameArr
     rdata['valueStrArr'] = expDataValueArr
-    httpRes = requests.get(dbbact_server_address + '/experiments/get_id_by_list', json=rdata)
+    httpRes = rest_client.get('/experiments/get_id_by_list', json=rdata)
     if httpRes.status_code == 200:
         jsonRes = httpRes.json()
         expId = jsonRes.get("expId")
@@ -293,7 +297,7 @@ def add_data_results():
 
                 rdataExp = {'expId': -1, 'private': False, 'details': test}
 
-                httpRes = requests.post(dbbact_server_address + '/experiments/add_details', json=rdataExp)
+                httpRes = rest_client.post('/experiments/add_details', json=rdataExp)
                 if httpRes.status_code == 200:
                     jsonRes = httpRes.json()
                     expId = jsonRes.get("expId")
@@ -312,7 +316,7 @@ def add_data_results():
     rdata['sequences'] = seqs1
     rdata['primer'] = hiddenRegionStr
 
-    httpRes = requests.post(dbbact_server_address + '/sequences/add', json=rdata)
+    httpRes = rest_client.post('/sequences/add', json=rdata)
     if httpRes.status_code == 200:
         jsonRes = httpRes.json()
         seqList = jsonRes.get("seqIds")
@@ -330,7 +334,7 @@ def add_data_results():
     rdata = {}
     rdata['ontologies'] = ontDataNameArr
 
-    httpRes = requests.post(dbbact_server_address + '/ontology/get',json=rdata)
+    httpRes = rest_client.post('/ontology/get',json=rdata)
     if httpRes.status_code == 200:
         jsonRes = httpRes.json()
         ontList = jsonRes.get("ontIds")
@@ -359,7 +363,7 @@ def add_data_results():
     rannotation['description'] = descName
     rannotation['annotationList'] = annotationListArr
     # Everything is ready to add the data
-    httpRes = requests.post(dbbact_server_address + '/annotations/add', json=rannotation)
+    httpRes = rest_client.post('/annotations/add', json=rannotation)
     if httpRes.status_code == 200:
         jsonRes = httpRes.json()
         annotId = jsonRes.get("annotationId")
@@ -430,6 +434,7 @@ def enrichment_results():
                 return(webPageTemp, 400)
         else:
             webPageTemp = render_header(title='Error') + render_template('error_page.html', error_str='Error: Missing fasta file name')
+            return(webPageTemp, 400)
     else:
         # only used for example query
         with open("dbbact_website/enrichment_example/seqs-sal.fa", "r") as myfile:
@@ -440,21 +445,46 @@ def enrichment_results():
                 return(webPageTemp, 400)
     debug(2, 'Loaded %d sequences for seqs2 file' % len(seqs2))
 
+    # the enrichment is calculated by the job queue. we redirect to the job status page which shows the results when ready
+    try:
+        job_id = enrichment_jobs.submit(seqs1, seqs2)
+    except enrichment_jobs.QueueFullError as err:
+        webPageTemp = render_header(title='Error') + render_template('error_page.html', error_str=str(err))
+        return(webPageTemp, 503)
+    return redirect(url_for('.enrichment_job', job_id=job_id))
+
+
+@Site_Main_Flask_Obj.route('/enrichment_job/<string:job_id>', methods=['GET'])
+def enrichment_job(job_id):
+    """
+    Title: Enrichment job status page
+    URL: site/enrichment_job/<job_id>
+    Method: GET
+    Description: Shows the progress of an enrichment job (refreshing automatically), and the results when done.
+    Use ?format=json to get the job status as json (without the results)
+    """
+    status = enrichment_jobs.get_status(job_id)
+    if status is None:
+        webPageTemp = render_header(title='Error') + render_template('error_page.html', error_str='Enrichment job %s not found' % job_id)
+        return(webPageTemp, 404)
+    if request.args.get('format') == 'json':
+        return jsonify({'status': status['status'], 'progress': status['progress'], 'position': status['position']})
+    if status['status'] == 'failed':
+        webPageTemp = render_header(title='Error') + render_template('error_page.html', error_str=status['progress'])
+        return(webPageTemp, 400)
+    if status['status'] != 'done':
+        webpage = render_header(title='Calculating enrichment')
+        webpage += render_template('enrichment_job.html', refresh=3, progress=status['progress'], position=status['position'],
+                                   elapsed=int(status['elapsed']))
+        webpage += render_template('footer.html')
+        return webpage
+
     webpage = render_header()
     # webpage = render_template('info_header.html')
-    for term_type in ['term', 'annotation']:
+    for term_type, terms, pval, odif in status['result']:
         webpage += "<h2>%s enrichment</h2>" % term_type
         webpage += '(negative (red) LOWER in fasta file 1, positive (blue) HIGHER in fasta file 1)<br>'
         webpage += render_template('enrichment_results.html')
-
-        debug(2, 'looking for enriched %s' % term_type)
-        err, terms, pval, odif = enrichment.enrichment(seqs1, seqs2, term_type=term_type)
-        # err, terms, pval, odif = enrichment.calour_enrichment(seqs1, seqs2, term_type=term_type)
-        debug(2, 'found %d enriched' % len(terms))
-
-        if err:
-            webPageTemp = render_header(title='Error') + render_template('error_page.html', error_str=err)
-            return(webPageTemp, 400)
         for idx, cterm in enumerate(terms):
             if odif[idx] < 0:
                 ccolor = 'red'
@@ -499,6 +529,12 @@ def search_results():
             if seqs is None:
                 webPageTemp = render_header(title='Error') + render_template('error_page.html', error_str='Error: Uploaded file not recognized as fasta')
                 return(webPageTemp, 400)
+            # look up the reads as given, and remove the V1/V3/V4 forward primers only from the reads that were not found
+            missing = [pos for pos, cexists in enumerate(test_if_sequences_exist(seqs)) if not cexists]
+            if len(missing) > 0:
+                trimmed, _ = get_primer_matcher().trim_all([seqs[pos] for pos in missing])
+                for pos, ctrimmed in zip(missing, trimmed):
+                    seqs[pos] = ctrimmed
             # return the webpage for the group annotations
             err, webpage = draw_sequences_annotations_compact(seqs)
             return webpage
@@ -517,31 +553,25 @@ def search_results():
         #     webPage = sequence_annotations(sequence)
         #     return webPage
 
-        # try is it an ontology term
-        err, webPage = get_ontology_info(sequence)
+        # find if it is an ontology term / taxonomy / SILVA species name / qiime2 hash string / silva id
+        # (the possible lookups are checked concurrently, and only the matching one is drawn)
+        lookup_type, prefetched = search_resolver.resolve(sequence)
+        err = 'not found'
+        if lookup_type == 'ontology':
+            err, webPage = get_ontology_info(sequence, prefetched=prefetched)
+        elif lookup_type == 'taxonomy':
+            err, webPage = get_taxonomy_info(sequence, prefetched=prefetched)
+        elif lookup_type == 'species':
+            err, webPage = get_species_info(sequence, prefetched=prefetched)
+        elif lookup_type == 'hash':
+            err, webPage = get_hash_info(sequence, prefetched=prefetched)
+        elif lookup_type == 'silva':
+            err, webPage = get_silva_info(sequence, prefetched=prefetched)
         if not err:
-            debug(2, 'get info for ontology term %s' % sequence)
-            return webPage
-        # or maybe a taxonomy term
-        err, webPage = get_taxonomy_info(sequence)
-        if not err:
-            debug(2, 'get info for taxonomy %s' % sequence)
-            return webPage
-        # maybe a SILVA species name?
-        if len(sequence.split(' ')) > 1:
-            err, webPage = get_species_info(sequence)
-            if not err:
-                debug(2, 'get species info')
-                return webPage
-        # or maybe based on qiime2 hash string
-        err, webPage = get_hash_info(sequence)
-        if not err:
-            debug(2, 'get info for qiime2 hash %s' % sequence)
-            return webPage
-        # or maybe based on silva id
-        err, webPage = get_silva_info(sequence)
-        if not err:
-            debug(2, 'get info for silva id %s' % sequence)
+            # remember the matching lookup, so repeated searches for the same query skip the lookups
+            # (not found queries are recorded by resolve(), since the page can also fail due to a rest-api error)
+            search_resolver.record_result(sequence, lookup_type)
+            debug(2, 'get info for %s %s' % (lookup_type, sequence))
             return webPage
         # so we can't find it
         debug(2, 'search sequence/term/etc not found for %s' % sequence)
@@ -624,18 +654,23 @@ def sequence_annotations(sequence):
             # we didn't find any match, so lets try if the sequence is left trimmed
             pass
 
-    # Get the taxonomy for the sequence
+    # Get the taxonomy, whole sequence database (i.e. silva) matches and annotations for the sequence
+    # these are independent, so we get them concurrently
     rdata = {}
     rdata['sequence'] = sequence
+    httpResTax, httpResWholeTax, httpRes = rest_client.fetch_all([('GET', '/sequences/get_taxonomy_str', {'json': rdata}),
+                                                                  ('GET', '/sequences/get_whole_seq_taxonomy', {'json': rdata}),
+                                                                  ('GET', '/sequences/get_annotations', {'json': rdata})])
+
+    # the taxonomy for the sequence
     taxStr = "na"
-    httpResTax = requests.get(dbbact_server_address + '/sequences/get_taxonomy_str', json=rdata)
     if httpResTax.status_code == requests.codes.ok:
         taxStr = httpResTax.json().get('taxonomy')
 
-    # Get the species and taxonomies based on 100% matching to the whole sequence database (i.e. silva)
+    # the species and taxonomies based on 100% matching to the whole sequence database (i.e. silva)
     species = []
     num_species_match = 0
-    httpResTax = requests.get(dbbact_server_address + '/sequences/get_whole_seq_taxonomy', json=rdata)
+    httpResTax = httpResWholeTax
     if httpResTax.status_code == requests.codes.ok:
         species = httpResTax.json().get('species')
         ids = httpResTax.json().get('ids')
@@ -679,8 +714,7 @@ def sequence_annotations(sequence):
         else:
             pass
 
-    # Get the annotations for the sequence
-    httpRes = requests.get(dbbact_server_address + '/sequences/get_annotations', json=rdata)
+    # the annotations for the sequence
     if httpRes.status_code != requests.codes.ok:
         # problem with the annotations per sequence
         debug(6, "sequence annotations Error code:" + str(httpRes.status_code))
@@ -760,8 +794,8 @@ def draw_sequences_annotations(seqs):
     webpage : str
         the webpage for the annotations of these sequences
     '''
-    res = requests.get(get_dbbact_server_address() + '/sequences/get_list_annotations',
-                       json={'sequences': seqs})
+    res = rest_client.get('/sequences/get_list_annotations',
+                          json={'sequences': seqs})
     if res.status_code != 200:
         msg = 'error getting annotations for sequences : %s' % Markup.escape(res.content)
         debug(6, msg)
@@ -809,8 +843,8 @@ def draw_sequences_annotations_compact(seqs, ignore_exp=[], draw_only_details=Fa
     '''
     # get the compact annotations for the sequences
     debug(2, 'draw_sequences_annotations_compact for %d sequences. ignore_exp=%s' % (len(seqs), ignore_exp))
-    res = requests.get(get_dbbact_server_address() + '/sequences/get_fast_annotations',
-                       json={'sequences': seqs})
+    res = rest_client.get('/sequences/get_fast_annotations',
+                          json={'sequences': seqs})
     if res.status_code != 200:
         msg = 'error getting annotations for sequences : %s' % Markup.escape(res.content)
         debug(6, msg)
@@ -915,11 +949,12 @@ def annotation_info(annotationid):
     annotationid : int
         the annotationid to get the info for
     """
-    # get the experiment info for the annotation
+    # get the annotation details and the ontology parent terms for the annotation
+    # (both only need the annotationid so we get them concurrently)
     rdata = {}
     rdata['annotationid'] = annotationid
-    # get the experiment annotations
-    res = requests.get(get_dbbact_server_address() + '/annotations/get_annotation', params=rdata)
+    res, res_parents = rest_client.fetch_all([('GET', '/annotations/get_annotation', {'params': rdata}),
+                                              ('GET', '/annotations/get_annotation_ontology_parents', {'json': {'annotationid': annotationid}})])
     if res.status_code != 200:
         message = Markup('Annotation ID <b>%d</b> was not found.' % annotationid)
         webPageTemp = render_header(title='Error') + render_template('error_page.html', error_str='Not found')
@@ -932,7 +967,7 @@ def annotation_info(annotationid):
     rdata['expId'] = expid
     webPage = render_header(title='Annotation %s' % annotationid)
     webPage += render_template('annotinfo.html', annotationid=annotationid)
-    res = requests.get(dbbact_server_address + '/experiments/get_details', json=rdata)
+    res = rest_client.get('/experiments/get_details', json=rdata)
     if res.status_code == 200:
         webPage += draw_experiment_info(expid, res.json()['details'])
     else:
@@ -985,7 +1020,7 @@ def annotation_info(annotationid):
 
     # add the ontology parent terms for the annotation
     webPage += '<h2>Ontology terms (including parents)</h2>'
-    res = requests.get(get_dbbact_server_address() + '/annotations/get_annotation_ontology_parents', json={'annotationid': annotationid})
+    res = res_parents
     if res.status_code != 200:
         debug(6, 'no ontology parents found for annotationid %d' % annotationid)
         parents = []
@@ -1063,7 +1098,7 @@ def annotation_flag_submit():
     data = {}
     data['annotationid'] = annotationid
     data['reason'] = reason
-    httpRes = requests.post(dbbact_server_address + '/annotations/add_annotation_flag', json=data)
+    httpRes = rest_client.post('/annotations/add_annotation_flag', json=data)
     if httpRes.status_code == 200:
         webpage = render_header(title='Password Recovery')
         webpage += 'Annotation %s has been flagged and will be reviewed by the dbbact team<br>' % annotationid
@@ -1134,7 +1169,7 @@ def ontology_info(term):
     return webpage
 
 
-def get_ontology_info(term, show_ontology_tree=False, show_associated_seqs=True):
+def get_ontology_info(term, show_ontology_tree=False, show_associated_seqs=True, prefetched=None):
     """
     get the information all studies containing an ontology term (exact or as parent)
     input:
@@ -1144,14 +1179,18 @@ def get_ontology_info(term, show_ontology_tree=False, show_associated_seqs=True)
         if True, show the term tree graph using cytoscape.js
     show_associated_seq: bool, optional
         if True, show the top term positive/negative-associated sequences
+    prefetched: dict or None, optional
+        the /ontology/get_annotations response json for the term, if already fetched (i.e. by search_resolver.resolve())
     """
     # get the term annotations
-    res = requests.get(get_dbbact_server_address() + '/ontology/get_annotations', params={'term': term, 'get_children': 'true'})
-    if res.status_code != 200:
-        msg = 'error getting annotations for ontology term %s: %s' % (Markup.escape(term), res.content)
-        debug(6, msg)
-        return msg, msg
-    annotations = res.json()['annotations']
+    if prefetched is None:
+        res = rest_client.get('/ontology/get_annotations', params={'term': term, 'get_children': 'true'})
+        if res.status_code != 200:
+            msg = 'error getting annotations for ontology term %s: %s' % (Markup.escape(term), res.content)
+            debug(6, msg)
+            return msg, msg
+        prefetched = res.json()
+    annotations = prefetched['annotations']
     if len(annotations) == 0:
         debug(1, 'ontology term %s not found' % Markup.escape(term))
         return 'term not found', 'term not found'
@@ -1178,7 +1217,7 @@ def get_ontology_info(term, show_ontology_tree=False, show_associated_seqs=True)
 @Site_Main_Flask_Obj.route('/annotations_list')
 def annotations_list():
     debug(1, 'annotations_list')
-    res = requests.get(get_dbbact_server_address() + '/annotations/get_all_annotations')
+    res = rest_client.get('/annotations/get_all_annotations')
     if res.status_code != 200:
         msg = 'error getting annotations list: %s' % res.content
         debug(6, msg)
@@ -1214,7 +1253,7 @@ def get_experiments_list():
     '''
     # get the experiments list
     debug(1, 'get_experiments_list')
-    res = requests.get(get_dbbact_server_address() + '/experiments/get_experiments_list')
+    res = rest_client.get('/experiments/get_experiments_list')
     if res.status_code != 200:
         msg = 'error getting experiments list: %s' % res.content
         debug(6, msg)
@@ -1268,7 +1307,7 @@ def taxonomy_info(taxonomy):
     return webpage
 
 
-def get_taxonomy_info(taxonomy):
+def get_taxonomy_info(taxonomy, prefetched=None):
     '''
     get the information all studies containing any bacteria with taxonomy as substring
 
@@ -1276,6 +1315,8 @@ def get_taxonomy_info(taxonomy):
     ----------
     taxonomy : str
         the partial taxonomy string to look for
+    prefetched: dict or None, optional
+        the /sequences/get_taxonomy_annotations response json for the taxonomy, if already fetched (i.e. by search_resolver.resolve())
 
     Returns
     -------
@@ -1286,13 +1327,15 @@ def get_taxonomy_info(taxonomy):
     '''
     # get the taxonomy annotations
     debug(2, 'get_taxonomy_info for %s' % taxonomy)
-    res = requests.get(get_dbbact_server_address() + '/sequences/get_taxonomy_annotations', json={'taxonomy': taxonomy})
-    if res.status_code != 200:
-        msg = 'error getting taxonomy annotations for %s: %s' % (Markup.escape(taxonomy), res.content)
-        debug(6, msg)
-        return msg, msg
-    tax_seqs = res.json()['seqids']
-    annotations_counts = res.json()['annotations']
+    if prefetched is None:
+        res = rest_client.get('/sequences/get_taxonomy_annotations', json={'taxonomy': taxonomy})
+        if res.status_code != 200:
+            msg = 'error getting taxonomy annotations for %s: %s' % (Markup.escape(taxonomy), res.content)
+            debug(6, msg)
+            return msg, msg
+        prefetched = res.json()
+    tax_seqs = prefetched['seqids']
+    annotations_counts = prefetched['annotations']
     debug(2, 'found %d taxonomy annotations for %d sequences for taxonomy %s' % (len(annotations_counts), len(tax_seqs), taxonomy))
     if len(annotations_counts) == 0:
         msg = 'no annotations found for taxonomy %s' % Markup.escape(taxonomy)
@@ -1310,7 +1353,7 @@ def get_taxonomy_info(taxonomy):
     annotations = sorted(annotations, key=lambda x: len(x.get('website_sequences', [])), reverse=True)
 
     # get all dbbact sequences containing the taxonomy
-    res = requests.get(get_dbbact_server_address() + '/sequences/get_taxonomy_sequences', json={'taxonomy': taxonomy})
+    res = rest_client.get('/sequences/get_taxonomy_sequences', json={'taxonomy': taxonomy})
     if res.status_code != 200:
         msg = 'error getting taxonomy sequences for %s: %s' % (Markup.escape(taxonomy), res.content)
         debug(6, msg)
@@ -1361,7 +1404,7 @@ def species_info(species):
     return webpage
 
 
-def get_species_info(species):
+def get_species_info(species, prefetched=None):
     '''
     get the information all sequences and studies containing any bacteria with SILVA species name
 
@@ -1369,6 +1412,8 @@ def get_species_info(species):
     ----------
     species : str
         the species name to search for
+    prefetched: dict or None, optional
+        the /sequences/get_species_seqs response json for the species, if already fetched (i.e. by search_resolver.resolve())
 
     Returns
     -------
@@ -1379,17 +1424,19 @@ def get_species_info(species):
     '''
     # get the sequences
     debug(2, 'Get species info')
-    res = requests.get(get_dbbact_server_address() + '/sequences/get_species_seqs', json={'species': species})
-    if res.status_code != 200:
-        msg = 'error getting species sequences for %s: %s' % (Markup.escape(species), res.content)
-        debug(6, msg)
-        return msg, msg
-    ids = res.json()['ids']
+    if prefetched is None:
+        res = rest_client.get('/sequences/get_species_seqs', json={'species': species})
+        if res.status_code != 200:
+            msg = 'error getting species sequences for %s: %s' % (Markup.escape(species), res.content)
+            debug(6, msg)
+            return msg, msg
+        prefetched = res.json()
+    ids = prefetched['ids']
     debug(2, 'Got %d sequences matching the species %s' % (len(ids), species))
     if len(ids) == 0:
         msg = "No sequences found for species %s" % species
         return msg, msg
-    res = requests.get(get_dbbact_server_address() + '/sequences/get_info', json={'seqids': ids})
+    res = rest_client.get('/sequences/get_info', json={'seqids': ids})
     debug(2, 'got info')
     if res.status_code != 200:
         msg = 'error getting sequence info: %s' % (res.content)
@@ -1430,7 +1477,7 @@ def get_species_info(species):
     return '', webPage
 
 
-def get_hash_info(hash_str):
+def get_hash_info(hash_str, prefetched=None):
     '''
     get the information about a sequence based on its qiime2 hash
 
@@ -1438,6 +1485,8 @@ def get_hash_info(hash_str):
     ----------
     hash_str : string
         sequence represented by its hash
+    prefetched: dict or None, optional
+        the /sequences/get_hash_annotations response json for the hash, if already fetched (i.e. by search_resolver.resolve())
 
     Returns
     -------
@@ -1446,15 +1495,23 @@ def get_hash_info(hash_str):
     webPage : str
         the html of the resulting table
     '''
-    # get the hash annotations
-    res = requests.get(get_dbbact_server_address() + '/sequences/get_hash_annotations', json={'hash': hash_str})
-    if res.status_code != 200:
-        msg = 'error getting hash annotations for %s: %s' % (Markup.escape(hash_str), res.content)
-        debug(6, msg)
-        return msg, msg
-    seq_strs = res.json()['seqstr']
-    hash_seqs = res.json()['seqids']
-    annotations_counts = res.json()['annotations']
+    if prefetched is None:
+        # a hash that is not in the local sequence index (if available) is not in dbBact, so we don't need the rest-api
+        seq_index = get_sequence_index()
+        if seq_index is not None and seq_index.lookup_hash(hash_str) is None:
+            msg = 'no annotations found for hash %s' % Markup.escape(hash_str)
+            debug(1, msg)
+            return msg, msg
+        # get the hash annotations
+        res = rest_client.get('/sequences/get_hash_annotations', json={'hash': hash_str})
+        if res.status_code != 200:
+            msg = 'error getting hash annotations for %s: %s' % (Markup.escape(hash_str), res.content)
+            debug(6, msg)
+            return msg, msg
+        prefetched = res.json()
+    seq_strs = prefetched['seqstr']
+    hash_seqs = prefetched['seqids']
+    annotations_counts = prefetched['annotations']
     if len(annotations_counts) == 0:
         msg = 'no annotations found for hash %s' % Markup.escape(hash_str)
         debug(1, msg)
@@ -1483,7 +1540,7 @@ def get_hash_info(hash_str):
     return '', webPage
 
 
-def get_silva_info(silva_str):
+def get_silva_info(silva_str, prefetched=None):
     '''
     get the information about a sequence based on its silva id
 
@@ -1491,6 +1548,8 @@ def get_silva_info(silva_str):
     ----------
     silva_str : str
         sequence represented by its silva id (should be XXXX.N.NNN or XXXX)
+    prefetched: dict or None, optional
+        the /sequences/get_annotations response json for the silva id, if already fetched (i.e. by search_resolver.resolve())
 
     Returns
     -------
@@ -1500,18 +1559,18 @@ def get_silva_info(silva_str):
         the html of the resulting table
     '''
     # trim the .XXX.YYY part from the silva id if present
-    parts = silva_str.split('.')
-    if len(parts) > 1:
-        silva_str = '.'.join(parts[:-2])
+    silva_str = search_resolver.get_silva_accession(silva_str)
 
     # get the annotations
-    res = requests.get(get_dbbact_server_address() + '/sequences/get_annotations', json={'sequence': silva_str, 'dbname': 'silva'})
-    if res.status_code != 200:
-        msg = 'error getting silva annotations for %s: %s' % (Markup.escape(silva_str), res.content)
-        debug(6, msg)
-        return msg, msg
+    if prefetched is None:
+        res = rest_client.get('/sequences/get_annotations', json={'sequence': silva_str, 'dbname': 'silva'})
+        if res.status_code != 200:
+            msg = 'error getting silva annotations for %s: %s' % (Markup.escape(silva_str), res.content)
+            debug(6, msg)
+            return msg, msg
+        prefetched = res.json()
 
-    annotations = res.json().get('annotations')
+    annotations = prefetched.get('annotations')
 
     if len(annotations) == 0:
         webPage = render_header(title='dbBact ontology')
@@ -1520,9 +1579,9 @@ def get_silva_info(silva_str):
         return 'no annotations found', webPage
 
     # get the matching dbbact sequences for the silva id
-    res = requests.get(get_dbbact_server_address() + '/sequences/getid', json={'sequence': silva_str, 'dbname': 'silva'})
+    res = rest_client.get('/sequences/getid', json={'sequence': silva_str, 'dbname': 'silva'})
     ids = res.json().get('seqId')
-    res = requests.get(get_dbbact_server_address() + '/sequences/get_info', json={'seqids': ids})
+    res = rest_client.get('/sequences/get_info', json={'seqids': ids})
 
     silva_seq_strs = [x['seq'] for x in res.json()['sequences']]
     silva_seq_tax = [x['taxonomy'] for x in res.json()['sequences']]
@@ -1566,7 +1625,7 @@ def experiment_info(expid):
 
     # get the experiment details
     webPage = render_header()
-    res = requests.get(dbbact_server_address + '/experiments/get_details', json={'expId': expid})
+    res = rest_client.get('/experiments/get_details', json={'expId': expid})
     if res.status_code == 200:
         webPage += draw_experiment_info(expid, res.json()['details'])
     else:
@@ -1577,7 +1636,7 @@ def experiment_info(expid):
                render_template('footer.html'), 400)
 
     # get the experiment annotations
-    res = requests.get(dbbact_server_address + '/experiments/get_annotations', json={'expId': expid})
+    res = rest_client.get('/experiments/get_annotations', json={'expId': expid})
     annotations = res.json()['annotations']
     for cannotation in annotations:
         cannotation['website_sequences'] = [-1]
@@ -1643,7 +1702,7 @@ def annotation_seqs(annotationid):
     '''
 
     # get the annotation details
-    res = requests.get(dbbact_server_address + '/annotations/get_annotation', json={'annotationid': annotationid})
+    res = rest_client.get('/annotations/get_annotation', json={'annotationid': annotationid})
     if res.status_code != 200:
         msg = 'Error encountered when getting info for annotation ID %d: %s' % (annotationid, res.content)
         debug(6, msg)
@@ -1661,7 +1720,7 @@ def annotation_seqs(annotationid):
     webPage += draw_download_fasta_button(annotationid)
 
     # get the sequence information for the annotation
-    res = requests.get(dbbact_server_address + '/annotations/get_full_sequences', json={'annotationid': annotationid})
+    res = rest_client.get('/annotations/get_full_sequences', json={'annotationid': annotationid})
     if res.status_code != 200:
         msg = 'Error encountered when getting sequences for annotation ID %d: %s' % (annotationid, res.content)
         debug(6, msg)
@@ -1710,7 +1769,7 @@ def forgot_password_submit():
 
     json_user = {'user': usermail}
     debug(3, 'posting to dbbact-server forgot_password')
-    httpRes = requests.post(dbbact_server_address + '/users/forgot_password', json=json_user)
+    httpRes = rest_client.post('/users/forgot_password', json=json_user)
     debug(3, 'got result')
     if httpRes.status_code == 200:
         webpage = render_header(title='Password Recovery')
@@ -1757,7 +1816,7 @@ def recover_user_password():
     json_user['recoverycode'] = recoverycode
     json_user['newpassword'] = newpassword
 
-    httpRes = requests.post(dbbact_server_address + '/users/recover_password', json=json_user)
+    httpRes = rest_client.post('/users/recover_password', json=json_user)
     if httpRes.status_code == 200:
         debug(3, 'recover_password for user %s succeeded' % usermail)
         webpage = render_template('update_password_success.html')
@@ -1784,7 +1843,7 @@ def user_info(username):
 
     debug(1, 'get user info for user %s' % username)
     # get the experiment details
-    httpRes = requests.post(dbbact_server_address + '/users/get_user_public_information', json=rdata)
+    httpRes = rest_client.post('/users/get_user_public_information', json=rdata)
     if httpRes.status_code == 200:
         userInfo = httpRes.json()
         username = userInfo.get('name')
@@ -1801,7 +1860,7 @@ def user_info(username):
 
         # get user annotation
         forUserId = {'foruserid': userid}
-        httpRes = requests.get(dbbact_server_address + '/users/get_user_annotations', json=forUserId)
+        httpRes = rest_client.get('/users/get_user_annotations', json=forUserId)
         if httpRes.status_code == 200:
             annotations = httpRes.json().get('userannotations')
             total_annotations = len(annotations)
@@ -1872,7 +1931,7 @@ def draw_annotation_details(annotations, seqannotations=None, term_info=None, sh
     if seqannotations is None:
         debug(2, 'no seqannotations provided, querying')
         if sequences is not None:
-            res = requests.get(get_dbbact_server_address() + '/sequences/get_fast_annotations', json={'sequences': sequences})
+            res = rest_client.get('/sequences/get_fast_annotations', json={'sequences': sequences})
             if res.status_code != 200:
                 msg = 'error getting annotations for sequences : %s' % Markup.escape(res.content)
                 debug(6, msg)
@@ -2050,7 +2109,7 @@ def annotation_seq_download(annotationid):
     '''return a download of the sequences of the annotation as fasta
     '''
     # get the experiment annotations
-    res = requests.get(get_dbbact_server_address() + '/annotations/get_full_sequences', json={'annotationid': annotationid})
+    res = rest_client.get('/annotations/get_full_sequences', json={'annotationid': annotationid})
     annotation = res.json()
     seqs = annotation.get('sequences')
     if seqs is None:
@@ -2072,8 +2131,8 @@ def download_fscores_sequences_form():
     sequences = sequences.split(',')
     debug(2,'got %d sequences for download_fscores_sequences_form' % len(sequences))
 
-    res = requests.get(get_dbbact_server_address() + '/sequences/get_fast_annotations',
-                       json={'sequences': sequences})
+    res = rest_client.get('/sequences/get_fast_annotations',
+                          json={'sequences': sequences})
     if res.status_code != 200:
         msg = 'error getting annotations for sequences : %s' % Markup.escape(res.content)
         debug(6, msg)
@@ -2142,6 +2201,7 @@ def _get_color(word, font_size, position, orientation, font_path, random_state,
     return '#%s%s%s' % (red, green, blue)
 
 
+@metrics.timed('draw_cloud')
 def draw_cloud(fscores, recall={}, precision={}, term_count={}, local_save_name=None):
     '''
     Draw a wordcloud for a list of terms
@@ -2228,12 +2288,9 @@ def get_term_info_for_annotations(annotations):
     The statistics about each term
     '''
     terms = get_annotations_terms(annotations)
-    res = requests.get(get_dbbact_server_address() + '/ontology/get_term_stats', json={'terms': terms})
-    if res.status_code != 200:
-        debug(6, 'error encountered in get_term_stats: %s' % res.reason)
+    term_info = term_stats_cache.get_term_stats(terms)
+    if term_info is None:
         return []
-    ans = res.json()
-    term_info = ans.get('term_info')
     return term_info
 
 
@@ -2271,26 +2328,8 @@ def add_data():
     URL: /about
     Method: POST
     """
-
-    # res = requests.get(get_dbbact_server_address() + '/ontology/get_all_descriptions')
-    res = requests.get(get_dbbact_server_address() + '/ontology/get_all_terms')
-    if res.status_code != 200:
-        debug(6, 'failed to get list of ontologies')
-        list_of_ont = {}
-    else:
-        import json
-        list_of_ont = json.dumps(res.json())
-
-    res = requests.get(get_dbbact_server_address() + '/ontology/get_all_synonyms')
-    if res.status_code != 200:
-        debug(6, 'failed to get list of synonyms')
-        list_of_synonym = {}
-    else:
-        import json
-        list_of_synonym = json.dumps(res.json())
-
     webpage = render_header()
-    webpage += render_template('add_data.html', syn_list=list_of_synonym, ont_list=list_of_ont, display='{{display}}', group='{{group}}', query='{{query}}')
+    webpage += render_template('add_data.html', display='{{display}}', group='{{group}}', query='{{query}}')
     return webpage
 
 
@@ -2304,26 +2343,8 @@ def add_data2():
     URL: /about
     Method: POST
     """
-    
-    res = requests.get(get_dbbact_server_address() + '/ontology/get_all_terms')
-    # res = requests.get(get_dbbact_server_address() + '/ontology/get_all_descriptions')
-    if res.status_code != 200:
-           debug(6, 'failed to get list of ontologies')
-           parents = []
-    else:
-           import json
-           list_of_ont = json.dumps(res.json())
-    
-    res = requests.get(get_dbbact_server_address() + '/ontology/get_all_synonyms')
-    if res.status_code != 200:
-           debug(6, 'failed to get list of synonyms')
-           parents = []
-    else:
-           import json
-           list_of_synonym = json.dumps(res.json())
-    
     webpage = render_header()
-    webpage += render_template('add_data2.html',syn_list=list_of_synonym,ont_list=list_of_ont,display='{{display}}',group='{{group}}',query='{{query}}')
+    webpage += render_template('add_data.html', display='{{display}}', group='{{group}}', query='{{query}}')
     return webpage
 
 
@@ -2337,27 +2358,41 @@ def auto_complete_test():
     URL: /about
     Method: POST
     """
-    
-    res = requests.get(get_dbbact_server_address() + '/ontology/get_all_descriptions')
-    if res.status_code != 200:
-           debug(6, 'failed to get list of ontologies')
-           parents = []
-    else:
-           import json
-           list_of_ont = json.dumps(res.json())
-    
-    res = requests.get(get_dbbact_server_address() + '/ontology/get_all_synonyms')
-    if res.status_code != 200:
-           debug(6, 'failed to get list of synonyms')
-           parents = []
-    else:
-           import json
-           list_of_synonym = json.dumps(res.json())
-
-    webpage = render_template('demo-autocomplete.html',syn_list=list_of_synonym,ont_list=list_of_ont,display='{{display}}',group='{{group}}',query='{{query}}')
+    webpage = render_template('demo-autocomplete.html', display='{{display}}', group='{{group}}', query='{{query}}')
     return webpage
 
 
+@Site_Main_Flask_Obj.route('/autocomplete', methods=['POST', 'GET'])
+def autocomplete():
+    """
+    Title: Get the ontology terms and synonyms matching a prefix (for the typeahead)
+    URL: /autocomplete
+    Method: GET
+    Parameters:
+        q: str
+            the prefix to search for (matched to the start of the term or of any word in the term)
+        k: int, optional
+            the maximal number of results in each group (default 10, at most 100)
+        group: str, optional
+            search only this group ('ontology' or 'synonym'). default is all groups
+    Returns:
+        json of {group (str): list of matching terms (str)}
+    """
+    query = request.values.get('q', '')
+    try:
+        k = min(int(request.values.get('k', 10)), 100)
+    except ValueError:
+        return 'k must be an integer', 400
+    groups = None
+    group = request.values.get('group')
+    if group is not None:
+        if group not in term_index.GROUPS:
+            return 'group %s not supported' % group, 400
+        groups = [group]
+    res = term_index.autocomplete(query, k=k, groups=groups)
+    return jsonify(res)
+
+
 def error_message(title, message):
     '''
     '''
@@ -2545,7 +2580,7 @@ def draw_term_info(term):
 
     debug(1, 'get term info for term %s' % term)
     # get the experiment details
-    httpRes = requests.get(dbbact_server_address + '/ontology/get_family_graph', json=rdata)
+    httpRes = rest_client.get('/ontology/get_family_graph', json=rdata)
     if httpRes.status_code == 200:
         termInfo = httpRes.json()['family']
         if len(termInfo['nodes']) == 0:
@@ -2556,11 +2591,8 @@ def draw_term_info(term):
             if 'name' in cnode:
                 all_terms.append(cnode['name'])
         # get the info about the number of annotations/experiments/sequences per term
-        rdata = {'terms': all_terms}
-        httpRes = requests.get(dbbact_server_address + '/ontology/get_term_stats', json=rdata)
-        if httpRes.status_code == 200:
-            term_counts = httpRes.json()['term_info']
-        else:
+        term_counts = term_stats_cache.get_term_stats(all_terms)
+        if term_counts is None:
             term_counts = {}
 
         # create the node and edge data for the cytoscpae graph
@@ -2648,7 +2680,7 @@ def get_file(filename):
     return send_from_directory('data_dump', filename, as_attachment=True)
 
 
-def trim_primers_from_sequence(cseq, primers={'AGAGTTTGATC[AC]TGG[CT]TCAG': 'v1', 'CCTACGGG[ACGT][CGT]GC[AT][CG]CAG': 'v3', 'GTGCCAGC[AC]GCCGCGGTAA': 'v4'}, max_start=25, min_primer_len=10):
+def trim_primers_from_sequence(cseq, primers=DEFAULT_PRIMERS, max_start=25, min_primer_len=10):
     '''Try to trim primers from a given sequence and return the trimmed sequence if successful
 
     assumes the sequence is not in dbBact.
@@ -2660,7 +2692,7 @@ def trim_primers_from_sequence(cseq, primers={'AGAGTTTGATC[AC]TGG[CT]TCAG': 'v1'
     cseq: str
         sequence to trim ('ACGT')
     primers: dict of {primer(str): region_name(str)}, optional
-        the primers to test for
+        the primers to test for (see primers.PrimerMatcher)
     max_start: int, optional
         maximal start position for the primer (i.e. do not return if primer starts after position max_start)
     min_primer_len: int, optional
@@ -2674,46 +2706,20 @@ def trim_primers_from_sequence(cseq, primers={'AGAGTTTGATC[AC]TGG[CT]TCAG': 'v1'
     msg: str
         the information how the trimmed sequence was obtained
     '''
-    # trim the primers if needed
-    if min_primer_len is not None:
-        new_primers = {}
-        for k, v in primers.items():
-            pos = len(k)
-            numchars = 0
-            newp = ''
-            while True:
-                if numchars >= min_primer_len:
-                    break
-                pos = pos - 1
-                if pos < 0:
-                    break
-                if k[pos] != ']':
-                    newp = k[pos] + newp
-                    numchars += 1
-                    continue
-                while k[pos] != '[':
-                    newp = k[pos] + newp
-                    pos = pos - 1
-                newp = k[pos] + newp
-                numchars += 1
-            new_primers[newp] = v
-        primers = new_primers
-
     cseq = cseq.upper()
 
     # test for primers in the sequence
-    for cprimer in primers.keys():
-        ccseq = cseq[:max_start + len(cprimer)]
-        match = re.search(cprimer, ccseq)
-        if match is not None:
-            trimmed = cseq[match.end():]
-            return trimmed, 'found primer %s (region %s). trimmed first %d nucleotides.' % (cprimer, primers[cprimer], match.end())
+    match = get_primer_matcher(primers, max_start=max_start, min_primer_len=min_primer_len).match(cseq)
+    if match is not None:
+        region, cprimer, trim_pos = match
+        return cseq[trim_pos:], 'found primer %s (region %s). trimmed first %d nucleotides.' % (cprimer, region, trim_pos)
 
     # didn't find primer, so let's check if it seems to start after a few nucleotides with a known region sequence
-    for ctrim in range(10):
-        trimmed = cseq[ctrim + 1:]
-        if test_if_sequence_exists(trimmed):
-            return trimmed, 'Left-trimmed first %d nucleotides' % (ctrim + 1)
+    # (all the left-trimmed sequences are tested together, and the one with the fewest nucleotides removed is used)
+    trims = [cseq[ctrim + 1:] for ctrim in range(10)]
+    for ctrim, exists in enumerate(test_if_sequences_exist(trims)):
+        if exists:
+            return trims[ctrim], 'Left-trimmed first %d nucleotides' % (ctrim + 1)
 
     return None, 'no region identified'
 
@@ -2730,8 +2736,12 @@ def test_if_sequence_exists(seq, use_sequence_translator=True):
     --------
     True if exists, False if doesn't exist
     '''
+    # exact matches are found in the local sequence index (if available) without calling the rest-api
+    seq_index = get_sequence_index()
+    if seq_index is not None and seq_index.lookup_sequence(seq) is not None:
+        return True
     rdata = {'sequence': seq, 'use_sequence_translator': use_sequence_translator}
-    httpResTax = requests.get(dbbact_server_address + '/sequences/getid', json=rdata)
+    httpResTax = rest_client.get('/sequences/getid', json=rdata)
     if httpResTax.status_code == requests.codes.ok:
         match_ids = httpResTax.json().get('seqId')
         if match_ids is None:
@@ -2741,6 +2751,55 @@ def test_if_sequence_exists(seq, use_sequence_translator=True):
     return False
 
 
+def test_if_sequences_exist(seqs, use_sequence_translator=True):
+    '''test which sequences from a list exist in dbBact (sequencesTable)
+
+    Sequences in the local sequence index (if available) exist. The others are tested in one /sequences/getid_list call.
+    If it fails (i.e. an older rest-api server), they are tested using concurrent /sequences/getid calls.
+
+    Parameters:
+    -----------
+    seqs: list of str
+        the sequences to search for ('ACGT')
+
+    Returns:
+    --------
+    list of bool
+        True for each sequence that exists, False if doesn't exist
+    '''
+    if len(seqs) == 0:
+        return []
+    seq_index = get_sequence_index()
+    if seq_index is not None:
+        found = [seq_index.lookup_sequence(cseq) is not None for cseq in seqs]
+        if all(found):
+            return found
+        missing = [cseq for cseq, cfound in zip(seqs, found) if not cfound]
+        missing_exists = iter(test_if_sequences_exist_api(missing, use_sequence_translator=use_sequence_translator))
+        return [cfound or next(missing_exists) for cfound in found]
+    return test_if_sequences_exist_api(seqs, use_sequence_translator=use_sequence_translator)
+
+
+def test_if_sequences_exist_api(seqs, use_sequence_translator=True):
+    '''test which sequences from a list exist in dbBact using the rest-api (see test_if_sequences_exist())
+    '''
+    rdata = {'sequences': seqs, 'use_sequence_translator': use_sequence_translator}
+    httpRes = rest_client.get('/sequences/getid_list', json=rdata)
+    if httpRes.status_code == requests.codes.ok:
+        seq_ids = httpRes.json().get('seqIds')
+        if seq_ids is not None and len(seq_ids) == len(seqs):
+            return [cids is not None and len(cids) > 0 for cids in seq_ids]
+    debug(3, 'getid_list failed for %d sequences. testing them one by one' % len(seqs))
+    calls = [('GET', '/sequences/getid', {'json': {'sequence': cseq, 'use_sequence_translator': use_sequence_translator}}) for cseq in seqs]
+    exists = []
+    for httpRes in rest_client.fetch_all(calls):
+        match_ids = None
+        if httpRes.status_code == requests.codes.ok:
+            match_ids = httpRes.json().get('seqId')
+        exists.append(match_ids is not None and len(match_ids) > 0)
+    return exists
+
+
 def get_close_sequences(sequence, max_mismatches = 2):
     '''Get sequences that are close to the given sequence
     
@@ -2757,7 +2816,7 @@ def get_close_sequences(sequence, max_mismatches = 2):
     '''
     debug(2, 'get_close_sequences for sequence %s' % sequence)
     rdata = {'sequence': sequence, 'max_mismatches': max_mismatches}
-    httpResTax = requests.get(dbbact_server_address + '/sequences/get_close_sequences', json=rdata)
+    httpResTax = rest_client.get('/sequences/get_close_sequences', json=rdata)
     if httpResTax.status_code == requests.codes.ok:
         res = httpResTax.json()
         debug(2, 'Found %d close sequences' % len(res['similar_seqs']))
@@ -2786,12 +2845,12 @@ def get_term_seq_scores(term, annotations=None, num_to_show=10):
     '''
     # get all the child terms for the term of interest (so we can test each annotation positive/negative also for them)
     term = term.lower()
-    res = requests.get(get_dbbact_server_address() + '/ontology/get_term_children', json={'term': term, 'only_annotated': 'true'})
+    res = rest_client.get('/ontology/get_term_children', json={'term': term, 'only_annotated': 'true'})
     children = set(res.json()['terms'].values())
     debug(2, 'found %d children terms (including main term) with annotations for term %s' % (len(children), term))
 
     if annotations is None:
-        res = requests.get(get_dbbact_server_address() + '/ontology/get_annotations', params={'term': term, 'get_children': 'true'})
+        res = rest_client.get('/ontology/get_annotations', params={'term': term, 'get_children': 'true'})
         if res.status_code != 200:
             msg = 'error getting annotations for ontology term %s: %s' % (Markup.escape(term), res.content)
             debug(6, msg)
@@ -2805,7 +2864,7 @@ def get_term_seq_scores(term, annotations=None, num_to_show=10):
     annotation_ids = [x['annotationid'] for x in annotations]
 
     # get the sequences for each annotation
-    res = requests.get(get_dbbact_server_address() + '/annotations/get_list_sequences', json={'annotation_ids': annotation_ids})
+    res = rest_client.get('/annotations/get_list_sequences', json={'annotation_ids': annotation_ids})
     if res.status_code != 200:
         msg = 'error getting annotation sequences for ontology term %s: %s' % (Markup.escape(term), res.content)
         debug(6, msg)
@@ -2866,7 +2925,7 @@ def get_term_seq_scores(term, annotations=None, num_to_show=10):
 
     # get the total number of annotations per sequence
     seqlist = list(seqs)
-    res = requests.get(get_dbbact_server_address() + '/sequences/get_info', json={'seqids': seqlist})
+    res = rest_client.get('/sequences/get_info', json={'seqids': seqlist})
     if res.status_code != 200:
         msg = 'failed getting number of annotations per sequence'
         debug(6, msg)
@@ -2877,12 +2936,11 @@ def get_term_seq_scores(term, annotations=None, num_to_show=10):
     for idx, cdat in enumerate(seq_info):
         tot_seq_annotations[seqlist[idx]] = cdat['total_annotations']
 
-    res = requests.get(get_dbbact_server_address() + '/ontology/get_term_stats', json={'terms': [term, '-' + term]})
-    if res.status_code != 200:
+    res = term_stats_cache.get_term_stats([term, '-' + term])
+    if res is None:
         msg = 'failed getting term %s stats' % term
         debug(6, msg)
         return msg
-    res = res.json()['term_info']
     if term not in res:
         msg = 'get_term_stats failed for term %s' % term
         debug(6, msg)
@@ -3494,8 +3552,8 @@ def get_sequences_stats():
         return 'Error: no sequences field provided in json'
     seqs = alldat.get('sequences')
     debug(2, 'getting annotations for %d sequences' % len(seqs))
-    res = requests.get(get_dbbact_server_address() + '/sequences/get_fast_annotations',
-                       json={'sequences': seqs})
+    res = rest_client.get('/sequences/get_fast_annotations',
+                          json={'sequences': seqs})
     if res.status_code != 200:
         msg = 'error getting annotations for sequences : %s' % Markup.escape(res.content)
         debug(6, msg)
@@ -3515,7 +3573,7 @@ def get_sequences_stats():
     dbc = dbbact_calour.dbbact.DBBact(dburl=get_dbbact_server_address(), test_version=False)
     fscores, recall, precision, term_count, reduced_f = dbc.get_enrichment_score(annotations, seqannotations, term_info=term_info)
 
-    res = requests.get(get_dbbact_server_address() + '/experiments/get_experiments_list')
+    res = rest_client.get('/experiments/get_experiments_list')
     if res.status_code != 200:
         msg = 'error getting experiments list'
         debug(6, msg)
@@ -3572,8 +3630,8 @@ def sequences_fscores():
     normalize = alldat.get('normalize', True)
 
     debug(2, 'getting annotations for %d sequences' % len(seqs))
-    res = requests.get(get_dbbact_server_address() + '/sequences/get_fast_annotations',
-                       json={'sequences': seqs})
+    res = rest_client.get('/sequences/get_fast_annotations',
+                          json={'sequences': seqs})
     if res.status_code != 200:
         msg = 'error getting annotations for sequences : %s' % Markup.escape(res.content)
         debug(6, msg)
@@ -0,0 +1,114 @@
+import json
+import zlib
+import sqlite3
+import hashlib
+import threading
+import urllib.parse
+from http import HTTPStatus
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+from .utils import debug
+
+
+def get_request_key(method, url, body):
+    '''Get the cassette key of a rest-api request
+
+    The key is the method, endpoint path, sorted query parameters and the canonical json body
+    (sorted keys, no whitespace), so equivalent requests get the same key
+
+    Parameters
+    ----------
+    method: str
+    url: str
+        the full request url
+    body: bytes or str or None
+        the request body
+
+    Returns
+    -------
+    (str, str)
+        the key (sha256 hex digest) and the endpoint path
+    '''
+    parsed = urllib.parse.urlparse(url)
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)))
+    if isinstance(body, bytes):
+        body = body.decode('utf8', errors='replace')
+    if body:
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True, separators=(',', ':'))
+        except ValueError:
+            pass
+    else:
+        body = ''
+    key = hashlib.sha256('\n'.join([method.upper(), parsed.path, query, body]).encode()).hexdigest()
+    return key, parsed.path
+
+
+class CassetteAdapter(BaseAdapter):
+    '''A requests transport adapter recording rest-api responses to an sqlite cassette file, or replaying them
+
+    In 'record' mode, requests are sent to the server (using a regular HTTPAdapter) and the responses are stored.
+    In 'replay' mode, responses are only served from the cassette (no network). Requests missing from the cassette
+    get a 404 response.
+    The cassette can be shared by several worker processes.
+    '''
+    def __init__(self, cassette_file, mode='replay', pool_size=10):
+        super().__init__()
+        if mode not in ('record', 'replay'):
+            raise ValueError('cassette mode %s not supported (should be record/replay)' % mode)
+        self.cassette_file = cassette_file
+        self.mode = mode
+        self._local = threading.local()
+        self._http = None
+        if mode == 'record':
+            self._http = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        con = self._connect()
+        con.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, endpoint TEXT, status INTEGER, '
+                    'content_type TEXT, content BLOB)')
+        con.commit()
+        debug(3, 'using rest-api cassette %s in %s mode', cassette_file, mode)
+
+    def _connect(self):
+        '''Get the sqlite connection of the current thread
+        '''
+        con = getattr(self._local, 'con', None)
+        if con is None:
+            con = sqlite3.connect(self.cassette_file, timeout=30)
+            self._local.con = con
+        return con
+
+    def send(self, request, **kwargs):
+        key, endpoint = get_request_key(request.method, request.url, request.body)
+        con = self._connect()
+        if self.mode == 'record':
+            res = self._http.send(request, **kwargs)
+            con.execute('INSERT OR REPLACE INTO responses (key, endpoint, status, content_type, content) VALUES (?, ?, ?, ?, ?)',
+                        (key, endpoint, res.status_code, res.headers.get('Content-Type', ''), zlib.compress(res.content)))
+            con.commit()
+            return res
+
+        row = con.execute('SELECT status, content_type, content FROM responses WHERE key=?', (key,)).fetchone()
+        res = requests.Response()
+        res.url = request.url
+        res.request = request
+        if row is None:
+            debug(5, 'request %s %s not found in cassette', request.method, endpoint)
+            res.status_code = 404
+            res.reason = 'Not in cassette'
+            res._content = ('request %s %s not found in cassette' % (request.method, endpoint)).encode()
+            return res
+        res.status_code = row[0]
+        try:
+            res.reason = HTTPStatus(row[0]).phrase
+        except ValueError:
+            res.reason = ''
+        if row[1]:
+            res.headers['Content-Type'] = row[1]
+        res._content = zlib.decompress(row[2])
+        return res
+
+    def close(self):
+        if self._http is not None:
+            self._http.close()
@@ -1,8 +1,11 @@
-import requests
+import os
 
 import numpy as np
+import scipy.sparse
 from .mini_dsfdr import dsfdr
-from .utils import debug, get_dbbact_server_address
+from .utils import debug
+from . import rest_client
+from . import metrics
 from collections import defaultdict
 
 
@@ -110,7 +113,7 @@ def get_seq_annotations_fast(sequences):
     debug(2, 'get_seq_annotations_fast for %d sequences' % len(sequences))
     rdata = {}
     rdata['sequences'] = sequences
-    res = requests.get(get_dbbact_server_address() + '/sequences/get_fast_annotations', json=rdata)
+    res = rest_client.get('/sequences/get_fast_annotations', json=rdata)
     if res.status_code != 200:
         debug(5, 'error getting fast annotations for sequence list')
         return None, None, None
@@ -152,7 +155,7 @@ def get_seq_annotations_fast(sequences):
     return sequence_terms, sequence_annotations, annotations
 
 
-def _get_term_features(features, feature_terms):
+def _get_term_features(features, feature_terms, sparse=True):
     '''Get numpy array of score of each term for each feature
 
     Parameters
@@ -163,10 +166,12 @@ def _get_term_features(features, feature_terms):
         The terms associated with each feature in exp
         feature (key) : str the feature (out of exp) to which the terms relate
         feature_terms (value) : list of tuples of (str or int the terms associated with this feature, count)
+    sparse : bool, optional
+        True (default) to return a scipy.sparse CSR matrix, False to return a dense numpy array
 
     Returns
     -------
-    numpy array of T (terms) * F (features)
+    scipy.sparse CSR matrix or numpy array of T (terms) * F (features)
         total counts of each term (row) in each feature (column)
     list of str
         list of the terms corresponding to the numpy array rows
@@ -180,25 +185,25 @@ def _get_term_features(features, feature_terms):
                 terms[cterm] = cpos
                 cpos += 1
 
-    tot_features_inflated = 0
-    feature_pos = {}
-    for cfeature in features:
-        ctermlist = feature_terms[cfeature]
-        feature_pos[cfeature] = tot_features_inflated
-        tot_features_inflated += len(ctermlist)
-
-    # populate the matrix
-    res = np.zeros([len(terms), len(features)])
+    # populate the matrix (duplicate entries are summed when converting to CSR)
+    rows = []
+    cols = []
+    vals = []
     for idx, cfeature in enumerate(features):
         for cterm, ctermcount in feature_terms[cfeature]:
-            res[terms[cterm], idx] += ctermcount
+            rows.append(terms[cterm])
+            cols.append(idx)
+            vals.append(ctermcount)
+    res = scipy.sparse.coo_matrix((np.array(vals, dtype=float), (rows, cols)), shape=(len(terms), len(features))).tocsr()
+    if not sparse:
+        res = res.toarray()
 
     term_list = sorted(terms, key=terms.get)
     debug(2, 'created terms X features matrix with %d terms (rows), %d features (columns)' % (res.shape[0], res.shape[1]))
     return res, term_list
 
 
-def _get_term_features_inflated(features, feature_terms):
+def _get_term_features_inflated(features, feature_terms, sparse=True):
     '''Get numpy array of score of each term for each feature. This is the inflated version (used for card mean) to overcome the different number of annotations per feature. But slower and not memory efficient
 
     Parameters
@@ -209,10 +214,12 @@ def _get_term_features_inflated(features, feature_terms):
         The terms associated with each feature in exp
         feature (key) : str the feature (out of exp) to which the terms relate
         feature_terms (value) : list of tuples of (str or int the terms associated with this feature, count)
+    sparse : bool, optional
+        True (default) to return a scipy.sparse CSR matrix, False to return a dense numpy array
 
     Returns
     -------
-    numpy array of T (terms) * F (inflated features)
+    scipy.sparse CSR matrix or numpy array of T (terms) * F (inflated features)
         total counts of each term (row) in each feature (column)
     list of str
         list of the terms corresponding to the numpy array rows
@@ -233,11 +240,18 @@ def _get_term_features_inflated(features, feature_terms):
         feature_pos[cfeature] = tot_features_inflated
         tot_features_inflated += len(ctermlist)
 
-    res = np.zeros([len(terms), tot_features_inflated])
-
+    rows = []
+    cols = []
+    vals = []
     for cfeature in features:
         for cterm, ctermcount in feature_terms[cfeature]:
-            res[terms[cterm], feature_pos[cfeature]] += ctermcount
+            rows.append(terms[cterm])
+            cols.append(feature_pos[cfeature])
+            vals.append(ctermcount)
+    res = scipy.sparse.coo_matrix((np.array(vals, dtype=float), (rows, cols)), shape=(len(terms), tot_features_inflated)).tocsr()
+    if not sparse:
+        res = res.toarray()
+
     term_list = sorted(terms, key=terms.get)
     debug(2, 'created terms X features matrix with %d terms (rows), %d features (columns)' % (res.shape[0], res.shape[1]))
     return res, term_list
@@ -361,14 +375,14 @@ def enrichment(seqs1, seqs2, term_type="term"):
     odif : list of float
         the effect size for each term
     '''
-    # set the same seed (since we use a random permutation test)
-    np.random.seed(2018)
-
+    # the sequence order sets the permutations, so use sorted unique sequences to get the same results (for the same random_seed)
+    # regardless of the input order or the string hashing (which changes between processes), as assumed by the enrichment cache
+    seqs1 = sorted(set(seqs1))
     all_seqs = set(seqs1).union(set(seqs2))
-    seqs2 = list(all_seqs - set(seqs1))
+    seqs2 = sorted(all_seqs - set(seqs1))
     if len(seqs2) == 0:
         return 'No sequences remaining in background fasta after removing the sequences of interest', None, None, None
-    all_seqs = list(all_seqs)
+    all_seqs = sorted(all_seqs)
 
     # get the annotations for the sequences
     info = {}
@@ -383,26 +397,23 @@ def enrichment(seqs1, seqs2, term_type="term"):
     else:
         debug(8, 'strange term_type encountered: %s' % term_type)
 
-    # count the total number of terms
-    all_terms_set = set()
-    for cterms in feature_terms.values():
-        for (cterm, ccount) in cterms:
-            all_terms_set.add(cterm)
-    debug(2, 'found %d terms associated with all sequences (%d)' % (len(all_terms_set), len(all_seqs)))
-
-    debug(2, 'getting seqs1 feature array')
-    feature_array, term_list = _get_term_features(seqs1, feature_terms)
-    debug(2, 'getting seqs2 feature array')
-    bg_array, term_list = _get_term_features(seqs2, feature_terms)
-
-    debug(2, 'bgarray: %s, feature_array: %s' % (bg_array.shape, feature_array.shape))
-    all_feature_array = np.hstack([feature_array, bg_array])
+    # build the terms X features matrix once for all the sequences (seqs1 columns followed by seqs2 columns)
+    # using one shared term index, and mark the seqs1 columns in the labels
+    features = seqs1 + seqs2
+    all_feature_array, term_list = _get_term_features(features, feature_terms)
+    debug(2, 'found %d terms associated with all sequences (%d)' % (len(term_list), len(all_seqs)))
 
     labels = np.zeros(all_feature_array.shape[1])
-    labels[:feature_array.shape[1]] = 1
+    labels[:len(seqs1)] = 1
 
     debug(2, 'starting dsfdr for enrichment')
-    keep, odif, pvals = dsfdr(all_feature_array, labels, method='meandiff', transform_type=None, alpha=0.1, numperm=1000, fdr_method='dsfdr')
+    # we use the same seed (since we use a random permutation test)
+    # set DBBACT_ENRICHMENT_ADAPTIVE=1 to stop permuting the clearly non-significant terms early
+    num_workers = int(os.environ.get('DBBACT_ENRICHMENT_WORKERS', 1))
+    adaptive = os.environ.get('DBBACT_ENRICHMENT_ADAPTIVE', '0') == '1'
+    with metrics.timer('dsfdr'):
+        keep, odif, pvals = dsfdr(all_feature_array, labels, method='meandiff', transform_type=None, alpha=0.1, numperm=1000, fdr_method='dsfdr',
+                                  random_seed=2018, num_workers=num_workers, adaptive=adaptive)
     keep = np.where(keep)[0]
     if len(keep) == 0:
         debug(2, 'no enriched terms found')
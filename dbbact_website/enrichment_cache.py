@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .utils import debug, get_private_dir
+from . import enrichment
+from . import stats_cache
+
+# default number of enrichment results kept in memory (per worker process)
+DEFAULT_MEMORY_SIZE = 32
+
+# default number of enrichment results kept in the on-disk cache (shared by all worker processes)
+DEFAULT_DISK_SIZE = 256
+
+# the in-memory LRU cache {key: (err, terms, pvals, odif)}
+_memory_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _get_memory_size():
+    '''Get the in-memory cache size from the DBBACT_ENRICHMENT_CACHE_SIZE environment variable (or the default)
+
+    Returns
+    -------
+    int
+        0 disables the in-memory cache
+    '''
+    return int(os.environ.get('DBBACT_ENRICHMENT_CACHE_SIZE', DEFAULT_MEMORY_SIZE))
+
+
+def _get_disk_file():
+    '''Get the sqlite file of the on-disk cache (shared by all worker processes)
+
+    The directory is set by the DBBACT_ENRICHMENT_CACHE_DIR environment variable (default is a directory of the current user
+    in the system temp. dir, see utils.get_private_dir()). Setting it to an empty string disables the on-disk cache.
+
+    Returns
+    -------
+    str or None
+        the sqlite file name, or None if the on-disk cache is disabled
+    '''
+    if os.environ.get('DBBACT_ENRICHMENT_CACHE_DIR') == '':
+        return None
+    try:
+        cache_dir = get_private_dir('DBBACT_ENRICHMENT_CACHE_DIR', 'dbbact_enrichment_cache')
+    except OSError as err:
+        debug(5, 'enrichment on-disk cache disabled: %s' % err)
+        return None
+    return os.path.join(cache_dir, 'enrichment_cache.sqlite')
+
+
+def _connect(cache_file):
+    '''Open the on-disk cache (creating the table if needed)
+
+    Parameters
+    ----------
+    cache_file: str
+        the sqlite file name
+
+    Returns
+    -------
+    sqlite3.Connection
+    '''
+    con = sqlite3.connect(cache_file, timeout=30)
+    con.execute('CREATE TABLE IF NOT EXISTS enrichment (key TEXT PRIMARY KEY, result TEXT, last_used REAL)')
+    return con
+
+
+def _dump_result(res):
+    '''Convert an enrichment result to json (for the on-disk cache)
+
+    Parameters
+    ----------
+    res: tuple of (err, terms, pvals, odif)
+
+    Returns
+    -------
+    str
+    '''
+    err, terms, pvals, odif = res
+    return json.dumps([err, np.asarray(terms).tolist(), np.asarray(pvals).tolist(), np.asarray(odif).tolist()])
+
+
+def _load_result(result_json):
+    '''Convert a json enrichment result from the on-disk cache back to the enrichment.enrichment() return values
+
+    Parameters
+    ----------
+    result_json: str
+        from _dump_result()
+
+    Returns
+    -------
+    tuple of (err, terms, pvals, odif)
+    '''
+    err, terms, pvals, odif = json.loads(result_json)
+    return err, np.array(terms), np.array(pvals), np.array(odif)
+
+
+def get_cache_key(seqs1, seqs2, term_type, db_version):
+    '''Get the cache key for an enrichment query
+
+    The key does not depend on the order or duplicates of the sequences in each group
+
+    Parameters
+    ----------
+    seqs1, seqs2: list of str
+        the sequences in each group
+    term_type: str
+        the term type passed to enrichment.enrichment()
+    db_version: str
+        the database version (from stats_cache.get_db_version())
+
+    Returns
+    -------
+    str
+    '''
+    khash = hashlib.sha256()
+    for cseqs in (seqs1, seqs2):
+        for cseq in sorted(set(cseqs)):
+            khash.update(cseq.encode())
+            khash.update(b'\n')
+        khash.update(b'|')
+    khash.update(term_type.encode())
+    khash.update(b'|')
+    khash.update(db_version.encode())
+    return khash.hexdigest()
+
+
+def _get_cached(key):
+    '''Get a cached result from the in-memory cache, or from the on-disk cache
+
+    Parameters
+    ----------
+    key: str
+        from get_cache_key()
+
+    Returns
+    -------
+    tuple of (err, terms, pvals, odif) or None if not in the cache
+    '''
+    with _cache_lock:
+        if key in _memory_cache:
+            _memory_cache.move_to_end(key)
+            return _memory_cache[key]
+
+    cache_file = _get_disk_file()
+    if cache_file is None:
+        return None
+    try:
+        con = _connect(cache_file)
+        try:
+            with con:
+                row = con.execute('SELECT result FROM enrichment WHERE key=?', (key,)).fetchone()
+                if row is not None:
+                    con.execute('UPDATE enrichment SET last_used=? WHERE key=?', (time.time(), key))
+        finally:
+            con.close()
+    except sqlite3.Error as err:
+        debug(5, 'failed to read enrichment cache %s: %s' % (cache_file, err))
+        return None
+    if row is None:
+        return None
+    try:
+        res = _load_result(row[0])
+    except (TypeError, ValueError) as err:
+        debug(5, 'invalid enrichment cache entry %s: %s' % (key, err))
+        return None
+    _store_memory(key, res)
+    return res
+
+
+def _store_memory(key, res):
+    '''Store a result in the in-memory cache, removing the least recently used results if full
+
+    Parameters
+    ----------
+    key: str
+        from get_cache_key()
+    res: tuple of (err, terms, pvals, odif)
+    '''
+    max_size = _get_memory_size()
+    if max_size <= 0:
+        return
+    with _cache_lock:
+        _memory_cache[key] = res
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > max_size:
+            _memory_cache.popitem(last=False)
+
+
+def _store(key, res):
+    '''Store a result in the in-memory and on-disk caches
+
+    Parameters
+    ----------
+    key: str
+        from get_cache_key()
+    res: tuple of (err, terms, pvals, odif)
+    '''
+    _store_memory(key, res)
+
+    cache_file = _get_disk_file()
+    if cache_file is None:
+        return
+    max_size = int(os.environ.get('DBBACT_ENRICHMENT_CACHE_DISK_SIZE', DEFAULT_DISK_SIZE))
+    try:
+        con = _connect(cache_file)
+        try:
+            with con:
+                con.execute('INSERT OR REPLACE INTO enrichment (key, result, last_used) VALUES (?, ?, ?)',
+                            (key, _dump_result(res), time.time()))
+                con.execute('DELETE FROM enrichment WHERE key NOT IN (SELECT key FROM enrichment ORDER BY last_used DESC LIMIT ?)',
+                            (max_size,))
+        finally:
+            con.close()
+    except sqlite3.Error as err:
+        debug(5, 'failed to write enrichment cache %s: %s' % (cache_file, err))
+
+
+def get_enrichment(seqs1, seqs2, term_type='term'):
+    '''Get the enrichment results (see enrichment.enrichment()), using the cached results if available
+
+    Results are cached in memory (DBBACT_ENRICHMENT_CACHE_SIZE results per worker process) and in an sqlite file shared by
+    all worker processes (see _get_disk_file()).
+    The cache key includes the database version, so results are recalculated when the database changes.
+
+    Parameters
+    ----------
+    seqs1, seqs2: list of str
+        the sequences in each group
+    term_type: str, optional
+        the term type passed to enrichment.enrichment()
+
+    Returns
+    -------
+    same as enrichment.enrichment()
+    '''
+    db_version = stats_cache.get_db_version()
+    if db_version is None:
+        debug(5, 'no database version. enrichment results are not cached')
+        return enrichment.enrichment(seqs1, seqs2, term_type=term_type)
+
+    key = get_cache_key(seqs1, seqs2, term_type, db_version)
+    res = _get_cached(key)
+    if res is not None:
+        debug(2, 'using cached enrichment results for %s' % key)
+        return res
+
+    res = enrichment.enrichment(seqs1, seqs2, term_type=term_type)
+    if not res[0]:
+        _store(key, res)
+    return res
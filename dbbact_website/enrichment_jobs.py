@@ -0,0 +1,384 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+
+import numpy as np
+
+from .utils import debug, get_private_dir, ProcessLocal
+from . import enrichment
+from . import enrichment_cache
+
+# default maximal number of jobs waiting in the queue (new jobs are rejected when the queue is full)
+DEFAULT_MAX_QUEUED = 20
+
+# default maximal number of jobs running at the same time (in all worker processes)
+DEFAULT_CONCURRENCY = 2
+
+# number of seconds without a heartbeat after which a running job is considered dead (i.e. the worker process hangs)
+DEFAULT_HEARTBEAT_TIMEOUT = 300
+
+# number of seconds between heartbeats of the running jobs
+HEARTBEAT_INTERVAL = 10
+
+# number of seconds to keep finished jobs
+DEFAULT_KEEP_TIME = 24 * 3600
+
+# number of seconds between queue polls of an idle job thread
+POLL_INTERVAL = 1
+
+# the term types calculated for each job
+TERM_TYPES = ['term', 'annotation']
+
+# the version of the jobs table (the table is recreated if the database file is of an older version)
+SCHEMA_VERSION = 2
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def _get_int_env(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _get_db_file():
+    '''Get the sqlite file of the job queue (shared by all worker processes)
+
+    The directory is set by the DBBACT_JOBS_DIR environment variable (default is a directory accessible only by the
+    current user in the system temp. dir, see utils.get_private_dir())
+
+    Returns
+    -------
+    str
+    '''
+    return os.path.join(get_private_dir('DBBACT_JOBS_DIR', 'dbbact_jobs'), 'enrichment_jobs.sqlite')
+
+
+def _connect():
+    '''Open the job queue database (creating the table if needed)
+
+    The connection is in autocommit mode, so transactions are started explicitly using "BEGIN IMMEDIATE".
+    The job parameters and results are stored as json.
+    Running jobs have the owner (the id, host and pid of the worker process running them) and the time of the last heartbeat.
+
+    Returns
+    -------
+    sqlite3.Connection
+    '''
+    con = sqlite3.connect(_get_db_file(), timeout=30, isolation_level=None)
+    if con.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            if con.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                con.execute('DROP TABLE IF EXISTS jobs')
+                con.execute('CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT, progress TEXT, created REAL, updated REAL, '
+                            'params TEXT, result TEXT, owner TEXT, owner_host TEXT, owner_pid INTEGER, heartbeat REAL)')
+                con.execute('PRAGMA user_version=%d' % SCHEMA_VERSION)
+            con.execute('COMMIT')
+        except Exception:
+            con.execute('ROLLBACK')
+            raise
+    return con
+
+
+def submit(seqs1, seqs2, method='dsfdr'):
+    '''Add an enrichment job to the queue
+
+    Parameters
+    ----------
+    seqs1, seqs2: list of str
+        the sequences in each group
+    method: str, optional
+        'dsfdr' to use enrichment.enrichment() (with the enrichment result cache)
+        'calour' to use enrichment.calour_enrichment()
+
+    Returns
+    -------
+    str
+        the job id
+
+    Raises
+    ------
+    QueueFullError
+        if there are already DBBACT_JOBS_MAX_QUEUED jobs waiting
+    '''
+    max_queued = _get_int_env('DBBACT_JOBS_MAX_QUEUED', DEFAULT_MAX_QUEUED)
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    con = _connect()
+    try:
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            con.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated<?",
+                        (now - _get_int_env('DBBACT_JOBS_KEEP_TIME', DEFAULT_KEEP_TIME),))
+            num_queued = con.execute("SELECT COUNT(*) FROM jobs WHERE status='queued'").fetchone()[0]
+            if num_queued >= max_queued:
+                raise QueueFullError('Too many enrichment jobs waiting (%d). Please try again later' % num_queued)
+            con.execute('INSERT INTO jobs (id, status, progress, created, updated, params) VALUES (?, ?, ?, ?, ?, ?)',
+                        (job_id, 'queued', 'waiting in queue', now, now, json.dumps([seqs1, seqs2, method])))
+            con.execute('COMMIT')
+        except Exception:
+            con.execute('ROLLBACK')
+            raise
+    finally:
+        con.close()
+    debug(2, 'submitted enrichment job %s (%d, %d sequences)' % (job_id, len(seqs1), len(seqs2)))
+    start_workers()
+    return job_id
+
+
+def get_status(job_id):
+    '''Get the status of a job
+
+    Parameters
+    ----------
+    job_id: str
+        from submit()
+
+    Returns
+    -------
+    dict or None
+        None if the job does not exist. Otherwise:
+        'status': str - 'queued' / 'running' / 'done' / 'failed'
+        'progress': str - description of the current step (or the error for failed jobs)
+        'position': int - number of jobs waiting before this one (for queued jobs)
+        'elapsed': float - seconds since the job was submitted
+        'result': list of (term_type, terms, pvals, odif) for done jobs, otherwise None
+    '''
+    start_workers()
+    con = _connect()
+    try:
+        row = con.execute('SELECT status, progress, created, result FROM jobs WHERE id=?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        status, progress, created, result = row
+        position = 0
+        if status == 'queued':
+            position = con.execute("SELECT COUNT(*) FROM jobs WHERE status='queued' AND created<?", (created,)).fetchone()[0]
+    finally:
+        con.close()
+    if result is not None:
+        result = json.loads(result)
+    return {'status': status, 'progress': progress, 'position': position, 'elapsed': time.time() - created, 'result': result}
+
+
+def _is_process_alive(pid):
+    '''Check if a process (on the current host) is running
+
+    Parameters
+    ----------
+    pid: int
+
+    Returns
+    -------
+    bool
+    '''
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _fail_dead_jobs(con, now):
+    '''Mark the running jobs of worker processes that died (or stopped sending heartbeats) as failed
+
+    Parameters
+    ----------
+    con: sqlite3.Connection
+        the job queue database (inside a transaction)
+    now: float
+        the current time
+    '''
+    heartbeat_timeout = _get_int_env('DBBACT_JOBS_HEARTBEAT_TIMEOUT', DEFAULT_HEARTBEAT_TIMEOUT)
+    host = socket.gethostname()
+    rows = con.execute("SELECT id, owner_host, owner_pid, heartbeat FROM jobs WHERE status='running'").fetchall()
+    for job_id, owner_host, owner_pid, heartbeat in rows:
+        if heartbeat < now - heartbeat_timeout:
+            reason = 'no heartbeat for %d seconds' % (now - heartbeat)
+        elif owner_host == host and not _is_process_alive(owner_pid):
+            reason = 'process %d is not running' % owner_pid
+        else:
+            continue
+        debug(6, 'enrichment job %s failed: %s', job_id, reason)
+        con.execute("UPDATE jobs SET status='failed', progress=?, updated=? WHERE id=? AND status='running'",
+                    ('The server process running the enrichment job stopped. Please try again', now, job_id))
+
+
+def _claim_job(owner):
+    '''Get the oldest queued job and mark it as running, if less than DBBACT_JOBS_CONCURRENCY jobs are running
+
+    Parameters
+    ----------
+    owner: str
+        the owner id of the current process (from start_workers())
+
+    Returns
+    -------
+    (str, tuple) or (None, None)
+        the job id and the job parameters (seqs1, seqs2, method), or None if no job can be started now
+    '''
+    concurrency = _get_int_env('DBBACT_JOBS_CONCURRENCY', DEFAULT_CONCURRENCY)
+    now = time.time()
+    con = _connect()
+    try:
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            _fail_dead_jobs(con, now)
+            num_running = con.execute("SELECT COUNT(*) FROM jobs WHERE status='running'").fetchone()[0]
+            row = None
+            if num_running < concurrency:
+                row = con.execute("SELECT id, params FROM jobs WHERE status='queued' ORDER BY created LIMIT 1").fetchone()
+                if row is not None:
+                    con.execute("UPDATE jobs SET status='running', progress='starting', updated=?, owner=?, owner_host=?, owner_pid=?, "
+                                "heartbeat=? WHERE id=?", (now, owner, socket.gethostname(), os.getpid(), now, row[0]))
+            con.execute('COMMIT')
+        except Exception:
+            con.execute('ROLLBACK')
+            raise
+    finally:
+        con.close()
+    if row is None:
+        return None, None
+    return row[0], json.loads(row[1])
+
+
+def _update_job(job_id, status=None, progress=None, result=None):
+    '''Update the status/progress/result of a running job
+
+    Jobs that are not running anymore (i.e. failed by _fail_dead_jobs()) are not changed
+
+    Parameters
+    ----------
+    job_id: str
+    status: str or None, optional
+        the new status, or None to keep the current status
+    progress: str or None, optional
+        the new progress description, or None to keep the current one
+    result: list or None, optional
+        the job result (stored as json), or None to keep the current one
+    '''
+    now = time.time()
+    con = _connect()
+    try:
+        # store the result before the status, so a 'done' job always has a result
+        if result is not None:
+            con.execute("UPDATE jobs SET result=? WHERE id=? AND status='running'", (json.dumps(result), job_id))
+        if progress is not None:
+            con.execute("UPDATE jobs SET progress=?, updated=?, heartbeat=? WHERE id=? AND status='running'", (progress, now, now, job_id))
+        if status is not None:
+            con.execute("UPDATE jobs SET status=?, updated=? WHERE id=? AND status='running'", (status, now, job_id))
+    finally:
+        con.close()
+
+
+def _heartbeat_thread(owner):
+    '''Update the heartbeat of the jobs running in the current process every HEARTBEAT_INTERVAL seconds (in a daemon thread)
+
+    Parameters
+    ----------
+    owner: str
+        the owner id of the current process (from start_workers())
+    '''
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        try:
+            con = _connect()
+            try:
+                con.execute("UPDATE jobs SET heartbeat=? WHERE status='running' AND owner=?", (time.time(), owner))
+            finally:
+                con.close()
+        except Exception as err:
+            debug(7, 'failed to update enrichment job heartbeat: %s' % err)
+
+
+def _run_job(job_id, params):
+    '''Calculate the enrichment for all term types of a job and store the results
+
+    Parameters
+    ----------
+    job_id: str
+    params: (list of str, list of str, str)
+        the job parameters (seqs1, seqs2, method)
+    '''
+    seqs1, seqs2, method = params
+    debug(2, 'running enrichment job %s' % job_id)
+    result = []
+    try:
+        for term_type in TERM_TYPES:
+            _update_job(job_id, progress='calculating %s enrichment' % term_type)
+            if method == 'calour':
+                err, terms, pvals, odif = enrichment.calour_enrichment(seqs1, seqs2, term_type=term_type)
+            else:
+                err, terms, pvals, odif = enrichment_cache.get_enrichment(seqs1, seqs2, term_type=term_type)
+            if err:
+                _update_job(job_id, status='failed', progress=err)
+                return
+            result.append((term_type, list(terms), np.asarray(pvals).tolist(), np.asarray(odif).tolist()))
+    except Exception as err:
+        debug(7, 'enrichment job %s failed: %s' % (job_id, err))
+        _update_job(job_id, status='failed', progress='Enrichment calculation failed')
+        return
+    _update_job(job_id, status='done', progress='done', result=result)
+    debug(2, 'enrichment job %s done' % job_id)
+
+
+def _job_thread(owner):
+    '''Run queued jobs forever (in a daemon thread)
+
+    Parameters
+    ----------
+    owner: str
+        the owner id of the current process (from start_workers())
+    '''
+    while True:
+        try:
+            job_id, params = _claim_job(owner)
+        except Exception as err:
+            debug(7, 'failed to get job from queue: %s' % err)
+            job_id = None
+        if job_id is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+        _run_job(job_id, params)
+
+
+def _start_threads():
+    '''Start the job threads and the heartbeat thread in the current worker process
+
+    Returns
+    -------
+    str
+        the owner id of the jobs run by the current process
+    '''
+    pid = os.getpid()
+    # the owner id is unique even if the pid is reused by a new worker process
+    owner = '%s:%d:%s' % (socket.gethostname(), pid, uuid.uuid4().hex)
+    num_threads = _get_int_env('DBBACT_JOBS_CONCURRENCY', DEFAULT_CONCURRENCY)
+    for idx in range(num_threads):
+        cthread = threading.Thread(target=_job_thread, args=(owner,), name='dbbact-enrichment-job-%d' % idx, daemon=True)
+        cthread.start()
+    threading.Thread(target=_heartbeat_thread, args=(owner,), name='dbbact-enrichment-heartbeat', daemon=True).start()
+    debug(2, 'started %d enrichment job threads (pid %d)' % (num_threads, pid))
+    return owner
+
+
+# the job threads of the current process (gunicorn forks the workers after the module is imported)
+_threads = ProcessLocal(_start_threads)
+
+
+def start_workers():
+    '''Start the job threads in the current worker process (if not already started)
+
+    Each worker process runs DBBACT_JOBS_CONCURRENCY threads that take jobs from the shared queue.
+    The number of jobs running at the same time in all processes is limited to DBBACT_JOBS_CONCURRENCY.
+    Another thread updates the heartbeat of the running jobs, so jobs of a worker process that was killed (or hangs)
+    are failed by the other processes (see _fail_dead_jobs())
+    '''
+    _threads.get()
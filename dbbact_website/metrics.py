@@ -0,0 +1,388 @@
+import os
+import re
+import hmac
+import json
+import time
+import glob
+import uuid
+import fcntl
+import threading
+import functools
+from contextlib import contextmanager
+
+from .utils import debug, ProcessLocal
+
+# the histogram bucket upper bounds (seconds)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# minimal number of seconds between writing the process metrics file
+FLUSH_INTERVAL = 1
+
+# the help text for each metric
+METRIC_HELP = {
+    'dbbact_website_request_duration_seconds': 'website request latency by route',
+    'dbbact_api_request_duration_seconds': 'dbBact rest-api call latency by endpoint',
+    'dbbact_api_response_bytes_total': 'total size of the dbBact rest-api responses by endpoint',
+    'dbbact_api_request_errors_total': 'number of failed dbBact rest-api calls (no response) by endpoint',
+    'dbbact_website_function_duration_seconds': 'run time of selected functions (draw_cloud, dsfdr, get_enrichment_score)',
+    'dbbact_search_cache_total': 'number of short search queries found (hit) or not found (miss) in the search results cache',
+    'dbbact_term_stats_cache_terms_total': 'number of terms found (hit) or not found (miss) in the term stats cache',
+}
+
+# the metrics file of each worker process (metrics_<pid>_<id>.json)
+METRICS_FILE_RE = re.compile(r'^metrics_(\d+)_(\w+)\.json$')
+
+# the file with the summed metrics of the worker processes that exited
+TOTAL_FILE = 'metrics_total.json'
+
+
+def _get_metrics_dir():
+    '''Get the directory where each worker process writes its metrics (DBBACT_METRICS_DIR environment variable)
+
+    If not set, /metrics only shows the metrics of the process answering the request.
+    The metrics of worker processes that exited are added to TOTAL_FILE (so the counters never decrease)
+
+    Returns
+    -------
+    str or None
+    '''
+    return os.environ.get('DBBACT_METRICS_DIR')
+
+
+class _ProcessMetrics:
+    '''The metrics of one process
+    '''
+    def __init__(self):
+        self.pid = os.getpid()
+        # the id of the process metrics file (unique even if the pid is reused)
+        self.id = uuid.uuid4().hex
+        # {name: {labels (tuple of (str, str)): [bucket counts..., sum, count]}}
+        self.histograms = {}
+        # {name: {labels (tuple of (str, str)): value}}
+        self.counters = {}
+        self.lock = threading.Lock()
+        # the last time the process metrics file was written
+        self.last_flush = 0
+
+
+# the metrics of the current process (gunicorn forks the workers, so each worker starts with empty metrics)
+_metrics = ProcessLocal(_ProcessMetrics)
+
+
+def observe(name, value, **labels):
+    '''Add an observation to a histogram metric
+
+    Parameters
+    ----------
+    name: str
+        the metric name
+    value: float
+        the observed value (i.e. duration in seconds)
+    **labels:
+        the metric labels
+    '''
+    key = tuple(sorted(labels.items()))
+    cmetrics = _metrics.get()
+    with cmetrics.lock:
+        chist = cmetrics.histograms.setdefault(name, {})
+        if key not in chist:
+            chist[key] = [0] * (len(BUCKETS) + 2)
+        cvals = chist[key]
+        for idx, cbound in enumerate(BUCKETS):
+            if value <= cbound:
+                cvals[idx] += 1
+        cvals[-2] += value
+        cvals[-1] += 1
+    _maybe_flush()
+
+
+def inc(name, value=1, **labels):
+    '''Increase a counter metric
+
+    Parameters
+    ----------
+    name: str
+        the metric name
+    value: float, optional
+        the amount to add
+    **labels:
+        the metric labels
+    '''
+    key = tuple(sorted(labels.items()))
+    cmetrics = _metrics.get()
+    with cmetrics.lock:
+        ccounter = cmetrics.counters.setdefault(name, {})
+        ccounter[key] = ccounter.get(key, 0) + value
+    _maybe_flush()
+
+
+@contextmanager
+def timer(function):
+    '''Measure the run time of a code block into dbbact_website_function_duration_seconds
+
+    Parameters
+    ----------
+    function: str
+        the function label
+    '''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('dbbact_website_function_duration_seconds', time.perf_counter() - start, function=function)
+
+
+def timed(function):
+    '''Decorator measuring the run time of a function into dbbact_website_function_duration_seconds
+
+    Parameters
+    ----------
+    function: str
+        the function label
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(function):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _snapshot():
+    '''Get a json serializable copy of the metrics of the current process
+
+    Returns
+    -------
+    dict of {'histograms': {name: list of [labels, values]}, 'counters': {name: list of [labels, value]}}
+    '''
+    cmetrics = _metrics.get()
+    with cmetrics.lock:
+        return {'histograms': {cname: [[list(ckey), list(cvals)] for ckey, cvals in cvalues.items()] for cname, cvalues in cmetrics.histograms.items()},
+                'counters': {cname: [[list(ckey), cval] for ckey, cval in cvalues.items()] for cname, cvalues in cmetrics.counters.items()}}
+
+
+def flush():
+    '''Write the metrics of the current process to its file in the metrics directory
+    '''
+    metrics_dir = _get_metrics_dir()
+    if metrics_dir is None:
+        return
+    cmetrics = _metrics.get()
+    cmetrics.last_flush = time.time()
+    try:
+        os.makedirs(metrics_dir, exist_ok=True)
+        _write_snapshot(os.path.join(metrics_dir, 'metrics_%d_%s.json' % (cmetrics.pid, cmetrics.id)), _snapshot())
+    except OSError as err:
+        debug(5, 'failed to write metrics file: %s', err)
+
+
+def _maybe_flush():
+    '''Write the process metrics file if FLUSH_INTERVAL passed since the last write
+    '''
+    if time.time() - _metrics.get().last_flush >= FLUSH_INTERVAL:
+        flush()
+
+
+def _format_labels(labels, extra=()):
+    '''Format metric labels in prometheus text format (i.e. '{route="/main",le="0.5"}')
+    '''
+    labels = list(labels) + list(extra)
+    if not labels:
+        return ''
+    parts = []
+    for cname, cval in labels:
+        cval = str(cval).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append('%s="%s"' % (cname, cval))
+    return '{%s}' % ','.join(parts)
+
+
+def _is_process_alive(pid):
+    '''Check if a process is running
+
+    Parameters
+    ----------
+    pid: int
+
+    Returns
+    -------
+    bool
+    '''
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_snapshot(fname):
+    '''Read a metrics file
+
+    Returns
+    -------
+    dict or None
+        the metrics (see _snapshot()), or None if the file could not be read
+    '''
+    try:
+        with open(fname) as fl:
+            return json.load(fl)
+    except (OSError, ValueError) as err:
+        debug(5, 'failed to read metrics file %s: %s', fname, err)
+        return None
+
+
+def _write_snapshot(fname, snapshot):
+    with open(fname + '.tmp', 'w') as fl:
+        json.dump(snapshot, fl)
+    os.replace(fname + '.tmp', fname)
+
+
+def _read_all_snapshots(metrics_dir):
+    '''Read the metrics files of all the worker processes
+
+    The files of processes that exited (and older files of a reused pid) are added to TOTAL_FILE and deleted.
+    The metrics directory is locked while reading, so each file is counted once.
+
+    Parameters
+    ----------
+    metrics_dir: str
+
+    Returns
+    -------
+    list of dict
+        the metrics of each file (see _snapshot())
+    '''
+    with open(os.path.join(metrics_dir, 'metrics.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # the metrics files of each pid {pid: list of (modification time, file name)}
+        pid_files = {}
+        for cfile in glob.glob(os.path.join(metrics_dir, 'metrics_*.json')):
+            cmatch = METRICS_FILE_RE.match(os.path.basename(cfile))
+            if cmatch is not None:
+                pid_files.setdefault(int(cmatch.group(1)), []).append((os.path.getmtime(cfile), cfile))
+        live_files = []
+        dead_files = []
+        for cpid, cfiles in pid_files.items():
+            cfiles.sort()
+            if _is_process_alive(cpid):
+                # older files of the same pid belong to processes that exited (the pid was reused)
+                live_files.append(cfiles[-1][1])
+                cfiles = cfiles[:-1]
+            dead_files.extend(x[1] for x in cfiles)
+
+        total_file = os.path.join(metrics_dir, TOTAL_FILE)
+        totals = []
+        if os.path.exists(total_file):
+            totals = [_read_snapshot(total_file)]
+        if dead_files:
+            dead_snapshots = [_read_snapshot(x) for x in dead_files]
+            totals = [_to_snapshot(*_sum_snapshots([x for x in totals + dead_snapshots if x is not None]))]
+            _write_snapshot(total_file, totals[0])
+            for cfile in dead_files:
+                os.remove(cfile)
+            debug(2, 'added the metrics of %d exited processes to %s', len(dead_files), total_file)
+        snapshots = [_read_snapshot(x) for x in live_files] + totals
+    return [x for x in snapshots if x is not None]
+
+
+def _sum_snapshots(snapshots):
+    '''Sum the metrics of several processes
+
+    Parameters
+    ----------
+    snapshots: list of dict
+        the metrics of each process (see _snapshot())
+
+    Returns
+    -------
+    histograms: dict of {name: {labels (tuple of (str, str)): [bucket counts..., sum, count]}}
+    counters: dict of {name: {labels (tuple of (str, str)): value}}
+    '''
+    histograms = {}
+    counters = {}
+    for csnap in snapshots:
+        for cname, cvalues in csnap['histograms'].items():
+            chist = histograms.setdefault(cname, {})
+            for ckey, cvals in cvalues:
+                ckey = tuple(tuple(x) for x in ckey)
+                if ckey in chist:
+                    chist[ckey] = [x + y for x, y in zip(chist[ckey], cvals)]
+                else:
+                    chist[ckey] = cvals
+        for cname, cvalues in csnap['counters'].items():
+            ccounter = counters.setdefault(cname, {})
+            for ckey, cval in cvalues:
+                ckey = tuple(tuple(x) for x in ckey)
+                ccounter[ckey] = ccounter.get(ckey, 0) + cval
+    return histograms, counters
+
+
+def _to_snapshot(histograms, counters):
+    '''Convert summed metrics (from _sum_snapshots()) to the json serializable format of _snapshot()
+    '''
+    return {'histograms': {cname: [[[list(x) for x in ckey], cvals] for ckey, cvals in cvalues.items()] for cname, cvalues in histograms.items()},
+            'counters': {cname: [[[list(x) for x in ckey], cval] for ckey, cval in cvalues.items()] for cname, cvalues in counters.items()}}
+
+
+def get_metrics_text():
+    '''Get the metrics of all the worker processes in prometheus text format
+
+    Returns
+    -------
+    str
+    '''
+    metrics_dir = _get_metrics_dir()
+    if metrics_dir is None:
+        snapshots = [_snapshot()]
+    else:
+        flush()
+        try:
+            snapshots = _read_all_snapshots(metrics_dir)
+        except OSError as err:
+            debug(5, 'failed to read metrics files: %s', err)
+            snapshots = [_snapshot()]
+    histograms, counters = _sum_snapshots(snapshots)
+
+    lines = []
+    for cname in sorted(histograms):
+        lines.append('# HELP %s %s' % (cname, METRIC_HELP.get(cname, cname)))
+        lines.append('# TYPE %s histogram' % cname)
+        for ckey, cvals in sorted(histograms[cname].items()):
+            for cbound, ccount in zip(BUCKETS, cvals):
+                lines.append('%s_bucket%s %d' % (cname, _format_labels(ckey, [('le', cbound)]), ccount))
+            lines.append('%s_bucket%s %d' % (cname, _format_labels(ckey, [('le', '+Inf')]), cvals[-1]))
+            lines.append('%s_sum%s %f' % (cname, _format_labels(ckey), cvals[-2]))
+            lines.append('%s_count%s %d' % (cname, _format_labels(ckey), cvals[-1]))
+    for cname in sorted(counters):
+        lines.append('# HELP %s %s' % (cname, METRIC_HELP.get(cname, cname)))
+        lines.append('# TYPE %s counter' % cname)
+        for ckey, cval in sorted(counters[cname].items()):
+            lines.append('%s%s %s' % (cname, _format_labels(ckey), cval))
+    return '\n'.join(lines) + '\n'
+
+
+def is_request_allowed(request):
+    '''Check if a request can get the metrics
+
+    If the DBBACT_METRICS_TOKEN environment variable is set, the request must supply it in the "Authorization: Bearer <token>"
+    header. Otherwise, only local requests (not forwarded by a proxy) are allowed
+
+    Parameters
+    ----------
+    request: flask.Request
+
+    Returns
+    -------
+    bool
+    '''
+    token = os.environ.get('DBBACT_METRICS_TOKEN')
+    if token:
+        auth = request.headers.get('Authorization', '')
+        if not auth.startswith('Bearer '):
+            return False
+        return hmac.compare_digest(auth[len('Bearer '):].encode(), token.encode())
+    if 'X-Forwarded-For' in request.headers:
+        return False
+    return request.remote_addr in ('127.0.0.1', '::1')
@@ -1,15 +1,21 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
-from scipy import stats
+import scipy.sparse
 
 
 # new fdr method
 def dsfdr(data, labels, transform_type='rankdata', method='meandiff',
-          alpha=0.1, numperm=1000, fdr_method='dsfdr'):
+          alpha=0.1, numperm=1000, fdr_method='dsfdr', perm_block_size=100,
+          use_float32=False, random_seed=None, num_workers=1, adaptive=False,
+          adaptive_pval=0.25):
     '''
     calculate the Discrete FDR for the data
     input:
-    data : N x S numpy array
+    data : N x S numpy array or scipy.sparse matrix
         each column is a sample (S total), each row an OTU (N total)
+        sparse matrices are kept sparse only for method='meandiff' with transform_type=None
+        (otherwise converted to a dense array)
     labels : a 1d numpy array (length S)
         the labels of each sample (same order as data) with the group
         (0/1 if binary, 0-G-1 if G groups, or numeric values for correlation)
@@ -45,6 +51,28 @@ def dsfdr(data, labels, transform_type='rankdata', method='meandiff',
         'bhfdr' : Benjamini-Hochberg FDR method
         'byfdr' : Benjamini-Yekutielli FDR method
         'filterBH' : Benjamini-Hochberg FDR method with filtering
+    perm_block_size : int
+        number of permutations to calculate together (for 'meandiff').
+        the temporary memory used is samples X perm_block_size
+    use_float32 : bool
+        True to calculate the permuted statistics in float32 (half the memory,
+        less accurate). False (default) to use float64
+    random_seed : int or None
+        None (default) to permute the labels using the global numpy random state.
+        int to permute each block of permutations using its own np.random.Generator
+        (seeded from random_seed), so the result is identical for a given
+        random_seed and perm_block_size regardless of num_workers
+    num_workers : int
+        number of threads used to calculate the permutation blocks (only used if random_seed is not None).
+        if adaptive is True, the threads calculate the OTUs of each block (the blocks are calculated one after the other)
+    adaptive : bool
+        True to stop permuting an OTU once its p-value is confidently above adaptive_pval
+        (checked after each permutation block, 'meandiff' only). The null p-value counts of
+        early stopped OTUs are scaled to numperm permutations when calculating the dsFDR threshold.
+        False (default) to perform numperm permutations for all OTUs
+    adaptive_pval : float
+        the p-value boundary for adaptive early stopping. An OTU is stopped when the lower
+        confidence bound of its p-value is above adaptive_pval
     output:
     reject : np array of bool (length N)
         True for OTUs where the null hypothesis is rejected
@@ -54,7 +82,13 @@ def dsfdr(data, labels, transform_type='rankdata', method='meandiff',
         the p-value for each OTU
     '''
 
-    data = data.copy()
+    if scipy.sparse.issparse(data):
+        if transform_type is None and method == 'meandiff':
+            data = data.tocsr()
+        else:
+            data = data.toarray()
+    else:
+        data = data.copy()
 
     # transform the data
     if transform_type == 'rankdata':
@@ -80,65 +114,39 @@ def dsfdr(data, labels, transform_type='rankdata', method='meandiff',
         method = meandiff
         tstat = method(data, labels)
         t = np.abs(tstat)
-        numsamples = np.shape(data)[1]
-        p = np.zeros([numsamples, numperm])
-        k1 = 1 / np.sum(labels == 0)
-        k2 = 1 / np.sum(labels == 1)
-        for cperm in range(numperm):
-            np.random.shuffle(labels)
-            p[labels == 0, cperm] = k1
-        p2 = np.ones(p.shape) * k2
-        p2[p > 0] = 0
-        mean1 = np.dot(data, p)
-        mean2 = np.dot(data, p2)
-        u = np.abs(mean1 - mean2)
+        if use_float32:
+            dtype = np.float32
+        else:
+            dtype = np.float64
+        if adaptive:
+            u, numperm_row = _meandiff_adaptive_permutations(data, labels, t, numperm, perm_block_size=perm_block_size, dtype=dtype,
+                                                             random_seed=random_seed, num_workers=num_workers, stop_pval=adaptive_pval)
+        else:
+            u = _meandiff_permutations(data, labels, numperm, perm_block_size=perm_block_size, dtype=dtype,
+                                       random_seed=random_seed, num_workers=num_workers)
+            numperm_row = None
+    else:
+        raise ValueError('method %s not supported' % method)
 
     # fix floating point errors (important for permutation values!)
     # https://github.com/numpy/numpy/issues/8116
-    for crow in range(numbact):
-        closepos = np.isclose(t[crow], u[crow, :])
-        u[crow, closepos] = t[crow]
+    u = _snap_ties(t, u)
 
     # calculate permutation p-vals
-    pvals = np.zeros([numbact])  # p-value for original test statistic t
-    pvals_u = np.zeros([numbact, numperm])
-    # pseudo p-values for permutated test statistic u
-    for crow in range(numbact):
-        allstat = np.hstack([t[crow], u[crow, :]])
-        stat_rank = rankdata(allstat, method='min')
-        allstat = 1 - ((stat_rank - 1) / len(allstat))
-        # assign ranks to t from biggest as 1
-        pvals[crow] = allstat[0]
-        pvals_u[crow, :] = allstat[1:]
+    # pvals - p-value for original test statistic t
+    # pvals_u - pseudo p-values for permutated test statistic u
+    pvals, pvals_u = _permutation_pvals(t, u, numperm_row=numperm_row)
 
     # calculate FDR
     if fdr_method == 'dsfdr':
-        # sort unique p-values for original test statistics biggest to smallest
-        pvals_unique = np.unique(pvals)
-        sortp = pvals_unique[np.argsort(-pvals_unique)]
-
         # find a data-dependent threshold for the p-value
-        foundit = False
-        allfdr = []
-        allt = []
-        for cp in sortp:
-            realnum = np.sum(pvals <= cp)
-            fdr = (realnum + np.count_nonzero(
-                pvals_u <= cp)) / (realnum * (numperm + 1))
-            allfdr.append(fdr)
-            allt.append(cp)
-            if fdr <= alpha:
-                realcp = cp
-                foundit = True
-                break
-
-        if not foundit:
+        realcp = _dsfdr_threshold(pvals, pvals_u, alpha, numperm, numperm_row=numperm_row)
+        if realcp is None:
             # no good threshold was found
             reject = np.repeat([False], numbact)
             return reject, tstat, pvals
 
         # fill the reject null hypothesis
-        reject = np.zeros(numbact, dtype=int)
         reject = (pvals <= realcp)
     else:
         raise ValueError('fdr method %s not supported' % fdr_method)
@@ -146,6 +154,295 @@ def dsfdr(data, labels, transform_type='rankdata', method='meandiff',
     return reject, tstat, pvals
 
 
+def _meandiff_permutations(data, labels, numperm, perm_block_size=100, dtype=np.float64, random_seed=None, num_workers=1):
+    '''Calculate the meandiff test statistic for random permutations of the labels
+
+    The permutations are processed in blocks of perm_block_size. For each block we build a samples X block
+    indicator matrix of group 0, and get the group 0 sums using one matrix multiplication.
+    The group 1 sums are the total sum minus the group 0 sums.
+
+    Parameters
+    ----------
+    data : N x S numpy array or scipy.sparse CSR matrix
+        each column is a sample (S total), each row an OTU (N total)
+    labels : a 1d numpy array (length S)
+        the labels of each sample (0/1)
+    numperm : int
+        number of permutations to perform
+    perm_block_size : int, optional
+        number of permutations to calculate in each block
+    dtype : numpy dtype, optional
+        the dtype used for the calculation (np.float64 or np.float32)
+    random_seed : int or None, optional
+        None to permute the labels serially using np.random.shuffle (global numpy random state).
+        int to give each block its own np.random.Generator, spawned from np.random.SeedSequence(random_seed)
+    num_workers : int, optional
+        number of threads for calculating the blocks (only if random_seed is not None)
+
+    Returns
+    -------
+    u : N x numperm numpy array of dtype
+        abs(mean(group 0) - mean(group 1)) for each OTU in each permutation
+    '''
+    k1 = 1 / np.sum(labels == 0)
+    k2 = 1 / np.sum(labels == 1)
+    data = data.astype(dtype, copy=False)
+    total = np.asarray(data.sum(axis=1)).reshape(-1, 1)
+    u = np.empty([np.shape(data)[0], numperm], dtype=dtype)
+    blocks = [(cstart, min(perm_block_size, numperm - cstart)) for cstart in range(0, numperm, perm_block_size)]
+
+    def _calc_block(cstart, p):
+        sum1 = data @ p
+        mean1 = sum1 * k1
+        mean2 = (total - sum1) * k2
+        u[:, cstart:cstart + p.shape[1]] = np.abs(mean1 - mean2)
+
+    if random_seed is None:
+        labels = labels.copy()
+        for cstart, cnum in blocks:
+            p = np.zeros([len(labels), cnum], dtype=dtype)
+            for cperm in range(cnum):
+                np.random.shuffle(labels)
+                p[labels == 0, cperm] = 1
+            _calc_block(cstart, p)
+        return u
+
+    def _calc_seeded_block(cstart, cnum, cseed):
+        rng = np.random.default_rng(cseed)
+        p = np.zeros([len(labels), cnum], dtype=dtype)
+        for cperm in range(cnum):
+            p[rng.permutation(labels) == 0, cperm] = 1
+        _calc_block(cstart, p)
+
+    seeds = np.random.SeedSequence(random_seed).spawn(len(blocks))
+    if num_workers <= 1:
+        for (cstart, cnum), cseed in zip(blocks, seeds):
+            _calc_seeded_block(cstart, cnum, cseed)
+    else:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = [executor.submit(_calc_seeded_block, cstart, cnum, cseed) for (cstart, cnum), cseed in zip(blocks, seeds)]
+            for cfuture in futures:
+                cfuture.result()
+    return u
+
+
+def _meandiff_adaptive_permutations(data, labels, t, numperm, perm_block_size=100, dtype=np.float64, random_seed=None,
+                                    num_workers=1, stop_pval=0.25, stop_z=3):
+    '''Calculate the meandiff test statistic for random permutations of the labels, with early stopping of clearly null OTUs
+
+    The permutation blocks are calculated one after the other (as in _meandiff_permutations(), but only for the OTUs still active).
+    After each block, an OTU is stopped if p - stop_z * sqrt(p * (1 - p) / m) > stop_pval,
+    where p is its permutation p-value estimate after m permutations
+
+    Parameters
+    ----------
+    data : N x S numpy array or scipy.sparse CSR matrix
+        each column is a sample (S total), each row an OTU (N total)
+    labels : a 1d numpy array (length S)
+        the labels of each sample (0/1)
+    t : np array of float (length N)
+        the absolute original test statistic for each OTU
+    numperm : int
+        maximal number of permutations to perform
+    perm_block_size : int, optional
+        number of permutations to calculate in each block (the stopping rule is checked after each block)
+    dtype : numpy dtype, optional
+        the dtype used for the calculation (np.float64 or np.float32)
+    random_seed : int or None, optional
+        None to permute the labels using np.random.shuffle (global numpy random state).
+        int to give each block its own np.random.Generator, spawned from np.random.SeedSequence(random_seed)
+    num_workers : int, optional
+        number of threads for calculating the active OTUs of each block (the result does not depend on num_workers)
+    stop_pval : float, optional
+        the p-value boundary for stopping an OTU
+    stop_z : float, optional
+        the number of standard deviations used for the p-value lower confidence bound
+
+    Returns
+    -------
+    u : N x numperm numpy array of dtype
+        abs(mean(group 0) - mean(group 1)) for each OTU in each permutation.
+        NaN for permutations not performed for the OTU (after it was stopped)
+    numperm_row : np array of int (length N)
+        the number of permutations performed for each OTU
+    '''
+    numbact = np.shape(data)[0]
+    k1 = 1 / np.sum(labels == 0)
+    k2 = 1 / np.sum(labels == 1)
+    data = data.astype(dtype, copy=False)
+    total = np.asarray(data.sum(axis=1)).reshape(-1, 1)
+    u = np.full([numbact, numperm], np.nan, dtype=dtype)
+    numperm_row = np.zeros(numbact, dtype=int)
+    num_exceed = np.zeros(numbact, dtype=int)
+    active = np.arange(numbact)
+
+    def _calc_rows(rows, p):
+        sum1 = data[rows] @ p
+        return np.abs(sum1 * k1 - (total[rows] - sum1) * k2)
+
+    blocks = [(cstart, min(perm_block_size, numperm - cstart)) for cstart in range(0, numperm, perm_block_size)]
+    if random_seed is not None:
+        seeds = np.random.SeedSequence(random_seed).spawn(len(blocks))
+    else:
+        labels = labels.copy()
+    executor = None
+    if num_workers > 1:
+        executor = ThreadPoolExecutor(max_workers=num_workers)
+    try:
+        for idx, (cstart, cnum) in enumerate(blocks):
+            p = np.zeros([len(labels), cnum], dtype=dtype)
+            if random_seed is None:
+                for cperm in range(cnum):
+                    np.random.shuffle(labels)
+                    p[labels == 0, cperm] = 1
+            else:
+                rng = np.random.default_rng(seeds[idx])
+                for cperm in range(cnum):
+                    p[rng.permutation(labels) == 0, cperm] = 1
+            if executor is None or len(active) < num_workers:
+                cu = _calc_rows(active, p)
+            else:
+                cu = np.vstack(list(executor.map(lambda x: _calc_rows(x, p), np.array_split(active, num_workers))))
+            u[active, cstart:cstart + cnum] = cu
+            numperm_row[active] += cnum
+
+            # count the permutations at least as extreme as the original statistic and stop the clearly null OTUs
+            cu = _snap_ties(t[active], cu)
+            num_exceed[active] += np.count_nonzero(cu >= t[active, np.newaxis], axis=1)
+            cm = numperm_row[active]
+            cp = (num_exceed[active] + 1) / (cm + 1)
+            keep = cp - stop_z * np.sqrt(cp * (1 - cp) / cm) <= stop_pval
+            active = active[keep]
+            if len(active) == 0:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return u, numperm_row
+
+
+def _dsfdr_threshold(pvals, pvals_u, alpha, numperm, numperm_row=None):
+    '''Find the discrete FDR p-value threshold
+
+    Going over the unique p-values from biggest to smallest, the threshold is the first p-value cp where
+    (#(pvals <= cp) + #(pvals_u <= cp)) / (#(pvals <= cp) * (numperm + 1)) <= alpha
+    The counts for all candidate thresholds are obtained from one sort of the p-values (using searchsorted)
+
+    Parameters
+    ----------
+    pvals : np array of float (length N)
+        the p-value for each OTU
+    pvals_u : N x P numpy array of float
+        the pseudo p-values of the permuted test statistics
+    alpha : float
+        the desired FDR control level
+    numperm : int
+        number of permutations performed
+    numperm_row : np array of int (length N) or None, optional
+        None (default) if numperm permutations were performed for all OTUs.
+        Otherwise, the number of permutations performed for each OTU (from adaptive early stopping).
+        pvals_u is NaN for permutations not performed, and the permuted p-values of each OTU are
+        counted with weight numperm / numperm_row
+
+    Returns
+    -------
+    float or None
+        the p-value threshold or None if no threshold achieves the desired FDR
+    '''
+    # sort unique p-values for original test statistics biggest to smallest
+    sortp = np.unique(pvals)[::-1]
+
+    # number of original / permuted p-values <= each candidate threshold
+    realnum = np.searchsorted(np.sort(pvals), sortp, side='right')
+    if numperm_row is None:
+        nullnum = np.searchsorted(np.sort(pvals_u, axis=None), sortp, side='right')
+    else:
+        weights = np.broadcast_to((numperm / numperm_row)[:, np.newaxis], pvals_u.shape)
+        valid = ~np.isnan(pvals_u)
+        nullp = pvals_u[valid]
+        order = np.argsort(nullp)
+        cumweight = np.concatenate([[0], np.cumsum(weights[valid][order])])
+        nullnum = cumweight[np.searchsorted(nullp[order], sortp, side='right')]
+
+    fdr = (realnum + nullnum) / (realnum * (numperm + 1))
+    found = np.flatnonzero(fdr <= alpha)
+    if len(found) == 0:
+        return None
+    return sortp[found[0]]
+
+
+def _snap_ties(t, u):
+    '''Set the permuted statistics that are close to the original statistic to exactly the original statistic
+
+    Parameters
+    ----------
+    t : np array of float (length N)
+        the original test statistic for each OTU
+    u : N x P numpy array of float
+        the permuted test statistics (P permutations) for each OTU
+
+    Returns
+    -------
+    u : N x P numpy array of float
+        u with values close to t (np.isclose) replaced by t
+    '''
+    closepos = np.isclose(t[:, np.newaxis], u)
+    return np.where(closepos, t[:, np.newaxis], u)
+
+
+def _permutation_pvals(t, u, numperm_row=None):
+    '''Calculate the permutation p-values of the original and permuted statistics
+
+    For each row, the p-value of a value x out of [t, u] is 1 - (rank(x) - 1) / (P + 1)
+    where rank is the 'min' rank (so ties get the same p-value) and larger values get smaller p-values.
+    This is equivalent to running rankdata(method='min') on each row, but done on the whole matrix at once.
+
+    Parameters
+    ----------
+    t : np array of float (length N)
+        the original test statistic for each OTU
+    u : N x P numpy array of float
+        the permuted test statistics (P permutations) for each OTU
+    numperm_row : np array of int (length N) or None, optional
+        None (default) if all P permutations were performed for all OTUs.
+        Otherwise, the number of permutations performed for each OTU (u is NaN for the permutations not performed)
+
+    Returns
+    -------
+    pvals : np array of float (length N)
+        the p-value of the original test statistic
+    pvals_u : N x P numpy array of float
+        the pseudo p-values of the permuted test statistics (NaN for permutations not performed)
+    '''
+    numperm = u.shape[1]
+
+    # number of values in each row strictly smaller than the original statistic
+    t_less = np.count_nonzero(u < t[:, np.newaxis], axis=1)
+
+    # number of permuted values strictly smaller than each permuted value (in the same row)
+    # in each sorted row, a value has as many smaller values as the position of its first tie
+    order = np.argsort(u, axis=1)
+    sortu = np.take_along_axis(u, order, axis=1)
+    newval = np.ones(sortu.shape, dtype=bool)
+    newval[:, 1:] = sortu[:, 1:] != sortu[:, :-1]
+    first_pos = np.where(newval, np.arange(numperm), 0)
+    np.maximum.accumulate(first_pos, axis=1, out=first_pos)
+    u_less = np.empty(u.shape, dtype=first_pos.dtype)
+    np.put_along_axis(u_less, order, first_pos, axis=1)
+    # and add the original statistic if smaller
+    u_less += (t[:, np.newaxis] < u)
+
+    if numperm_row is None:
+        pvals = 1 - (t_less / (numperm + 1))
+        pvals_u = 1 - (u_less / (numperm + 1))
+    else:
+        # NaNs are sorted last, so the counts of the performed permutations are not affected
+        pvals = 1 - (t_less / (numperm_row + 1))
+        pvals_u = 1 - (u_less / (numperm_row[:, np.newaxis] + 1))
+        pvals_u[np.isnan(u)] = np.nan
+    return pvals, pvals_u
+
+
 def rankdata_transform(data):
     rdata = np.zeros(np.shape(data))
     for crow in range(np.shape(data)[0]):
@@ -165,6 +462,10 @@ def binarydata(data):
 
 
 def meandiff(data, labels):
+    if scipy.sparse.issparse(data):
+        mean0 = np.asarray(data[:, labels == 0].mean(axis=1)).ravel()
+        mean1 = np.asarray(data[:, labels == 1].mean(axis=1)).ravel()
+        return mean1 - mean0
     mean0 = np.mean(data[:, labels == 0], axis=1)
     mean1 = np.mean(data[:, labels == 1], axis=1)
     tstat = mean1 - mean0
@@ -0,0 +1,163 @@
+import re
+import bisect
+import threading
+
+from .utils import debug
+
+# the forward primers of the common 16S regions {primer: region}.
+# primers can contain IUPAC codes (i.e. 'M') or the matching regex class (i.e. '[AC]')
+DEFAULT_PRIMERS = {'AGAGTTTGATC[AC]TGG[CT]TCAG': 'v1', 'CCTACGGG[ACGT][CGT]GC[AT][CG]CAG': 'v3', 'GTGCCAGC[AC]GCCGCGGTAA': 'v4'}
+
+# the IUPAC nucleotide codes
+IUPAC_CODES = {'A': 'A', 'C': 'C', 'G': 'G', 'T': 'T', 'U': 'T', 'R': '[AG]', 'Y': '[CT]', 'S': '[CG]', 'W': '[AT]', 'K': '[GT]',
+               'M': '[AC]', 'B': '[CGT]', 'D': '[AGT]', 'H': '[ACT]', 'V': '[ACG]', 'N': '[ACGT]'}
+
+# the compiled matchers {(primers, max_start, min_primer_len): PrimerMatcher}
+_matchers = {}
+_matchers_lock = threading.Lock()
+
+
+def _split_primer(primer):
+    '''Split a primer to the positions (each is a nucleotide, IUPAC code or regex class)
+
+    Parameters
+    ----------
+    primer: str
+        i.e. 'GTGCCAGC[AC]GCCGCGGTAA' or 'GTGCCAGCMGCCGCGGTAA'
+
+    Returns
+    -------
+    list of str
+        i.e. ['G', 'T', 'G', 'C', 'C', 'A', 'G', 'C', '[AC]', 'G', ...]
+    '''
+    return re.findall(r'\[[^\]]*\]|[^\[\]]', primer.upper())
+
+
+class PrimerMatcher:
+    '''Find primers at the start of sequences using a single compiled regex for all the primers
+
+    A primer matches if it ends before position max_start + the primer length (as in trim_primers_from_sequence()).
+    If more than one primer matches, the first one (in the primers dict order) is used, and for each primer the first match.
+    '''
+    def __init__(self, primers=DEFAULT_PRIMERS, max_start=25, min_primer_len=10):
+        '''
+        Parameters
+        ----------
+        primers: dict of {primer(str): region_name(str)}, optional
+            the primers to look for
+        max_start: int, optional
+            maximal start position for the primer
+        min_primer_len: int or None, optional
+            use only the last min_primer_len positions of each primer (None to use the whole primer)
+        '''
+        self.primers = []
+        self.regions = []
+        alternatives = []
+        for idx, (cprimer, cregion) in enumerate(primers.items()):
+            positions = _split_primer(cprimer)
+            if min_primer_len is not None:
+                positions = positions[-min_primer_len:]
+            short_primer = ''.join(positions)
+            self.primers.append(short_primer)
+            self.regions.append(cregion)
+            pattern = ''.join(IUPAC_CODES.get(x, x) for x in positions)
+            # the primer must end within the first max_start + len(primer string) nucleotides
+            max_pos = max(0, max_start + len(short_primer) - len(positions))
+            alternatives.append('.{0,%d}?(?P<p%d>%s)' % (max_pos, idx, pattern))
+        # anchored, so the alternatives are tried in order (the first matching primer wins)
+        self.regex = re.compile('^(?:%s)' % '|'.join(alternatives), re.MULTILINE)
+
+    def _get_match_info(self, match):
+        idx = int(match.lastgroup[1:])
+        return self.regions[idx], self.primers[idx], match.end(match.lastgroup) - match.start()
+
+    def match(self, seq):
+        '''Find a primer at the start of a sequence
+
+        Parameters
+        ----------
+        seq: str
+            the sequence ('ACGT')
+
+        Returns
+        -------
+        (region (str), primer (str), trim_pos (int)) or None if no primer found
+            trim_pos is the number of nucleotides to trim (up to the end of the primer)
+        '''
+        match = self.regex.match(seq.upper())
+        if match is None:
+            return None
+        return self._get_match_info(match)
+
+    def match_all(self, seqs):
+        '''Find the primers at the start of each sequence in a list (in one regex pass over all the sequences)
+
+        Parameters
+        ----------
+        seqs: list of str
+            the sequences ('ACGT')
+
+        Returns
+        -------
+        list of ((region (str), primer (str), trim_pos (int)) or None)
+            the match for each sequence (see match())
+        '''
+        text = '\n'.join(seqs).upper()
+        # the position of each sequence in the text
+        starts = []
+        pos = 0
+        for cseq in seqs:
+            starts.append(pos)
+            pos += len(cseq) + 1
+        res = [None] * len(seqs)
+        for match in self.regex.finditer(text):
+            idx = bisect.bisect_right(starts, match.start()) - 1
+            res[idx] = self._get_match_info(match)
+        return res
+
+    def trim_all(self, seqs):
+        '''Trim the primers from the start of each sequence in a list
+
+        Parameters
+        ----------
+        seqs: list of str
+            the sequences ('ACGT')
+
+        Returns
+        -------
+        trimmed: list of str
+            the sequences, trimmed after the primer if found
+        regions: list of str or None
+            the region of the primer found in each sequence, or None if not found
+        '''
+        trimmed = []
+        regions = []
+        for cseq, cmatch in zip(seqs, self.match_all(seqs)):
+            if cmatch is None:
+                trimmed.append(cseq)
+                regions.append(None)
+                continue
+            trimmed.append(cseq[cmatch[2]:])
+            regions.append(cmatch[0])
+        debug(2, 'trimmed primers from %d of %d sequences', len(seqs) - regions.count(None), len(seqs))
+        return trimmed, regions
+
+
+def get_primer_matcher(primers=DEFAULT_PRIMERS, max_start=25, min_primer_len=10):
+    '''Get the PrimerMatcher for a set of primers (compiled only once)
+
+    Parameters
+    ----------
+    see PrimerMatcher
+
+    Returns
+    -------
+    PrimerMatcher
+    '''
+    key = (tuple(primers.items()), max_start, min_primer_len)
+    matcher = _matchers.get(key)
+    if matcher is None:
+        matcher = PrimerMatcher(primers, max_start=max_start, min_primer_len=min_primer_len)
+        with _matchers_lock:
+            _matchers[key] = matcher
+    return matcher
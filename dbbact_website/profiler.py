@@ -0,0 +1,148 @@
+import os
+import re
+import sys
+import hmac
+import time
+import uuid
+import threading
+from collections import defaultdict
+
+from .utils import debug, get_private_dir
+
+# default number of seconds between stack samples
+DEFAULT_INTERVAL = 0.005
+
+
+class RequestProfiler:
+    '''Sampling profiler for one request
+
+    A background thread samples the stack of the request thread every interval seconds.
+    The samples are written in collapsed stack format ("func1;func2;func3 count" lines),
+    which can be opened in speedscope (https://www.speedscope.app) or converted using flamegraph.pl
+    '''
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.samples = defaultdict(int)
+        self.num_samples = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.start_time = None
+        self.duration = None
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, name='dbbact-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        self.duration = time.perf_counter() - self.start_time
+
+    def _sample(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+            self.num_samples += 1
+
+    def save(self, fname):
+        '''Save the samples in collapsed stack format
+
+        Parameters
+        ----------
+        fname: str
+            the output file name
+        '''
+        with open(fname, 'w') as fl:
+            for cstack, ccount in sorted(self.samples.items()):
+                fl.write('%s %d\n' % (cstack, ccount))
+
+
+def _get_profile_dir():
+    '''Get the directory for the profile files
+
+    The directory is set by the DBBACT_PROFILE_DIR environment variable (default is a directory of the current user
+    in the system temp. dir, see utils.get_private_dir())
+
+    Returns
+    -------
+    str
+    '''
+    return get_private_dir('DBBACT_PROFILE_DIR', 'dbbact_profiles')
+
+
+def should_profile(request):
+    '''Check if the request asked to be profiled
+
+    Profiling is enabled only if the DBBACT_PROFILE_TOKEN environment variable is set,
+    and the request supplies the same token in the X-Dbbact-Profile header.
+    The token is not accepted as a query parameter, so it does not appear in the request url (which is logged)
+
+    Parameters
+    ----------
+    request: flask.Request
+
+    Returns
+    -------
+    bool
+    '''
+    token = os.environ.get('DBBACT_PROFILE_TOKEN')
+    if not token:
+        return False
+    req_token = request.headers.get('X-Dbbact-Profile')
+    if req_token is None:
+        return False
+    return hmac.compare_digest(req_token.encode(), token.encode())
+
+
+def start_profile():
+    '''Start profiling the current (request) thread
+
+    Returns
+    -------
+    RequestProfiler
+    '''
+    interval = float(os.environ.get('DBBACT_PROFILE_INTERVAL', DEFAULT_INTERVAL))
+    profiler = RequestProfiler(interval=interval)
+    profiler.start()
+    return profiler
+
+
+def stop_profile(profiler, request):
+    '''Stop the request profiler and save the collapsed stack file
+
+    Parameters
+    ----------
+    profiler: RequestProfiler
+        from start_profile()
+    request: flask.Request
+        the profiled request (used for the file name)
+
+    Returns
+    -------
+    str or None
+        the profile file name, or None if it could not be saved
+    '''
+    profiler.stop()
+    path_name = re.sub('[^A-Za-z0-9_-]+', '_', request.path).strip('_') or 'root'
+    # the uuid keeps profiles of the same route (in the same process and second) from overwriting each other
+    fname = '%s_%s_%d_%s.collapsed' % (time.strftime('%Y%m%d-%H%M%S'), path_name, os.getpid(), uuid.uuid4().hex[:8])
+    try:
+        fname = os.path.join(_get_profile_dir(), fname)
+        profiler.save(fname)
+    except OSError as err:
+        debug(5, 'failed to save request profile %s: %s', fname, err)
+        return None
+    debug(3, 'saved profile for %s (%.2f sec, %d samples) to %s', request.url, profiler.duration, profiler.num_samples, fname)
+    return fname
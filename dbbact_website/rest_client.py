@@ -0,0 +1,200 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .utils import debug, get_dbbact_server_address, ProcessLocal
+from . import metrics
+from .cassette import CassetteAdapter
+
+# default number of pooled keep-alive connections to the rest-api server (per worker process)
+DEFAULT_POOL_SIZE = 16
+
+# default (connect, read) timeout in seconds for rest-api calls
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 300
+
+# per-endpoint read timeouts (seconds). endpoints not listed use DEFAULT_READ_TIMEOUT
+ENDPOINT_TIMEOUTS = {
+    '/stats/stats': 20,
+    '/sequences/getid': 30,
+    '/sequences/getid_list': 60,
+    '/sequences/get_taxonomy_str': 30,
+    '/sequences/get_whole_seq_taxonomy': 30,
+    '/sequences/get_close_sequences': 60,
+    '/annotations/get_annotation': 30,
+    '/annotations/get_annotation_ontology_parents': 30,
+    '/experiments/get_details': 30,
+    '/ontology/get_term_stats': 60,
+    '/ontology/get_term_children': 60,
+    '/ontology/get_family_graph': 60,
+}
+
+# default number of threads used for concurrent rest-api calls (per worker process)
+DEFAULT_FETCH_WORKERS = 8
+
+
+def _get_pool_size():
+    '''Get the connection pool size from the DBBACT_REST_POOL_SIZE environment variable (or the default)
+
+    Returns
+    -------
+    int
+    '''
+    try:
+        return int(os.environ.get('DBBACT_REST_POOL_SIZE', DEFAULT_POOL_SIZE))
+    except ValueError:
+        debug(5, 'bad DBBACT_REST_POOL_SIZE value %s. using default %d' % (os.environ['DBBACT_REST_POOL_SIZE'], DEFAULT_POOL_SIZE))
+        return DEFAULT_POOL_SIZE
+
+
+def _create_session():
+    '''Create the pooled keep-alive requests session of the current worker process
+
+    If the DBBACT_REST_CASSETTE environment variable is set, the session records the responses to this cassette file
+    (DBBACT_REST_CASSETTE_MODE=record) or replays them from it without the network (DBBACT_REST_CASSETTE_MODE=replay, default)
+
+    Returns
+    -------
+    (requests.Session, str)
+        the session and the rest-api server address
+    '''
+    pool_size = _get_pool_size()
+    session = requests.Session()
+    if os.environ.get('DBBACT_REST_CASSETTE'):
+        # record the rest-api responses to (or replay them from) a cassette file
+        adapter = CassetteAdapter(os.environ['DBBACT_REST_CASSETTE'], mode=os.environ.get('DBBACT_REST_CASSETTE_MODE', 'replay'),
+                                  pool_size=pool_size)
+    else:
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    server_address = get_dbbact_server_address()
+    debug(2, 'created rest-api session for %s (pid %d, pool size %d)' % (server_address, os.getpid(), pool_size))
+    return session, server_address
+
+
+def _create_executor():
+    '''Create the thread pool used for concurrent rest-api calls in the current worker process (see fetch_all())
+
+    The number of threads is set by the DBBACT_REST_FETCH_WORKERS environment variable
+
+    Returns
+    -------
+    concurrent.futures.ThreadPoolExecutor
+    '''
+    num_workers = int(os.environ.get('DBBACT_REST_FETCH_WORKERS', DEFAULT_FETCH_WORKERS))
+    return ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix='dbbact-rest')
+
+
+# the per-process session and thread pool (gunicorn forks the workers after the module is imported)
+_session = ProcessLocal(_create_session)
+_executor = ProcessLocal(_create_executor)
+
+
+def get_session():
+    '''Get the pooled keep-alive requests session for the current worker process (see _create_session())
+
+    Returns
+    -------
+    requests.Session
+    '''
+    return _session.get()[0]
+
+
+def get_server_address():
+    '''Get the rest-api server address used by the session
+
+    Returns
+    -------
+    str
+    '''
+    return _session.get()[1]
+
+
+def get_timeout(path):
+    '''Get the (connect, read) timeout for a rest-api endpoint
+
+    The read timeout can be overridden for all endpoints using the DBBACT_REST_TIMEOUT environment variable
+
+    Parameters
+    ----------
+    path: str
+        the rest-api endpoint (i.e. '/sequences/get_annotations')
+
+    Returns
+    -------
+    (float, float)
+    '''
+    if 'DBBACT_REST_TIMEOUT' in os.environ:
+        return (DEFAULT_CONNECT_TIMEOUT, float(os.environ['DBBACT_REST_TIMEOUT']))
+    return (DEFAULT_CONNECT_TIMEOUT, ENDPOINT_TIMEOUTS.get(path, DEFAULT_READ_TIMEOUT))
+
+
+def request(method, path, **kwargs):
+    '''Call a dbBact rest-api endpoint through the pooled session
+
+    Parameters
+    ----------
+    method: str
+        'GET' or 'POST'
+    path: str
+        the rest-api endpoint (i.e. '/sequences/get_annotations')
+    **kwargs:
+        passed to requests (json, params, etc.)
+
+    Returns
+    -------
+    requests.Response
+    '''
+    session, server_address = _session.get()
+    kwargs.setdefault('timeout', get_timeout(path))
+    start = time.perf_counter()
+    try:
+        res = session.request(method, server_address + path, **kwargs)
+    except Exception:
+        metrics.inc('dbbact_api_request_errors_total', endpoint=path, method=method)
+        raise
+    metrics.observe('dbbact_api_request_duration_seconds', time.perf_counter() - start, endpoint=path, method=method)
+    metrics.inc('dbbact_api_response_bytes_total', len(res.content), endpoint=path, method=method)
+    return res
+
+
+def get(path, **kwargs):
+    '''GET a dbBact rest-api endpoint (see request())
+    '''
+    return request('GET', path, **kwargs)
+
+
+def post(path, **kwargs):
+    '''POST to a dbBact rest-api endpoint (see request())
+    '''
+    return request('POST', path, **kwargs)
+
+
+def fetch_all(calls):
+    '''Issue independent rest-api calls concurrently and wait for all of them
+
+    Parameters
+    ----------
+    calls: list of (str, str, dict)
+        the calls to perform. each call is (method, path, kwargs) (see request())
+
+    Returns
+    -------
+    list of requests.Response
+        the responses, in the same order as calls.
+        if a call raised an exception, it is raised here (after all calls finished)
+    '''
+    if len(calls) == 1:
+        cmethod, cpath, ckwargs = calls[0]
+        return [request(cmethod, cpath, **ckwargs)]
+    executor = _executor.get()
+    futures = [executor.submit(request, cmethod, cpath, **ckwargs) for cmethod, cpath, ckwargs in calls]
+    errors = [cfuture.exception() for cfuture in futures]
+    for cerr in errors:
+        if cerr is not None:
+            raise cerr
+    return [cfuture.result() for cfuture in futures]
@@ -0,0 +1,252 @@
+import re
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from .utils import debug
+from . import rest_client
+from . import term_index
+from . import stats_cache
+from . import metrics
+from .seq_index import get_sequence_index
+
+# the lookup types, in the order they are tried if more than one matches the query
+LOOKUP_TYPES = ['ontology', 'taxonomy', 'species', 'hash', 'silva']
+
+# qiime2 feature ids are the md5 hash of the sequence
+HASH_RE = re.compile(r'^[0-9a-fA-F]{32}$')
+
+# SILVA ids are the accession (i.e. 'AB001234' or 'CP000057_1') optionally followed by the start and end positions (i.e. 'AB001234.1.1450')
+SILVA_RE = re.compile(r'^[A-Za-z]{1,6}_?\d{4,}(_\d+)?(\.\d+\.\d+)?$')
+
+# a taxonomy string with rank prefixes or separators (i.e. 'g__Bacteroides' or 'Bacteroidetes;Bacteroidia')
+TAXONOMY_RE = re.compile(r';|(^|\s)[dkpcofgs]__', re.IGNORECASE)
+
+# an ontology term id (i.e. 'gaz:00002476' or 'ENVO_00002003')
+TERM_ID_RE = re.compile(r'^[A-Za-z]+(:\w+|_\d+)$')
+
+# default maximal number of queries in the search results cache (per worker process)
+DEFAULT_CACHE_SIZE = 1000
+
+# default number of seconds to remember a query was not found / which lookup type matched it
+DEFAULT_MISS_TTL = 300
+DEFAULT_HIT_TTL = 3600
+
+# the search results cache {(normalized query, db version): (lookup type or None if not found, time)}
+_results_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def normalize_query(query):
+    '''Get the normalized query used as the search results cache key (lowercase, single spaces)
+
+    Parameters
+    ----------
+    query: str
+
+    Returns
+    -------
+    str
+    '''
+    return ' '.join(query.lower().split())
+
+
+def get_cached_result(query):
+    '''Get the cached lookup type of a query (see record_result())
+
+    Parameters
+    ----------
+    query: str
+
+    Returns
+    -------
+    in_cache: bool
+        True if the query is in the cache (and not expired)
+    lookup_type: str or None
+        the lookup type that matched the query, or None if the query was not found
+    '''
+    db_version = stats_cache.get_db_version()
+    if db_version is None:
+        return False, None
+    key = (normalize_query(query), db_version)
+    with _cache_lock:
+        if key not in _results_cache:
+            return False, None
+        lookup_type, cached_time = _results_cache[key]
+        if lookup_type is None:
+            ttl = float(os.environ.get('DBBACT_SEARCH_MISS_TTL', DEFAULT_MISS_TTL))
+        else:
+            ttl = float(os.environ.get('DBBACT_SEARCH_HIT_TTL', DEFAULT_HIT_TTL))
+        if time.time() - cached_time > ttl:
+            del _results_cache[key]
+            return False, None
+        _results_cache.move_to_end(key)
+        return True, lookup_type
+
+
+def record_result(query, lookup_type):
+    '''Store the lookup type that matched a query (or None if the query was not found)
+
+    The cache is kept per worker process, with at most DBBACT_SEARCH_CACHE_SIZE queries. Not found queries are kept for
+    DBBACT_SEARCH_MISS_TTL seconds, and found queries for DBBACT_SEARCH_HIT_TTL seconds.
+    The key includes the database version, so all results are forgotten when the database changes.
+
+    Parameters
+    ----------
+    query: str
+    lookup_type: str or None
+        the lookup type (from LOOKUP_TYPES) that matched the query, or None if not found
+    '''
+    db_version = stats_cache.get_db_version()
+    if db_version is None:
+        return
+    max_size = int(os.environ.get('DBBACT_SEARCH_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+    if max_size <= 0:
+        return
+    key = (normalize_query(query), db_version)
+    with _cache_lock:
+        _results_cache[key] = (lookup_type, time.time())
+        _results_cache.move_to_end(key)
+        while len(_results_cache) > max_size:
+            _results_cache.popitem(last=False)
+
+
+def classify_query(query):
+    '''Get the lookup types that can match a short search query (term/taxonomy/species name, qiime2 hash or SILVA id)
+
+    The query is classified using its shape (hash, SILVA id and taxonomy patterns). The ontology lookup is always included, and
+    the shape and the local index of the known ontology terms are only used to order the lookups (the index may not include
+    terms added since it was built, and ontology term ids such as 'ENVO_00002003' can look like SILVA ids)
+
+    Parameters
+    ----------
+    query: str
+
+    Returns
+    -------
+    list of str
+        the possible lookup types (from LOOKUP_TYPES) in the order they should be tried. empty if nothing can match
+    '''
+    query = query.strip()
+    if not query:
+        return []
+    shape_match = True
+    if HASH_RE.match(query):
+        candidates = ['hash']
+    elif SILVA_RE.match(query):
+        candidates = ['silva']
+    elif TAXONOMY_RE.search(query):
+        candidates = ['taxonomy']
+    else:
+        shape_match = False
+        candidates = ['taxonomy']
+        if len(query.split(' ')) > 1:
+            candidates.append('species')
+    # try the ontology first if the query is a term id or a known term, or if it has no other shape and the term index is
+    # not available yet (None). otherwise try it last
+    known_term = term_index.is_known_term(query)
+    if TERM_ID_RE.match(query) or known_term or (known_term is None and not shape_match):
+        candidates.insert(0, 'ontology')
+    else:
+        candidates.append('ontology')
+    return candidates
+
+
+def get_silva_accession(silva_str):
+    '''Get the SILVA accession from a SILVA id (without the '.start.end' positions if present)
+
+    Parameters
+    ----------
+    silva_str: str
+        the SILVA id (i.e. 'AB001234.1.1450' or 'AB001234')
+
+    Returns
+    -------
+    str
+    '''
+    parts = silva_str.split('.')
+    if len(parts) > 1:
+        silva_str = '.'.join(parts[:-2])
+    return silva_str
+
+
+def _get_probe(lookup_type, query):
+    '''Get the rest-api call checking if a lookup type matches the query, and a function checking the response
+
+    The call is the first one made by the matching Site_Main_Flask.get_XXX_info() function, so its response json can be reused
+    (passed as prefetched) when drawing the page
+
+    Parameters
+    ----------
+    lookup_type: str
+        from LOOKUP_TYPES
+    query: str
+
+    Returns
+    -------
+    ((str, str, dict), function) or None
+        the call (method, path, kwargs) for rest_client.fetch_all(), and a function returning True if the response json matches.
+        None if the lookup is known not to match without calling the rest-api (a hash which is not in the local sequence index)
+    '''
+    if lookup_type == 'ontology':
+        return ('GET', '/ontology/get_annotations', {'params': {'term': query, 'get_children': 'true'}}), lambda x: len(x.get('annotations', [])) > 0
+    if lookup_type == 'taxonomy':
+        return ('GET', '/sequences/get_taxonomy_annotations', {'json': {'taxonomy': query}}), lambda x: len(x.get('annotations', [])) > 0
+    if lookup_type == 'species':
+        return ('GET', '/sequences/get_species_seqs', {'json': {'species': query}}), lambda x: len(x.get('ids', [])) > 0
+    if lookup_type == 'hash':
+        seq_index = get_sequence_index()
+        if seq_index is not None and seq_index.lookup_hash(query) is None:
+            return None
+        return ('GET', '/sequences/get_hash_annotations', {'json': {'hash': query}}), lambda x: len(x.get('annotations', [])) > 0
+    if lookup_type == 'silva':
+        return ('GET', '/sequences/get_annotations', {'json': {'sequence': get_silva_accession(query), 'dbname': 'silva'}}), lambda x: len(x.get('annotations', [])) > 0
+    raise ValueError('unknown lookup type %s' % lookup_type)
+
+
+def resolve(query):
+    '''Find which lookup matches a short search query
+
+    If the query was recently searched (see record_result()), the cached lookup type is returned.
+    Otherwise, all the possible lookups (see classify_query()) are checked concurrently and the first matching one is returned.
+    If all the lookups succeeded and none of them matched, the query is recorded as not found. Failed lookups are never recorded.
+
+    Parameters
+    ----------
+    query: str
+
+    Returns
+    -------
+    lookup_type: str or None
+        the matching lookup type (from LOOKUP_TYPES) or None if no lookup matches
+    prefetched: dict or None
+        the rest-api response json of the lookup (if already fetched)
+    '''
+    in_cache, lookup_type = get_cached_result(query)
+    metrics.inc('dbbact_search_cache_total', result='hit' if in_cache else 'miss')
+    if in_cache:
+        debug(2, 'using cached search lookup type %s for %s', lookup_type, query)
+        return lookup_type, None
+
+    candidates = classify_query(query)
+    debug(2, 'search candidates for %s: %s', query, candidates)
+    if len(candidates) == 0:
+        return None, None
+
+    probes = [(ctype, _get_probe(ctype, query)) for ctype in candidates]
+    probes = [(ctype, cprobe) for ctype, cprobe in probes if cprobe is not None]
+    responses = rest_client.fetch_all([cprobe[0] for ctype, cprobe in probes]) if len(probes) > 0 else []
+    all_ok = True
+    for (ctype, (ccall, cmatch)), cres in zip(probes, responses):
+        if cres.status_code != 200:
+            debug(3, 'search %s lookup failed for %s: %s', ctype, query, cres.content)
+            all_ok = False
+            continue
+        cjson = cres.json()
+        if cmatch(cjson):
+            return ctype, cjson
+    # a failed lookup may have matched, so only remember the query was not found if all the lookups answered
+    if all_ok:
+        record_result(query, None)
+    return None, None
@@ -0,0 +1,256 @@
+'''A local read-only exact-match index of the dbBact sequences
+
+Maps a sequence (case insensitive) or its md5 / qiime2 hash (the md5 of the sequence) to the dbBact sequence id,
+so existence checks and hash searches do not need the rest-api.
+The index is an open addressing hash table in a file, which is memory-mapped (shared by all worker processes).
+
+The index is built from a tab separated (sequence id, sequence) export of the dbBact sequences table, i.e. from a
+restored database dump (see data_dump/readme.txt):
+psql -U postgres -d dbbact -c "\\copy (SELECT id, sequence FROM SequencesTable) TO 'sequences.tsv'"
+python -m dbbact_website.seq_index sequences.tsv dbbact_seqs.idx
+
+(a fasta file with the sequence ids as the headers can also be used). To use it, set the DBBACT_SEQ_INDEX environment variable
+to the index file. The index file can be replaced (i.e. by a periodic export) while the server is running.
+'''
+import os
+import sys
+import time
+import hashlib
+import argparse
+import threading
+
+import numpy as np
+
+from .utils import debug
+
+MAGIC = b'DBBSEQ01'
+
+# the file header and the hash table entries
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('num_slots', '<u8'), ('num_seqs', '<u8'), ('created', '<f8')])
+HEADER_SIZE = 64
+SLOT_DTYPE = np.dtype([('md5', 'V16'), ('seq_id', '<i8'), ('offset', '<u8'), ('length', '<u4'), ('used', '<u4')])
+
+# number of seconds between checks if the index file was replaced
+CHECK_INTERVAL = 60
+
+# the index of the current process, the index file modification time and the last check time
+_index = None
+_index_mtime = None
+_index_check_time = 0
+_index_lock = threading.Lock()
+
+
+class SequenceIndex:
+    '''A memory-mapped exact-match sequence index (see build_index())
+    '''
+    def __init__(self, index_file):
+        '''
+        Parameters
+        ----------
+        index_file: str
+            the index file (from build_index())
+        '''
+        self.index_file = index_file
+        header = np.fromfile(index_file, dtype=HEADER_DTYPE, count=1)
+        if len(header) == 0 or header[0]['magic'] != MAGIC:
+            raise ValueError('%s is not a dbBact sequence index' % index_file)
+        self.num_slots = int(header[0]['num_slots'])
+        self.num_seqs = int(header[0]['num_seqs'])
+        self.created = float(header[0]['created'])
+        self._table = np.memmap(index_file, dtype=SLOT_DTYPE, mode='r', offset=HEADER_SIZE, shape=(self.num_slots,))
+        seqs_offset = HEADER_SIZE + self.num_slots * SLOT_DTYPE.itemsize
+        if os.path.getsize(index_file) > seqs_offset:
+            self._seqs = np.memmap(index_file, dtype=np.uint8, mode='r', offset=seqs_offset)
+        else:
+            self._seqs = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return self.num_seqs
+
+    def _find(self, digest):
+        '''Find the table entry of an md5 digest
+
+        Parameters
+        ----------
+        digest: bytes
+            the md5 digest (16 bytes)
+
+        Returns
+        -------
+        numpy.void or None
+            the table entry, or None if not in the index
+        '''
+        slot = int.from_bytes(digest[:8], 'little') % self.num_slots
+        while True:
+            entry = self._table[slot]
+            if not entry['used']:
+                return None
+            if entry['md5'].tobytes() == digest:
+                return entry
+            slot = (slot + 1) % self.num_slots
+
+    def _get_sequence(self, entry):
+        return self._seqs[entry['offset']:entry['offset'] + entry['length']].tobytes().decode('ascii')
+
+    def lookup_sequence(self, seq):
+        '''Get the dbBact id of a sequence (exact match, case insensitive)
+
+        Parameters
+        ----------
+        seq: str
+            the sequence ('ACGT')
+
+        Returns
+        -------
+        int or None
+            the dbBact sequence id, or None if not in the index
+        '''
+        seq = seq.upper()
+        entry = self._find(hashlib.md5(seq.encode()).digest())
+        if entry is None or self._get_sequence(entry) != seq:
+            return None
+        return int(entry['seq_id'])
+
+    def lookup_hash(self, hash_str):
+        '''Get the dbBact sequence matching an md5 / qiime2 hash
+
+        Parameters
+        ----------
+        hash_str: str
+            the md5 hex digest of the sequence (i.e. a qiime2 feature id)
+
+        Returns
+        -------
+        (int, str) or None
+            the dbBact sequence id and sequence (uppercase), or None if not in the index
+        '''
+        try:
+            digest = bytes.fromhex(hash_str)
+        except ValueError:
+            return None
+        if len(digest) != 16:
+            return None
+        entry = self._find(digest)
+        if entry is None:
+            return None
+        return int(entry['seq_id']), self._get_sequence(entry)
+
+
+def read_sequences(input_file):
+    '''Read the (sequence id, sequence) pairs from a tab separated or fasta file
+
+    Parameters
+    ----------
+    input_file: str
+        tab separated file of (sequence id, sequence) per line, or fasta file with the sequence ids as the headers
+
+    Returns
+    -------
+    generator of (int, str)
+    '''
+    with open(input_file) as fl:
+        seq_id = None
+        for cline in fl:
+            cline = cline.strip()
+            if not cline:
+                continue
+            if cline[0] == '>':
+                seq_id = int(cline[1:].split()[0])
+                continue
+            if seq_id is not None:
+                yield seq_id, cline
+                seq_id = None
+                continue
+            parts = cline.split('\t')
+            yield int(parts[0]), parts[1]
+
+
+def build_index(sequences, index_file):
+    '''Build a sequence index file
+
+    The file is written to a temporary file and then renamed, so running servers can keep using the old index until they reload it
+
+    Parameters
+    ----------
+    sequences: iterable of (int, str)
+        the (dbBact sequence id, sequence) pairs. if a sequence appears more than once, the first id is used
+    index_file: str
+        name of the index file to create
+
+    Returns
+    -------
+    int
+        the number of sequences in the index
+    '''
+    seq_ids = {}
+    for cid, cseq in sequences:
+        seq_ids.setdefault(cseq.upper(), cid)
+    num_slots = max(16, 2 * len(seq_ids))
+    table = np.zeros(num_slots, dtype=SLOT_DTYPE)
+    offset = 0
+    seq_data = []
+    for cseq, cid in seq_ids.items():
+        cseq = cseq.encode('ascii')
+        digest = hashlib.md5(cseq).digest()
+        slot = int.from_bytes(digest[:8], 'little') % num_slots
+        while table[slot]['used']:
+            slot = (slot + 1) % num_slots
+        table[slot] = (digest, cid, offset, len(cseq), 1)
+        seq_data.append(cseq)
+        offset += len(cseq)
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header[0] = (MAGIC, num_slots, len(seq_ids), time.time())
+    tmp_file = '%s.%d.tmp' % (index_file, os.getpid())
+    with open(tmp_file, 'wb') as fl:
+        fl.write(header.tobytes().ljust(HEADER_SIZE, b'\0'))
+        fl.write(table.tobytes())
+        fl.write(b''.join(seq_data))
+    os.replace(tmp_file, index_file)
+    return len(seq_ids)
+
+
+def get_sequence_index():
+    '''Get the local sequence index of the current process
+
+    The index file is set by the DBBACT_SEQ_INDEX environment variable. If the file is replaced, the new one is loaded
+    (checked every CHECK_INTERVAL seconds).
+
+    Returns
+    -------
+    SequenceIndex or None
+        None if there is no local index (the rest-api should be used)
+    '''
+    global _index, _index_mtime, _index_check_time
+
+    index_file = os.environ.get('DBBACT_SEQ_INDEX')
+    if not index_file:
+        return None
+    if time.time() - _index_check_time < CHECK_INTERVAL:
+        return _index
+    with _index_lock:
+        _index_check_time = time.time()
+        try:
+            mtime = os.stat(index_file).st_mtime
+            if _index is None or mtime != _index_mtime or _index.index_file != index_file:
+                _index = SequenceIndex(index_file)
+                _index_mtime = mtime
+                debug(3, 'loaded sequence index %s with %d sequences', index_file, len(_index))
+        except (OSError, ValueError) as err:
+            debug(6, 'failed to load sequence index %s: %s', index_file, err)
+            _index = None
+    return _index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='build the dbBact local sequence index')
+    parser.add_argument('input', help='tab separated (sequence id, sequence) file, or fasta file with the sequence ids as the headers')
+    parser.add_argument('output', help='the index file to create')
+    args = parser.parse_args(argv)
+
+    num_seqs = build_index(read_sequences(args.input), args.output)
+    print('created index %s with %d sequences' % (args.output, num_seqs), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from .utils import debug, BackgroundRefresh
+from . import rest_client
+
+# default number of seconds before the cached statistics are refreshed
+DEFAULT_TTL = 300
+
+# default number of seconds the first request waits for the statistics (if never fetched)
+DEFAULT_FIRST_WAIT = 2
+
+# the cached /stats/stats 'stats' dict, and the time it was fetched
+_stats = None
+_stats_time = 0
+_stats_version = None
+_stats_lock = threading.Lock()
+
+
+def _get_ttl():
+    return float(os.environ.get('DBBACT_STATS_TTL', DEFAULT_TTL))
+
+
+def _refresh():
+    '''Get the statistics from the rest-api server and store them in the cache (runs in the refresh thread)
+    '''
+    global _stats, _stats_time, _stats_version
+
+    try:
+        res = rest_client.get('/stats/stats')
+        if res.status_code == 200:
+            stats = res.json().get('stats')
+            with _stats_lock:
+                _stats = stats
+                _stats_time = time.time()
+                _stats_version = hashlib.md5(json.dumps(stats, sort_keys=True).encode()).hexdigest()
+            debug(1, 'refreshed dbbact statistics')
+        else:
+            debug(5, 'failed to get dbbact statistics: %s', res.content)
+    except Exception as err:
+        debug(5, 'failed to get dbbact statistics: %s', err)
+
+
+_refresher = BackgroundRefresh(_refresh, 'dbbact-stats-refresh')
+
+
+def get_stats(wait=True):
+    '''Get the dbBact statistics (the /stats/stats 'stats' dict) without waiting for the rest-api server
+
+    The statistics are cached for DBBACT_STATS_TTL seconds. After that, the cached statistics are still returned,
+    and a background thread gets the new ones (stale-while-revalidate).
+    If the statistics were never fetched (i.e. the first request of a new worker process, unless the worker was warmed
+    by Server_Main.gunicorn()), waits up to DBBACT_STATS_FIRST_WAIT seconds for them.
+
+    Parameters
+    ----------
+    wait: bool, optional
+        False to start fetching the statistics (if never fetched) without waiting for them
+
+    Returns
+    -------
+    dict or None
+        the statistics (NumSequences, NumAnnotations, NumSeqAnnotations, NumExperiments, Database, ...),
+        or None if the rest-api server never answered
+    '''
+    if _stats is None:
+        _refresher.start(wait=float(os.environ.get('DBBACT_STATS_FIRST_WAIT', DEFAULT_FIRST_WAIT)) if wait else None)
+    elif time.time() - _stats_time > _get_ttl():
+        _refresher.start()
+    return _stats
+
+
+def get_db_version():
+    '''Get a version string of the dbBact database contents, used for invalidating cached results
+
+    The version is a hash of the /stats/stats counts, so it changes whenever annotations/sequences/experiments are added
+    (it is updated with the cached statistics, see get_stats())
+
+    Returns
+    -------
+    str or None
+        the database version, or None if the rest-api server never answered
+    '''
+    if get_stats() is None:
+        return None
+    return _stats_version
@@ -0,0 +1,228 @@
+import os
+import time
+import bisect
+import threading
+
+from .utils import debug, BackgroundRefresh
+from . import rest_client
+from . import stats_cache
+
+# default number of seconds before the term index is rebuilt
+DEFAULT_TTL = 3600
+
+# default number of seconds the first request waits for the index (if never built)
+DEFAULT_FIRST_WAIT = 10
+
+# the autocomplete groups, and the rest-api endpoint listing the names of each group
+GROUPS = {'ontology': '/ontology/get_all_terms', 'synonym': '/ontology/get_all_synonyms'}
+
+# the cached {group: PrefixIndex}, the time it was built and the database version it was built for
+_indexes = None
+_indexes_time = 0
+_indexes_version = None
+_index_lock = threading.Lock()
+
+
+class PrefixIndex:
+    '''A prefix index over a list of names (i.e. ontology terms)
+
+    A name matches a query if the query is a prefix of the whole name, or of the name starting from one of its words
+    (i.e. 'human feces' matches 'hum' and 'fec'). Matching is case insensitive.
+    The index is kept as sorted arrays of keys, so a lookup is a binary search (O(log n + k)).
+    '''
+    def __init__(self, names):
+        '''
+        Parameters
+        ----------
+        names: list of str
+            the names to index
+        '''
+        self.names = sorted(set(x for x in names if x))
+        # the whole (lowercase) names, sorted
+        whole = sorted((x.lower(), idx) for idx, x in enumerate(self.names))
+        self._whole_keys = [x[0] for x in whole]
+        self._whole_ids = [x[1] for x in whole]
+        # the name suffixes starting at each word (except the first word, which is in the whole names)
+        words = []
+        for idx, cname in enumerate(self.names):
+            lname = cname.lower()
+            pos = lname.find(' ')
+            while pos >= 0:
+                if pos + 1 < len(lname) and lname[pos + 1] != ' ':
+                    words.append((lname[pos + 1:], idx))
+                pos = lname.find(' ', pos + 1)
+        words.sort()
+        self._word_keys = [x[0] for x in words]
+        self._word_ids = [x[1] for x in words]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        '''Check if the name is in the index (case insensitive)
+        '''
+        name = ' '.join(name.lower().split())
+        pos = bisect.bisect_left(self._whole_keys, name)
+        return pos < len(self._whole_keys) and self._whole_keys[pos] == name
+
+    def _get_range(self, keys, prefix):
+        '''Get the positions in the sorted keys list starting with prefix
+        '''
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + '\uffff', lo=start)
+        return start, end
+
+    def search(self, query, k=10):
+        '''Get the top k names matching the query
+
+        Names starting with the query come first (in alphabetical order), followed by names containing a word starting with the query
+
+        Parameters
+        ----------
+        query: str
+        k: int, optional
+            the maximal number of results
+
+        Returns
+        -------
+        list of str
+        '''
+        query = ' '.join(query.lower().split())
+        if not query:
+            return []
+        res = []
+        found = set()
+        start, end = self._get_range(self._whole_keys, query)
+        for cpos in range(start, min(end, start + k)):
+            found.add(self._whole_ids[cpos])
+            res.append(self.names[self._whole_ids[cpos]])
+        if len(res) >= k:
+            return res
+        start, end = self._get_range(self._word_keys, query)
+        for cpos in range(start, end):
+            cid = self._word_ids[cpos]
+            if cid in found:
+                continue
+            found.add(cid)
+            res.append(self.names[cid])
+            if len(res) >= k:
+                break
+        return res
+
+
+def _get_names(endpoint):
+    '''Get the list of names from a rest-api endpoint (/ontology/get_all_terms or /ontology/get_all_synonyms)
+
+    Returns
+    -------
+    list of str or None if failed
+    '''
+    res = rest_client.get(endpoint)
+    if res.status_code != 200:
+        debug(6, 'failed to get %s: %s', endpoint, res.content)
+        return None
+    names = res.json()
+    # some endpoints return a dict of {name: description}
+    if isinstance(names, dict):
+        names = list(names.keys())
+    return [x for x in names if isinstance(x, str)]
+
+
+def _refresh():
+    '''Get the terms and synonyms from the rest-api server and build the indexes (runs in the refresh thread)
+    '''
+    global _indexes, _indexes_time, _indexes_version
+
+    try:
+        start = time.time()
+        db_version = stats_cache.get_db_version()
+        indexes = {}
+        for cgroup, cendpoint in GROUPS.items():
+            names = _get_names(cendpoint)
+            if names is None:
+                return
+            indexes[cgroup] = PrefixIndex(names)
+        with _index_lock:
+            _indexes = indexes
+            _indexes_time = time.time()
+            _indexes_version = db_version
+        debug(2, 'built term index (%s) in %.1f sec', ', '.join('%d %s' % (len(v), k) for k, v in indexes.items()), time.time() - start)
+    except Exception as err:
+        debug(6, 'failed to build term index: %s', err)
+
+
+_refresher = BackgroundRefresh(_refresh, 'dbbact-term-index-refresh')
+
+
+def get_indexes(wait=True):
+    '''Get the term and synonym prefix indexes
+
+    The indexes are rebuilt every DBBACT_TERM_INDEX_TTL seconds, or when the database version changes (see stats_cache.get_db_version()),
+    in a background thread (the old indexes are used meanwhile).
+
+    Parameters
+    ----------
+    wait: bool, optional
+        if True and the indexes were never built, wait up to DBBACT_TERM_INDEX_FIRST_WAIT seconds for them.
+        if False, start building them and return None
+
+    Returns
+    -------
+    dict of {group (str): PrefixIndex} or None
+        the index of each group in GROUPS, or None if the rest-api server never answered
+    '''
+    if _indexes is None:
+        _refresher.start(wait=float(os.environ.get('DBBACT_TERM_INDEX_FIRST_WAIT', DEFAULT_FIRST_WAIT)) if wait else None)
+    elif time.time() - _indexes_time > float(os.environ.get('DBBACT_TERM_INDEX_TTL', DEFAULT_TTL)):
+        _refresher.start()
+    else:
+        db_version = stats_cache.get_db_version()
+        if db_version is not None and db_version != _indexes_version:
+            _refresher.start()
+    return _indexes
+
+
+def is_known_term(name):
+    '''Check if a name is a known ontology term or synonym (case insensitive), without waiting for the index
+
+    Parameters
+    ----------
+    name: str
+
+    Returns
+    -------
+    bool or None
+        None if the index is not available (yet)
+    '''
+    indexes = get_indexes(wait=False)
+    if indexes is None:
+        return None
+    return any(name in cindex for cindex in indexes.values())
+
+
+def autocomplete(query, k=10, groups=None):
+    '''Get the top k terms/synonyms starting with the query (or with a word starting with the query)
+
+    Parameters
+    ----------
+    query: str
+    k: int, optional
+        the maximal number of results in each group
+    groups: list of str or None, optional
+        the groups to search (from GROUPS). None to search all
+
+    Returns
+    -------
+    dict of {group (str): list of str}
+        the matching names in each group (empty lists if the index is not available)
+    '''
+    if groups is None:
+        groups = list(GROUPS)
+    indexes = get_indexes()
+    res = {}
+    for cgroup in groups:
+        if indexes is None or cgroup not in indexes:
+            res[cgroup] = []
+            continue
+        res[cgroup] = indexes[cgroup].search(query, k)
+    return res
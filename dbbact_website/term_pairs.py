@@ -1,10 +1,13 @@
 from collections import defaultdict
-import requests
 
-from .utils import get_dbbact_server_address, debug
+from .utils import debug
+from . import rest_client
+from . import term_stats_cache
+from . import metrics
 
 
 # def get_enrichment_score(annotations, seqannotations, ignore_exp=[], term_info=None, term_types=('single', 'pairs')):
+@metrics.timed('get_enrichment_score')
 def get_enrichment_score(annotations, seqannotations, ignore_exp=[], term_info=None, term_types=('single')):
 	'''Get f score, recall and precision for set of annotations
 
@@ -208,12 +211,9 @@ def get_term_info(terms, term_types=('single')):
 		The statistics about each term
 	'''
 	debug(2, 'getting term_info for %d terms' % len(terms))
-	res = requests.get(get_dbbact_server_address() + '/ontology/get_term_stats', json={'terms': terms})
-	if res.status_code != 200:
-		debug(6, 'error encountered in get_term_stats: %s' % res.reason)
+	term_info = term_stats_cache.get_term_stats(terms)
+	if term_info is None:
 		return []
-	ans = res.json()
-	term_info = ans.get('term_info')
 	return term_info
 
 
@@ -406,7 +406,7 @@ def get_enriched_term_pairs(annotations, seqannotations=None, min_exp=3, get_pai
 	term_pair_score, term_pair_exps, term_precision = get_term_pairs_score(annotations, seqannotations=seqannotations, min_exp=min_exp, get_pairs=get_pairs, get_singles=get_singles)
 	term_pairs = list(term_pair_score.keys())
 	debug(2, 'found %d terms/term pairs' % len(term_pairs))
-	res = requests.get(get_dbbact_server_address() + '/ontology/get_term_pair_count', json={'term_pairs': term_pairs})
+	res = rest_client.get('/ontology/get_term_pair_count', json={'term_pairs': term_pairs})
 	term_count = res.json()['term_count']
 
 	if sequences is None:
@@ -479,7 +479,7 @@ def get_term_pairs_score(annotations, seqannotations=None, min_exp=3, get_pairs=
 	term_pair_exps = defaultdict(set)
 	for cexp in experiments:
 		cexp_term_pairs = defaultdict(float)
-		res = requests.get(get_dbbact_server_address() + '/experiments/get_annotations', json={'expId': cexp})
+		res = rest_client.get('/experiments/get_annotations', json={'expId': cexp})
 		cannotations = res.json()['annotations']
 		for ccann in cannotations:
 			cterm_pairs = get_annotation_term_pairs(ccann, get_pairs=get_pairs, get_singles=get_singles)
@@ -0,0 +1,211 @@
+import os
+import json
+import sqlite3
+import threading
+
+from .utils import debug, get_private_dir
+from . import rest_client
+from . import stats_cache
+from . import metrics
+
+# maximal number of terms in one sqlite query (sqlite limits the number of query parameters)
+SQL_BATCH_SIZE = 500
+
+# the in-memory copy of the cache (per worker process) {term (str): stats (dict) or None if the term does not exist}
+_memory_cache = {}
+_memory_version = None
+_cache_lock = threading.Lock()
+
+
+def _get_disk_file():
+    '''Get the sqlite file of the term stats cache (shared by all worker processes)
+
+    The directory is set by the DBBACT_TERM_STATS_CACHE_DIR environment variable (default is a directory of the current user
+    in the system temp. dir, see utils.get_private_dir()). Setting it to an empty string disables the on-disk cache.
+
+    Returns
+    -------
+    str or None
+        the sqlite file name, or None if the on-disk cache is disabled
+    '''
+    if os.environ.get('DBBACT_TERM_STATS_CACHE_DIR') == '':
+        return None
+    try:
+        cache_dir = get_private_dir('DBBACT_TERM_STATS_CACHE_DIR', 'dbbact_cache')
+    except OSError as err:
+        debug(5, 'term stats on-disk cache disabled: %s', err)
+        return None
+    return os.path.join(cache_dir, 'term_stats_cache.sqlite')
+
+
+def _connect(cache_file):
+    '''Open the on-disk cache (creating the tables if needed)
+
+    Parameters
+    ----------
+    cache_file: str
+        the sqlite file name
+
+    Returns
+    -------
+    sqlite3.Connection
+    '''
+    con = sqlite3.connect(cache_file, timeout=30)
+    con.execute('CREATE TABLE IF NOT EXISTS term_stats (term TEXT PRIMARY KEY, stats TEXT)')
+    con.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+    return con
+
+
+def _get_disk_version(con):
+    row = con.execute("SELECT value FROM meta WHERE name='db_version'").fetchone()
+    if row is None:
+        return None
+    return row[0]
+
+
+def _get_cached(terms, db_version):
+    '''Get the cached stats of the terms (from the in-memory cache, or from the on-disk cache)
+
+    Parameters
+    ----------
+    terms: list of str
+    db_version: str
+        the current database version (from stats_cache.get_db_version())
+
+    Returns
+    -------
+    dict of {term (str): stats (dict) or None if the term does not exist in dbBact}
+        only the terms found in the cache
+    '''
+    global _memory_cache, _memory_version
+
+    res = {}
+    with _cache_lock:
+        if _memory_version != db_version:
+            _memory_cache = {}
+            _memory_version = db_version
+        for cterm in terms:
+            if cterm in _memory_cache:
+                res[cterm] = _memory_cache[cterm]
+    missing = [x for x in terms if x not in res]
+    if not missing:
+        return res
+
+    cache_file = _get_disk_file()
+    if cache_file is None:
+        return res
+    disk_res = {}
+    try:
+        con = _connect(cache_file)
+        try:
+            if _get_disk_version(con) != db_version:
+                return res
+            for idx in range(0, len(missing), SQL_BATCH_SIZE):
+                cterms = missing[idx:idx + SQL_BATCH_SIZE]
+                rows = con.execute('SELECT term, stats FROM term_stats WHERE term IN (%s)' % ','.join('?' * len(cterms)), cterms).fetchall()
+                for cterm, cstats in rows:
+                    disk_res[cterm] = json.loads(cstats) if cstats is not None else None
+        finally:
+            con.close()
+    except sqlite3.Error as err:
+        debug(5, 'failed to read term stats cache %s: %s', cache_file, err)
+        return res
+    _store_memory(disk_res, db_version)
+    res.update(disk_res)
+    return res
+
+
+def _store_memory(term_stats, db_version):
+    with _cache_lock:
+        if _memory_version == db_version:
+            _memory_cache.update(term_stats)
+
+
+def _store(term_stats, db_version):
+    '''Store term stats in the in-memory and on-disk caches
+
+    If the on-disk cache is of an older database version, it is cleared first
+
+    Parameters
+    ----------
+    term_stats: dict of {term (str): stats (dict) or None if the term does not exist in dbBact}
+    db_version: str
+    '''
+    _store_memory(term_stats, db_version)
+
+    cache_file = _get_disk_file()
+    if cache_file is None:
+        return
+    try:
+        con = _connect(cache_file)
+        try:
+            with con:
+                disk_version = _get_disk_version(con)
+                if disk_version != db_version:
+                    debug(2, 'database version changed (%s -> %s). clearing term stats cache', disk_version, db_version)
+                    con.execute('DELETE FROM term_stats')
+                    con.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('db_version', ?)", (db_version,))
+                con.executemany('INSERT OR REPLACE INTO term_stats (term, stats) VALUES (?, ?)',
+                                [(cterm, json.dumps(cstats) if cstats is not None else None) for cterm, cstats in term_stats.items()])
+        finally:
+            con.close()
+    except sqlite3.Error as err:
+        debug(5, 'failed to write term stats cache %s: %s', cache_file, err)
+
+
+def _fetch_term_stats(terms):
+    '''Get the term stats from the rest-api server
+
+    Parameters
+    ----------
+    terms: list of str
+
+    Returns
+    -------
+    dict of {term (str): stats (dict)} or None if failed
+    '''
+    res = rest_client.get('/ontology/get_term_stats', json={'terms': terms})
+    if res.status_code != 200:
+        debug(6, 'error encountered in get_term_stats: %s', res.reason)
+        return None
+    return res.json().get('term_info')
+
+
+def get_term_stats(terms):
+    '''Get the statistics of each term (total_annotations, total_sequences, total_experiments etc.)
+
+    Term stats are cached in memory and in an sqlite file shared by all worker processes (in DBBACT_TERM_STATS_CACHE_DIR).
+    Only the terms missing from the cache are fetched (in one /ontology/get_term_stats call).
+    The cache is cleared when the database version (see stats_cache.get_db_version()) changes.
+
+    Parameters
+    ----------
+    terms: list of str
+        the terms to get the stats for
+
+    Returns
+    -------
+    dict of {term (str): stats (dict)} or None if the rest-api call failed
+        terms not in dbBact are not in the dict (same as /ontology/get_term_stats 'term_info')
+    '''
+    terms = list(dict.fromkeys(terms))
+    db_version = stats_cache.get_db_version()
+    if db_version is None:
+        debug(5, 'no database version. term stats are not cached')
+        return _fetch_term_stats(terms)
+
+    cached = _get_cached(terms, db_version)
+    missing = [x for x in terms if x not in cached]
+    metrics.inc('dbbact_term_stats_cache_terms_total', len(terms) - len(missing), result='hit')
+    metrics.inc('dbbact_term_stats_cache_terms_total', len(missing), result='miss')
+    if missing:
+        debug(2, 'getting term stats for %d terms (%d cached)', len(missing), len(cached))
+        new_stats = _fetch_term_stats(missing)
+        if new_stats is None:
+            return None
+        # terms not returned by the rest-api are cached as non-existing
+        new_cache = dict.fromkeys(missing)
+        new_cache.update(new_stats)
+        _store(new_cache, db_version)
+        cached.update(new_cache)
+    return {k: v for k, v in cached.items() if v is not None}
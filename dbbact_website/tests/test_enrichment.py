@@ -0,0 +1,48 @@
+from unittest import TestCase, main, mock
+
+import numpy as np
+
+from dbbact_website import enrichment
+
+
+class EnrichmentTests(TestCase):
+	def setUp(self):
+		rng = np.random.RandomState(1)
+		self.seqs = [''.join(rng.choice(list('ACGT'), 20)) for idx in range(60)]
+		self.annotations = {idx: {'annotationid': idx, 'annotationtype': 'common', 'details': [('all', 'term%d' % (idx % 15))], 'expid': idx}
+							for idx in range(30)}
+		# the first 20 sequences are enriched in annotations 0 and 1
+		self.seq_annotations = {cseq: [int(x) for x in rng.randint(30, size=2)] + ([0, 1] if idx < 20 else []) for idx, cseq in enumerate(self.seqs)}
+
+	def _get_seq_annotations_fast(self, seqs):
+		return {}, {cseq: self.seq_annotations[cseq] for cseq in seqs}, self.annotations
+
+	def _enrichment(self, seqs1, seqs2):
+		with mock.patch.object(enrichment, 'get_seq_annotations_fast', side_effect=self._get_seq_annotations_fast):
+			return enrichment.enrichment(seqs1, seqs2)
+
+	def test_enrichment(self):
+		err, terms, pvals, odif = self._enrichment(self.seqs[:25], self.seqs[20:])
+		self.assertEqual(err, '')
+		self.assertIn('term0', terms)
+		self.assertIn('term1', terms)
+		self.assertEqual(len(terms), len(pvals))
+		self.assertEqual(len(terms), len(odif))
+
+	def test_sequence_order(self):
+		# the results depend only on the sequences in each group (as assumed by the enrichment cache)
+		res = self._enrichment(self.seqs[:25], self.seqs[20:])
+		for seqs1, seqs2 in [(self.seqs[:25][::-1], self.seqs[20:][::-1]), (self.seqs[:25] + self.seqs[:5], self.seqs[25:] + self.seqs[40:])]:
+			cres = self._enrichment(seqs1, seqs2)
+			self.assertEqual(list(cres[1]), list(res[1]))
+			np.testing.assert_array_equal(cres[2], res[2])
+			np.testing.assert_array_equal(cres[3], res[3])
+
+	def test_no_background(self):
+		err, terms, pvals, odif = self._enrichment(self.seqs[:10], self.seqs[:5])
+		self.assertNotEqual(err, '')
+		self.assertIsNone(terms)
+
+
+if __name__ == '__main__':
+	main()
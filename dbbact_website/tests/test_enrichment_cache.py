@@ -0,0 +1,128 @@
+import os
+import sqlite3
+import tempfile
+from unittest import TestCase, main, mock
+
+import numpy as np
+
+from dbbact_website import enrichment_cache
+
+
+class EnrichmentCacheTests(TestCase):
+	def setUp(self):
+		self.tempdir = tempfile.TemporaryDirectory()
+		self.db_version = '1'
+		self.calls = []
+		patchers = [mock.patch.dict(os.environ, {'DBBACT_ENRICHMENT_CACHE_DIR': self.tempdir.name, 'DBBACT_ENRICHMENT_CACHE_SIZE': '2'}),
+					mock.patch.object(enrichment_cache.stats_cache, 'get_db_version', side_effect=lambda: self.db_version),
+					mock.patch.object(enrichment_cache.enrichment, 'enrichment', side_effect=self._enrichment)]
+		for cpatcher in patchers:
+			cpatcher.start()
+			self.addCleanup(cpatcher.stop)
+		enrichment_cache._memory_cache.clear()
+
+	def tearDown(self):
+		enrichment_cache._memory_cache.clear()
+		self.tempdir.cleanup()
+
+	def _enrichment(self, seqs1, seqs2, term_type='term'):
+		self.calls.append((seqs1, seqs2, term_type))
+		return '', np.array(['feces', seqs1[0]]), np.array([0.01, 0.05]), np.array([-0.5, 0.25])
+
+	def assert_result_equal(self, res, expected):
+		self.assertEqual(res[0], expected[0])
+		for cres, cexpected in zip(res[1:], expected[1:]):
+			self.assertIsInstance(cres, np.ndarray)
+			self.assertEqual(cres.tolist(), cexpected.tolist())
+
+	def test_get_cache_key(self):
+		key = enrichment_cache.get_cache_key(['A', 'C'], ['G'], 'term', '1')
+		# the order and duplicates of the sequences do not change the key
+		self.assertEqual(enrichment_cache.get_cache_key(['C', 'A', 'A'], ['G'], 'term', '1'), key)
+		self.assertNotEqual(enrichment_cache.get_cache_key(['A'], ['C', 'G'], 'term', '1'), key)
+		self.assertNotEqual(enrichment_cache.get_cache_key(['A', 'C'], ['G'], 'annotation', '1'), key)
+		self.assertNotEqual(enrichment_cache.get_cache_key(['A', 'C'], ['G'], 'term', '2'), key)
+
+	def test_memory_cache(self):
+		res = enrichment_cache.get_enrichment(['A'], ['C'])
+		self.assert_result_equal(enrichment_cache.get_enrichment(['A'], ['C']), res)
+		self.assertEqual(len(self.calls), 1)
+
+	def test_memory_lru(self):
+		with mock.patch.object(enrichment_cache, '_get_disk_file', return_value=None):
+			enrichment_cache.get_enrichment(['A'], ['C'])
+			enrichment_cache.get_enrichment(['G'], ['C'])
+			# use A, so G is the least recently used
+			enrichment_cache.get_enrichment(['A'], ['C'])
+			enrichment_cache.get_enrichment(['T'], ['C'])
+			self.assertEqual(len(self.calls), 3)
+			enrichment_cache.get_enrichment(['A'], ['C'])
+			self.assertEqual(len(self.calls), 3)
+			enrichment_cache.get_enrichment(['G'], ['C'])
+			self.assertEqual(len(self.calls), 4)
+
+	def test_disk_cache(self):
+		res = enrichment_cache.get_enrichment(['A'], ['C'])
+		# another worker process only has the on-disk cache
+		enrichment_cache._memory_cache.clear()
+		self.assert_result_equal(enrichment_cache.get_enrichment(['A'], ['C']), res)
+		self.assertEqual(len(self.calls), 1)
+
+	def test_disk_cache_json(self):
+		enrichment_cache.get_enrichment(['A'], ['C'])
+		con = sqlite3.connect(os.path.join(self.tempdir.name, 'enrichment_cache.sqlite'))
+		try:
+			result = con.execute('SELECT result FROM enrichment').fetchone()[0]
+		finally:
+			con.close()
+		self.assertEqual(result, '["", ["feces", "A"], [0.01, 0.05], [-0.5, 0.25]]')
+
+	def test_disk_cache_invalid(self):
+		key = enrichment_cache.get_cache_key(['A'], ['C'], 'term', self.db_version)
+		con = enrichment_cache._connect(os.path.join(self.tempdir.name, 'enrichment_cache.sqlite'))
+		with con:
+			con.execute('INSERT INTO enrichment (key, result, last_used) VALUES (?, ?, ?)', (key, b'\x80\x04not json', 0))
+		con.close()
+		enrichment_cache.get_enrichment(['A'], ['C'])
+		self.assertEqual(len(self.calls), 1)
+
+	def test_disk_lru(self):
+		with mock.patch.dict(os.environ, {'DBBACT_ENRICHMENT_CACHE_SIZE': '0', 'DBBACT_ENRICHMENT_CACHE_DISK_SIZE': '2'}):
+			for cseq in ['A', 'G', 'T']:
+				enrichment_cache.get_enrichment([cseq], ['C'])
+			self.assertEqual(len(self.calls), 3)
+			enrichment_cache.get_enrichment(['T'], ['C'])
+			self.assertEqual(len(self.calls), 3)
+			enrichment_cache.get_enrichment(['A'], ['C'])
+			self.assertEqual(len(self.calls), 4)
+
+	def test_db_version(self):
+		enrichment_cache.get_enrichment(['A'], ['C'])
+		self.db_version = '2'
+		enrichment_cache.get_enrichment(['A'], ['C'])
+		self.assertEqual(len(self.calls), 2)
+		# no database version - not cached
+		self.db_version = None
+		enrichment_cache.get_enrichment(['A'], ['C'])
+		enrichment_cache.get_enrichment(['A'], ['C'])
+		self.assertEqual(len(self.calls), 4)
+
+	def test_errors_not_cached(self):
+		with mock.patch.object(enrichment_cache.enrichment, 'enrichment', return_value=('error', None, None, None)) as enrichment:
+			enrichment_cache.get_enrichment(['A'], ['C'])
+			enrichment_cache.get_enrichment(['A'], ['C'])
+		self.assertEqual(enrichment.call_count, 2)
+
+	def test_disk_cache_disabled(self):
+		with mock.patch.dict(os.environ, {'DBBACT_ENRICHMENT_CACHE_DIR': ''}):
+			self.assertIsNone(enrichment_cache._get_disk_file())
+
+	def test_default_dir(self):
+		with mock.patch.dict(os.environ), mock.patch.object(enrichment_cache, 'get_private_dir', return_value=self.tempdir.name) as get_private_dir:
+			del os.environ['DBBACT_ENRICHMENT_CACHE_DIR']
+			self.assertEqual(enrichment_cache._get_disk_file(), os.path.join(self.tempdir.name, 'enrichment_cache.sqlite'))
+		get_private_dir.assert_called_once_with('DBBACT_ENRICHMENT_CACHE_DIR', 'dbbact_enrichment_cache')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,201 @@
+from unittest import TestCase, main
+
+import numpy as np
+
+from dbbact_website import mini_dsfdr
+
+
+def _reference_permutations(data, labels, numperm):
+	'''the original dsfdr meandiff permutations (using the global numpy random state)'''
+	labels = labels.copy()
+	p = np.zeros([np.shape(data)[1], numperm])
+	k1 = 1 / np.sum(labels == 0)
+	k2 = 1 / np.sum(labels == 1)
+	for cperm in range(numperm):
+		np.random.shuffle(labels)
+		p[labels == 0, cperm] = k1
+	p2 = np.ones(p.shape) * k2
+	p2[p > 0] = 0
+	return np.abs(np.dot(data, p) - np.dot(data, p2))
+
+
+def _reference_snap_ties(t, u):
+	u = u.copy()
+	for crow in range(len(t)):
+		closepos = np.isclose(t[crow], u[crow, :])
+		u[crow, closepos] = t[crow]
+	return u
+
+
+def _reference_pvals(t, u):
+	'''the original per row rankdata permutation p-values'''
+	pvals = np.zeros([len(t)])
+	pvals_u = np.zeros(u.shape)
+	for crow in range(len(t)):
+		allstat = np.hstack([t[crow], u[crow, :]])
+		stat_rank = mini_dsfdr.rankdata(allstat, method='min')
+		allstat = 1 - ((stat_rank - 1) / len(allstat))
+		pvals[crow] = allstat[0]
+		pvals_u[crow, :] = allstat[1:]
+	return pvals, pvals_u
+
+
+def _reference_threshold(pvals, pvals_u, alpha, numperm):
+	'''the original loop over the candidate dsfdr thresholds'''
+	pvals_unique = np.unique(pvals)
+	sortp = pvals_unique[np.argsort(-pvals_unique)]
+	for cp in sortp:
+		realnum = np.sum(pvals <= cp)
+		fdr = (realnum + np.count_nonzero(pvals_u <= cp)) / (realnum * (numperm + 1))
+		if fdr <= alpha:
+			return cp
+	return None
+
+
+class DsfdrTests(TestCase):
+	def setUp(self):
+		rng = np.random.RandomState(7)
+		# group sizes of 8 so the (rank) means are exact, and the permuted statistics do not depend on the summation order
+		self.labels = np.array([0] * 8 + [1] * 8)
+		# integer counts (many ties), the first 5 OTUs are higher in group 1
+		self.data = rng.poisson(3, size=(40, len(self.labels))).astype(float)
+		self.data[:5, self.labels == 1] += 8
+
+	def test_snap_ties(self):
+		rng = np.random.RandomState(1)
+		t = rng.rand(20)
+		u = rng.rand(20, 30)
+		u[:, :5] = t[:, np.newaxis] + 1e-12
+		u[:, 5] = t
+		snapped = mini_dsfdr._snap_ties(t, u)
+		np.testing.assert_array_equal(snapped, _reference_snap_ties(t, u))
+		np.testing.assert_array_equal(snapped[:, :6], np.repeat(t[:, np.newaxis], 6, axis=1))
+
+	def test_permutation_pvals(self):
+		rng = np.random.RandomState(2)
+		# small integers so there are ties between the permuted values and with the original statistic
+		t = rng.randint(5, size=30).astype(float)
+		u = rng.randint(5, size=(30, 50)).astype(float)
+		pvals, pvals_u = mini_dsfdr._permutation_pvals(t, u)
+		ref_pvals, ref_pvals_u = _reference_pvals(t, u)
+		np.testing.assert_allclose(pvals, ref_pvals)
+		np.testing.assert_allclose(pvals_u, ref_pvals_u)
+
+	def test_permutation_pvals_numperm_row(self):
+		# with early stopping, the p-values of each row are calculated only from the permutations performed
+		rng = np.random.RandomState(3)
+		t = rng.randint(5, size=10).astype(float)
+		u = rng.randint(5, size=(10, 40)).astype(float)
+		numperm_row = rng.choice([10, 20, 40], size=10)
+		for crow, cnum in enumerate(numperm_row):
+			u[crow, cnum:] = np.nan
+		pvals, pvals_u = mini_dsfdr._permutation_pvals(t, u, numperm_row=numperm_row)
+		for crow, cnum in enumerate(numperm_row):
+			ref_pvals, ref_pvals_u = _reference_pvals(t[crow:crow + 1], u[crow:crow + 1, :cnum])
+			self.assertAlmostEqual(pvals[crow], ref_pvals[0])
+			np.testing.assert_allclose(pvals_u[crow, :cnum], ref_pvals_u[0])
+			self.assertTrue(np.all(np.isnan(pvals_u[crow, cnum:])))
+
+	def test_dsfdr_threshold(self):
+		rng = np.random.RandomState(4)
+		for numperm in [10, 99]:
+			t = rng.randint(8, size=50).astype(float)
+			u = rng.randint(8, size=(50, numperm)).astype(float)
+			pvals, pvals_u = _reference_pvals(t, u)
+			for alpha in [0.01, 0.1, 0.5, 1]:
+				self.assertEqual(mini_dsfdr._dsfdr_threshold(pvals, pvals_u, alpha, numperm),
+								 _reference_threshold(pvals, pvals_u, alpha, numperm))
+
+	def test_dsfdr_threshold_weights(self):
+		# the second OTU was stopped after 2 of the 4 permutations, so each of its permuted p-values counts twice:
+		# cp=0.5: (2 + 1 + 2 * 1) / (2 * 5) = 0.5 (0.4 without the weights), cp=0.1: (1 + 0) / (1 * 5) = 0.2
+		pvals = np.array([0.1, 0.5])
+		pvals_u = np.array([[0.2, 0.6, 0.8, 1.0], [0.2, 1.0, np.nan, np.nan]])
+		numperm_row = np.array([4, 2])
+		self.assertEqual(mini_dsfdr._dsfdr_threshold(pvals, pvals_u, 0.45, 4, numperm_row=numperm_row), 0.1)
+		self.assertEqual(mini_dsfdr._dsfdr_threshold(pvals, pvals_u, 0.5, 4, numperm_row=numperm_row), 0.5)
+		self.assertIsNone(mini_dsfdr._dsfdr_threshold(pvals, pvals_u, 0.1, 4, numperm_row=numperm_row))
+		# all the permutations performed is the same as no weights
+		pvals_u[1, 2:] = [0.6, 1.0]
+		self.assertEqual(mini_dsfdr._dsfdr_threshold(pvals, pvals_u, 0.45, 4, numperm_row=np.array([4, 4])), 0.5)
+		self.assertEqual(mini_dsfdr._dsfdr_threshold(pvals, pvals_u, 0.45, 4), 0.5)
+
+	def test_meandiff_permutations(self):
+		numperm = 250
+		np.random.seed(5)
+		ref_u = _reference_permutations(self.data, self.labels, numperm)
+		for perm_block_size in [1, 100, 1000]:
+			np.random.seed(5)
+			u = mini_dsfdr._meandiff_permutations(self.data, self.labels, numperm, perm_block_size=perm_block_size)
+			np.testing.assert_array_equal(u, ref_u)
+
+	def test_dsfdr(self):
+		# the same results as the original implementation for the same random state
+		rdata = mini_dsfdr.rankdata_transform(self.data)
+		tstat = mini_dsfdr.meandiff(rdata, self.labels)
+		t = np.abs(tstat)
+		np.random.seed(6)
+		u = _reference_snap_ties(t, _reference_permutations(rdata, self.labels, 1000))
+		ref_pvals, ref_pvals_u = _reference_pvals(t, u)
+		ref_cp = _reference_threshold(ref_pvals, ref_pvals_u, 0.1, 1000)
+		np.random.seed(6)
+		reject, res_tstat, pvals = mini_dsfdr.dsfdr(self.data, self.labels)
+		np.testing.assert_allclose(res_tstat, tstat)
+		np.testing.assert_allclose(pvals, ref_pvals)
+		np.testing.assert_array_equal(reject, ref_pvals <= ref_cp)
+		self.assertTrue(np.all(reject[:5]))
+
+	def test_seeded_workers(self):
+		# a seeded result does not depend on the number of threads
+		for adaptive in [False, True]:
+			res = mini_dsfdr.dsfdr(self.data, self.labels, numperm=500, random_seed=11, adaptive=adaptive)
+			for num_workers in [2, 4]:
+				cres = mini_dsfdr.dsfdr(self.data, self.labels, numperm=500, random_seed=11, num_workers=num_workers, adaptive=adaptive)
+				for cval, val in zip(cres, res):
+					np.testing.assert_array_equal(cval, val)
+			# and does not depend on the global random state
+			np.random.seed(0)
+			cres = mini_dsfdr.dsfdr(self.data, self.labels, numperm=500, random_seed=11, adaptive=adaptive)
+			np.testing.assert_array_equal(cres[2], res[2])
+		cres = mini_dsfdr.dsfdr(self.data, self.labels, numperm=500, random_seed=12)
+		self.assertFalse(np.array_equal(cres[2], res[2]))
+
+	def test_adaptive_stopping(self):
+		numperm = 1000
+		block = 100
+		stop_pval = 0.25
+		data = mini_dsfdr.rankdata_transform(self.data)
+		t = np.abs(mini_dsfdr.meandiff(data, self.labels))
+		u, numperm_row = mini_dsfdr._meandiff_adaptive_permutations(data, self.labels, t, numperm, perm_block_size=block,
+																	random_seed=3, stop_pval=stop_pval)
+		# the differential OTUs are never stopped, and some of the null OTUs are stopped early
+		np.testing.assert_array_equal(numperm_row[:5], numperm)
+		self.assertTrue(np.any(numperm_row < numperm))
+		self.assertTrue(np.all(numperm_row % block == 0))
+		# an OTU is stopped after the first block where the p-value lower confidence bound is above stop_pval
+		u = mini_dsfdr._snap_ties(t, u)
+		for crow in range(len(t)):
+			self.assertTrue(np.all(np.isnan(u[crow, numperm_row[crow]:])))
+			self.assertFalse(np.any(np.isnan(u[crow, :numperm_row[crow]])))
+			for cm in range(block, numperm_row[crow] + 1, block):
+				cp = (np.count_nonzero(u[crow, :cm] >= t[crow]) + 1) / (cm + 1)
+				stopped = cp - 3 * np.sqrt(cp * (1 - cp) / cm) > stop_pval
+				self.assertEqual(stopped, cm == numperm_row[crow] and cm < numperm)
+		# the permutations performed are the same as without early stopping
+		full_u = mini_dsfdr._snap_ties(t, mini_dsfdr._meandiff_permutations(data, self.labels, numperm, perm_block_size=block, random_seed=3))
+		performed = ~np.isnan(u)
+		np.testing.assert_allclose(u[performed], full_u[performed])
+
+	def test_adaptive_dsfdr(self):
+		# early stopping only drops clearly null OTUs, so the differential OTUs are still found
+		reject, tstat, pvals = mini_dsfdr.dsfdr(self.data, self.labels, random_seed=1, adaptive=True)
+		full_reject, full_tstat, full_pvals = mini_dsfdr.dsfdr(self.data, self.labels, random_seed=1)
+		np.testing.assert_array_equal(tstat, full_tstat)
+		self.assertTrue(np.all(reject[:5]))
+		np.testing.assert_array_equal(reject[:5], full_reject[:5])
+		# the p-values of the OTUs which were not stopped are the same
+		np.testing.assert_allclose(pvals[:5], full_pvals[:5])
+
+
+if __name__ == '__main__':
+	main()
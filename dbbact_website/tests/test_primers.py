@@ -0,0 +1,136 @@
+import re
+import random
+from unittest import TestCase, main
+
+from dbbact_website import primers
+
+
+def _reference_match(cseq, primers_dict=primers.DEFAULT_PRIMERS, max_start=25, min_primer_len=10):
+	'''the primer search of the original trim_primers_from_sequence()
+
+	Returns
+	-------
+	(region, primer, trim_pos) or None
+	'''
+	if min_primer_len is not None:
+		new_primers = {}
+		for k, v in primers_dict.items():
+			pos = len(k)
+			numchars = 0
+			newp = ''
+			while True:
+				if numchars >= min_primer_len:
+					break
+				pos = pos - 1
+				if pos < 0:
+					break
+				if k[pos] != ']':
+					newp = k[pos] + newp
+					numchars += 1
+					continue
+				while k[pos] != '[':
+					newp = k[pos] + newp
+					pos = pos - 1
+				newp = k[pos] + newp
+				numchars += 1
+			new_primers[newp] = v
+		primers_dict = new_primers
+
+	cseq = cseq.upper()
+	for cprimer in primers_dict.keys():
+		ccseq = cseq[:max_start + len(cprimer)]
+		match = re.search(cprimer, ccseq)
+		if match is not None:
+			return primers_dict[cprimer], cprimer, match.end()
+	return None
+
+
+class PrimersTests(TestCase):
+	def setUp(self):
+		self.rng = random.Random(3)
+
+	def _random_seq(self, length):
+		return ''.join(self.rng.choice('ACGT') for idx in range(length))
+
+	def _primer_instance(self, primer):
+		'''a random sequence matching the primer (a random nucleotide for each class)'''
+		return ''.join(self.rng.choice(x.strip('[]')) for x in primers._split_primer(primer))
+
+	def _get_seqs(self, num_seqs=500):
+		'''random sequences with zero, one or two primers starting at random positions around max_start'''
+		primer_list = list(primers.DEFAULT_PRIMERS)
+		seqs = []
+		for idx in range(num_seqs):
+			cseq = self._random_seq(self.rng.randint(0, 40))
+			for cnum in range(self.rng.randint(0, 2)):
+				cseq += self._primer_instance(self.rng.choice(primer_list)) + self._random_seq(self.rng.randint(0, 10))
+			cseq += self._random_seq(self.rng.randint(0, 100))
+			if self.rng.random() < 0.2:
+				cseq = cseq.lower()
+			seqs.append(cseq)
+		return seqs
+
+	def test_match(self):
+		matcher = primers.PrimerMatcher()
+		num_found = 0
+		for cseq in self._get_seqs():
+			res = matcher.match(cseq)
+			self.assertEqual(res, _reference_match(cseq), cseq)
+			num_found += res is not None
+		# both found and not found sequences are tested
+		self.assertGreater(num_found, 100)
+		self.assertLess(num_found, 450)
+
+	def test_match_parameters(self):
+		seqs = self._get_seqs(200)
+		for max_start in [0, 5, 50]:
+			for min_primer_len in [5, 10, None]:
+				matcher = primers.PrimerMatcher(max_start=max_start, min_primer_len=min_primer_len)
+				for cseq in seqs:
+					self.assertEqual(matcher.match(cseq), _reference_match(cseq, max_start=max_start, min_primer_len=min_primer_len), cseq)
+
+	def test_primer_order(self):
+		# if more than one primer matches, the first one in the primers dict is used
+		cseq = 'AA' + self._primer_instance('CCTACGGG[ACGT][CGT]GC[AT][CG]CAG') + 'GTGCCAGCAGCCGCGGTAA' + 'TTTT'
+		res = primers.PrimerMatcher(max_start=50).match(cseq)
+		self.assertEqual(res, _reference_match(cseq, max_start=50))
+		self.assertEqual(res[0], 'v3')
+		reverse_primers = dict(reversed(list(primers.DEFAULT_PRIMERS.items())))
+		res = primers.PrimerMatcher(reverse_primers, max_start=50).match(cseq)
+		self.assertEqual(res, _reference_match(cseq, primers_dict=reverse_primers, max_start=50))
+		self.assertEqual(res[0], 'v4')
+		# unless it ends after the maximal start position
+		self.assertEqual(primers.PrimerMatcher(reverse_primers).match(cseq)[0], 'v3')
+
+	def test_iupac(self):
+		cseq = 'ACGT' + 'GTGCCAGCCGCCGCGGTAA' + 'TTTT'
+		iupac = primers.PrimerMatcher({'GTGCCAGCMGCCGCGGTAA': 'v4'}, min_primer_len=None)
+		regex = primers.PrimerMatcher({'GTGCCAGC[AC]GCCGCGGTAA': 'v4'}, min_primer_len=None)
+		self.assertEqual(iupac.match(cseq)[2], regex.match(cseq)[2])
+		self.assertEqual(iupac.match(cseq)[2], 23)
+		self.assertIsNone(iupac.match('ACGT' + 'GTGCCAGCTGCCGCGGTAA'))
+
+	def test_trim_all(self):
+		matcher = primers.PrimerMatcher()
+		seqs = self._get_seqs() + ['', 'ACGT']
+		trimmed, regions = matcher.trim_all(seqs)
+		self.assertEqual(len(trimmed), len(seqs))
+		for cseq, ctrimmed, cregion in zip(seqs, trimmed, regions):
+			ref = _reference_match(cseq)
+			if ref is None:
+				self.assertEqual(ctrimmed, cseq)
+				self.assertIsNone(cregion)
+			else:
+				self.assertEqual(ctrimmed, cseq[ref[2]:])
+				self.assertEqual(cregion, ref[0])
+		self.assertEqual(matcher.match_all(seqs), [matcher.match(x) for x in seqs])
+
+	def test_get_primer_matcher(self):
+		matcher = primers.get_primer_matcher()
+		self.assertIs(primers.get_primer_matcher(), matcher)
+		self.assertIsNot(primers.get_primer_matcher(max_start=5), matcher)
+		self.assertIsNot(primers.get_primer_matcher({'GTGCCAGC[AC]GCCGCGGTAA': 'v4'}), matcher)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,180 @@
+import os
+from unittest import TestCase, main, mock
+
+from dbbact_website import search_resolver
+
+
+class FakeResponse:
+	def __init__(self, json_data, status_code=200):
+		self._json = json_data
+		self.status_code = status_code
+		self.content = b''
+
+	def json(self):
+		return self._json
+
+
+class ClassifyQueryTests(TestCase):
+	def classify(self, query, known_term=None):
+		with mock.patch.object(search_resolver.term_index, 'is_known_term', return_value=known_term):
+			return search_resolver.classify_query(query)
+
+	def test_empty(self):
+		self.assertEqual(self.classify(''), [])
+		self.assertEqual(self.classify('  '), [])
+
+	def test_term_names(self):
+		# the ontology is tried first unless the term index says it is not a known term
+		self.assertEqual(self.classify('feces'), ['ontology', 'taxonomy'])
+		self.assertEqual(self.classify('feces', known_term=True), ['ontology', 'taxonomy'])
+		self.assertEqual(self.classify('feces', known_term=False), ['taxonomy', 'ontology'])
+		self.assertEqual(self.classify('homo sapiens'), ['ontology', 'taxonomy', 'species'])
+		self.assertEqual(self.classify('escherichia coli', known_term=False), ['taxonomy', 'species', 'ontology'])
+
+	def test_term_ids(self):
+		# obo style term ids look like SILVA ids, but are tried as ontology terms first
+		for cquery in ['ENVO_00002003', 'UBERON_0001988', 'GAZ_00002459']:
+			for cknown in [None, False]:
+				self.assertEqual(self.classify(cquery, known_term=cknown), ['ontology', 'silva'])
+		self.assertEqual(self.classify('gaz:00002476', known_term=False), ['ontology', 'taxonomy'])
+
+	def test_shapes(self):
+		# the shape lookup is tried first, but the ontology is kept as a fallback
+		self.assertEqual(self.classify('0123456789abcdef0123456789ABCDEF'), ['hash', 'ontology'])
+		self.assertEqual(self.classify('AB001234.1.1450'), ['silva', 'ontology'])
+		self.assertEqual(self.classify('CP000057_1', known_term=False), ['silva', 'ontology'])
+		self.assertEqual(self.classify('g__Bacteroides'), ['taxonomy', 'ontology'])
+		self.assertEqual(self.classify('Bacteroidetes;Bacteroidia'), ['taxonomy', 'ontology'])
+		# unless the term index knows the query
+		self.assertEqual(self.classify('g__Bacteroides', known_term=True), ['ontology', 'taxonomy'])
+
+	def test_get_silva_accession(self):
+		self.assertEqual(search_resolver.get_silva_accession('AB001234.1.1450'), 'AB001234')
+		self.assertEqual(search_resolver.get_silva_accession('AB001234'), 'AB001234')
+
+
+class ResultsCacheTests(TestCase):
+	def setUp(self):
+		search_resolver._results_cache.clear()
+		self.db_version = '1'
+		self.now = 1000
+		patchers = [mock.patch.dict(os.environ, {'DBBACT_SEARCH_CACHE_SIZE': '2', 'DBBACT_SEARCH_MISS_TTL': '10', 'DBBACT_SEARCH_HIT_TTL': '100'}),
+					mock.patch.object(search_resolver.stats_cache, 'get_db_version', side_effect=lambda: self.db_version),
+					mock.patch.object(search_resolver.time, 'time', side_effect=lambda: self.now)]
+		for cpatcher in patchers:
+			cpatcher.start()
+			self.addCleanup(cpatcher.stop)
+
+	def tearDown(self):
+		search_resolver._results_cache.clear()
+
+	def test_cached_result(self):
+		self.assertEqual(search_resolver.get_cached_result('feces'), (False, None))
+		search_resolver.record_result('feces', 'ontology')
+		search_resolver.record_result('fish', None)
+		self.assertEqual(search_resolver.get_cached_result('feces'), (True, 'ontology'))
+		self.assertEqual(search_resolver.get_cached_result('fish'), (True, None))
+		# the query is normalized
+		self.assertEqual(search_resolver.get_cached_result('  Feces '), (True, 'ontology'))
+
+	def test_lru(self):
+		search_resolver.record_result('feces', 'ontology')
+		search_resolver.record_result('soil', 'ontology')
+		# use feces, so soil is the least recently used
+		search_resolver.get_cached_result('feces')
+		search_resolver.record_result('fish', None)
+		self.assertEqual(search_resolver.get_cached_result('soil'), (False, None))
+		self.assertEqual(search_resolver.get_cached_result('feces'), (True, 'ontology'))
+		self.assertEqual(search_resolver.get_cached_result('fish'), (True, None))
+
+	def test_ttl(self):
+		search_resolver.record_result('feces', 'ontology')
+		search_resolver.record_result('fish', None)
+		# misses expire before hits
+		self.now += 11
+		self.assertEqual(search_resolver.get_cached_result('fish'), (False, None))
+		self.assertEqual(search_resolver.get_cached_result('feces'), (True, 'ontology'))
+		self.now += 90
+		self.assertEqual(search_resolver.get_cached_result('feces'), (False, None))
+		self.assertEqual(len(search_resolver._results_cache), 0)
+
+	def test_db_version(self):
+		search_resolver.record_result('fish', None)
+		self.db_version = '2'
+		self.assertEqual(search_resolver.get_cached_result('fish'), (False, None))
+		# no database version - not cached
+		self.db_version = None
+		search_resolver.record_result('fish', None)
+		self.assertEqual(search_resolver.get_cached_result('fish'), (False, None))
+
+	def test_disabled(self):
+		with mock.patch.dict(os.environ, {'DBBACT_SEARCH_CACHE_SIZE': '0'}):
+			search_resolver.record_result('feces', 'ontology')
+			self.assertEqual(search_resolver.get_cached_result('feces'), (False, None))
+
+
+class ResolveTests(TestCase):
+	def setUp(self):
+		search_resolver._results_cache.clear()
+		patchers = [mock.patch.object(search_resolver.stats_cache, 'get_db_version', return_value=1),
+					mock.patch.object(search_resolver.term_index, 'is_known_term', return_value=None),
+					mock.patch.object(search_resolver, 'get_sequence_index', return_value=None)]
+		for cpatcher in patchers:
+			cpatcher.start()
+			self.addCleanup(cpatcher.stop)
+
+	def tearDown(self):
+		search_resolver._results_cache.clear()
+
+	def resolve(self, query, responses):
+		with mock.patch.object(search_resolver.rest_client, 'fetch_all', return_value=responses) as fetch_all:
+			res = search_resolver.resolve(query)
+		return res, fetch_all
+
+	def test_term_id_ontology(self):
+		(lookup_type, prefetched), fetch_all = self.resolve('ENVO_00002003', [FakeResponse({'annotations': [{'annotationid': 1}]}),
+																			   FakeResponse({'annotations': []})])
+		self.assertEqual(lookup_type, 'ontology')
+		self.assertEqual(prefetched, {'annotations': [{'annotationid': 1}]})
+		self.assertEqual([x[1] for x in fetch_all.call_args[0][0]], ['/ontology/get_annotations', '/sequences/get_annotations'])
+
+	def test_silva_fallback(self):
+		(lookup_type, prefetched), fetch_all = self.resolve('AB001234.1.1450', [FakeResponse({'annotations': []}),
+																				 FakeResponse({'annotations': [{'annotationid': 1}]})])
+		self.assertEqual(lookup_type, 'ontology')
+		silva_call = fetch_all.call_args[0][0][0]
+		self.assertEqual(silva_call[2]['json'], {'sequence': 'AB001234', 'dbname': 'silva'})
+
+	def test_miss_recorded(self):
+		(lookup_type, prefetched), fetch_all = self.resolve('feces', [FakeResponse({'annotations': []}), FakeResponse({'annotations': []})])
+		self.assertIsNone(lookup_type)
+		self.assertEqual(search_resolver.get_cached_result('feces'), (True, None))
+
+	def test_failed_lookup_not_recorded(self):
+		(lookup_type, prefetched), fetch_all = self.resolve('feces', [FakeResponse({}, status_code=400), FakeResponse({'annotations': []})])
+		self.assertIsNone(lookup_type)
+		self.assertEqual(search_resolver.get_cached_result('feces'), (False, None))
+
+	def test_hash_miss_recorded(self):
+		# a not found hash is looked up only once
+		query = '0123456789abcdef0123456789abcdef'
+		(lookup_type, prefetched), fetch_all = self.resolve(query, [FakeResponse({'annotations': []}), FakeResponse({'annotations': []})])
+		self.assertIsNone(lookup_type)
+		self.assertEqual([x[1] for x in fetch_all.call_args[0][0]], ['/sequences/get_hash_annotations', '/ontology/get_annotations'])
+		(lookup_type, prefetched), fetch_all = self.resolve(query, [])
+		self.assertIsNone(lookup_type)
+		fetch_all.assert_not_called()
+
+	def test_hash_not_in_index(self):
+		# a hash which is not in the local sequence index is not looked up in the rest-api
+		seq_index = mock.Mock()
+		seq_index.lookup_hash.return_value = None
+		with mock.patch.object(search_resolver, 'get_sequence_index', return_value=seq_index):
+			(lookup_type, prefetched), fetch_all = self.resolve('0123456789abcdef0123456789abcdef', [FakeResponse({'annotations': []})])
+		self.assertIsNone(lookup_type)
+		self.assertEqual([x[1] for x in fetch_all.call_args[0][0]], ['/ontology/get_annotations'])
+		self.assertEqual(search_resolver.get_cached_result('0123456789abcdef0123456789abcdef'), (True, None))
+
+
+if __name__ == '__main__':
+	main()
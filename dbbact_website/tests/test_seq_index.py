@@ -0,0 +1,121 @@
+import os
+import hashlib
+import tempfile
+from unittest import TestCase, main, mock
+
+from flask import Flask
+
+from dbbact_website import seq_index
+from dbbact_website import Site_Main_Flask
+
+
+class FakeResponse:
+	def __init__(self, json_data, status_code=200):
+		self._json = json_data
+		self.status_code = status_code
+		self.content = b''
+
+	def json(self):
+		return self._json
+
+
+class SeqIndexTests(TestCase):
+	def setUp(self):
+		self.tempdir = tempfile.TemporaryDirectory()
+		self.index_file = os.path.join(self.tempdir.name, 'seqs.idx')
+		self.seqs = [(1, 'TACGGAGGAT'), (2, 'tacgtaggtg'), (3, 'AACGAAGGGG'), (4, 'TACGGAGGAT')]
+		self.num_seqs = seq_index.build_index(self.seqs, self.index_file)
+
+	def tearDown(self):
+		self.tempdir.cleanup()
+
+	def test_build_index(self):
+		# the duplicate sequence is stored once
+		self.assertEqual(self.num_seqs, 3)
+		index = seq_index.SequenceIndex(self.index_file)
+		self.assertEqual(len(index), 3)
+
+	def test_lookup_sequence(self):
+		index = seq_index.SequenceIndex(self.index_file)
+		# the first id of a duplicate sequence is used
+		self.assertEqual(index.lookup_sequence('TACGGAGGAT'), 1)
+		# case insensitive
+		self.assertEqual(index.lookup_sequence('TACGTAGGTG'), 2)
+		self.assertEqual(index.lookup_sequence('aacgaagggg'), 3)
+		self.assertIsNone(index.lookup_sequence('TACGGAGGAA'))
+		self.assertIsNone(index.lookup_sequence('TACGGAGGA'))
+
+	def test_lookup_hash(self):
+		index = seq_index.SequenceIndex(self.index_file)
+		self.assertEqual(index.lookup_hash(hashlib.md5(b'TACGTAGGTG').hexdigest()), (2, 'TACGTAGGTG'))
+		self.assertIsNone(index.lookup_hash(hashlib.md5(b'TACGGAGGAA').hexdigest()))
+		# not a valid md5 hex digest
+		self.assertIsNone(index.lookup_hash('not a hash'))
+		self.assertIsNone(index.lookup_hash('abcd'))
+
+	def test_read_sequences(self):
+		tsv_file = os.path.join(self.tempdir.name, 'seqs.tsv')
+		with open(tsv_file, 'w') as fl:
+			fl.write('1\tTACG\n\n2\tAACG\n')
+		self.assertEqual(list(seq_index.read_sequences(tsv_file)), [(1, 'TACG'), (2, 'AACG')])
+		fasta_file = os.path.join(self.tempdir.name, 'seqs.fa')
+		with open(fasta_file, 'w') as fl:
+			fl.write('>1 first\nTACG\n>2\nAACG\n')
+		self.assertEqual(list(seq_index.read_sequences(fasta_file)), [(1, 'TACG'), (2, 'AACG')])
+
+	def test_get_sequence_index(self):
+		with mock.patch.dict(os.environ, {'DBBACT_SEQ_INDEX': self.index_file}), mock.patch.object(seq_index, '_index_check_time', 0):
+			index = seq_index.get_sequence_index()
+			self.assertEqual(index.lookup_sequence('TACGGAGGAT'), 1)
+		with mock.patch.dict(os.environ, {'DBBACT_SEQ_INDEX': ''}):
+			self.assertIsNone(seq_index.get_sequence_index())
+
+
+class HashInfoTests(TestCase):
+	'''get_hash_info() should show the same page with and without the local sequence index'''
+	def setUp(self):
+		self.tempdir = tempfile.TemporaryDirectory()
+		self.index_file = os.path.join(self.tempdir.name, 'seqs.idx')
+		seq_index.build_index([(1, 'TACGGAGGAT'), (2, 'TACGTAGGTG')], self.index_file)
+		self.app = Flask('test', template_folder=os.path.join(os.path.dirname(Site_Main_Flask.__file__), 'templates'))
+		self.hash_str = hashlib.md5(b'TACGGAGGAT').hexdigest()
+		self.api_res = {'seqids': [1, 5], 'seqstr': ['TACGGAGGAT', 'TACGGAGGATTT'],
+						'annotations': [[{'annotationid': 10, 'num_sequences': 3}, 2], [{'annotationid': 11, 'num_sequences': 1}, 1]]}
+
+	def tearDown(self):
+		self.tempdir.cleanup()
+
+	def _get_hash_info(self, hash_str, index_file):
+		'''get the get_hash_info() page parts, the drawn (annotations, sequences) and the rest-api calls
+		'''
+		drawn = []
+		with mock.patch.dict(os.environ, {'DBBACT_SEQ_INDEX': index_file}), mock.patch.object(seq_index, '_index_check_time', 0), \
+				mock.patch.object(Site_Main_Flask.rest_client, 'get', side_effect=lambda *args, **kwargs: FakeResponse(self.api_res)) as rest_get, \
+				mock.patch.object(Site_Main_Flask, 'render_header', return_value=''), \
+				mock.patch.object(Site_Main_Flask, 'draw_annotation_details', side_effect=lambda annotations, sequences=None: drawn.append((annotations, sequences)) or ''), \
+				self.app.test_request_context():
+			err, webpage = Site_Main_Flask.get_hash_info(hash_str)
+		return err, webpage, drawn, rest_get.call_args_list
+
+	def test_index_same_as_api(self):
+		index_err, index_page, index_drawn, index_calls = self._get_hash_info(self.hash_str, self.index_file)
+		api_err, api_page, api_drawn, api_calls = self._get_hash_info(self.hash_str, '')
+		self.assertEqual(index_err, '')
+		self.assertEqual(api_err, '')
+		self.assertEqual(index_page, api_page)
+		self.assertEqual(index_drawn, api_drawn)
+		self.assertEqual(index_calls, api_calls)
+		# all the matching sequences and the annotation counts from the rest-api are shown
+		annotations, sequences = index_drawn[0]
+		self.assertEqual(sequences, ['TACGGAGGAT', 'TACGGAGGATTT'])
+		self.assertEqual([len(x['website_sequences']) for x in annotations], [2, 1])
+
+	def test_index_missing_hash(self):
+		missing_hash = hashlib.md5(b'AACGAAGGGG').hexdigest()
+		err, webpage, drawn, calls = self._get_hash_info(missing_hash, self.index_file)
+		self.assertNotEqual(err, '')
+		self.assertEqual(calls, [])
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,101 @@
+from unittest import TestCase, main, mock
+
+from dbbact_website import Site_Main_Flask
+
+
+class FakeResponse:
+	def __init__(self, json_data, status_code=200):
+		self._json = json_data
+		self.status_code = status_code
+		self.content = b''
+
+	def json(self):
+		return self._json
+
+
+class SequencesExistTests(TestCase):
+	def setUp(self):
+		# the dbBact sequences {sequence: id}
+		self.db_seqs = {'AAAA': 1, 'CCCC': 2, 'GGGG': 3}
+		self.getid_list_status = 200
+		# None to answer getid_list from db_seqs
+		self.getid_list_ids = None
+		self.seq_index = None
+		self.calls = []
+		patchers = [mock.patch.object(Site_Main_Flask.rest_client, 'get', side_effect=self._get),
+					mock.patch.object(Site_Main_Flask.rest_client, 'fetch_all', side_effect=self._fetch_all),
+					mock.patch.object(Site_Main_Flask, 'get_sequence_index', side_effect=lambda: self.seq_index)]
+		for cpatcher in patchers:
+			cpatcher.start()
+			self.addCleanup(cpatcher.stop)
+
+	def _getid(self, seq):
+		if seq in self.db_seqs:
+			return [self.db_seqs[seq]]
+		return []
+
+	def _get(self, path, json=None, **kwargs):
+		self.calls.append((path, json))
+		if path == '/sequences/getid_list':
+			seq_ids = self.getid_list_ids
+			if seq_ids is None:
+				seq_ids = [self._getid(x) for x in json['sequences']]
+			return FakeResponse({'seqIds': seq_ids}, self.getid_list_status)
+		if path == '/sequences/getid':
+			return FakeResponse({'seqId': self._getid(json['sequence'])})
+		return FakeResponse({}, 404)
+
+	def _fetch_all(self, calls):
+		return [self._get(cpath, **ckwargs) for cmethod, cpath, ckwargs in calls]
+
+	def _get_index(self, seqs):
+		seq_index = mock.Mock()
+		seq_index.lookup_sequence.side_effect = lambda x: self.db_seqs.get(x) if x in seqs else None
+		return seq_index
+
+	def test_getid_list(self):
+		self.assertEqual(Site_Main_Flask.test_if_sequences_exist(['AAAA', 'TTTT', 'GGGG']), [True, False, True])
+		# one rest-api call for all the sequences
+		self.assertEqual(self.calls, [('/sequences/getid_list', {'sequences': ['AAAA', 'TTTT', 'GGGG'], 'use_sequence_translator': True})])
+
+	def test_getid_fallback(self):
+		# an older rest-api server without getid_list
+		self.getid_list_status = 404
+		self.assertEqual(Site_Main_Flask.test_if_sequences_exist(['AAAA', 'TTTT', 'GGGG'], use_sequence_translator=False), [True, False, True])
+		self.assertEqual([x[0] for x in self.calls], ['/sequences/getid_list'] + ['/sequences/getid'] * 3)
+		self.assertEqual(self.calls[2][1], {'sequence': 'TTTT', 'use_sequence_translator': False})
+
+	def test_getid_list_invalid(self):
+		# a getid_list response not matching the sequences is not used
+		self.getid_list_ids = [[1]]
+		self.assertEqual(Site_Main_Flask.test_if_sequences_exist(['AAAA', 'TTTT']), [True, False])
+		self.assertEqual([x[0] for x in self.calls], ['/sequences/getid_list'] + ['/sequences/getid'] * 2)
+
+	def test_empty(self):
+		self.assertEqual(Site_Main_Flask.test_if_sequences_exist([]), [])
+		self.assertEqual(self.calls, [])
+
+	def test_seq_index(self):
+		# only the sequences not in the local index are tested using the rest-api
+		self.seq_index = self._get_index(['AAAA'])
+		self.assertEqual(Site_Main_Flask.test_if_sequences_exist(['AAAA', 'TTTT', 'GGGG', 'AAAA']), [True, False, True, True])
+		self.assertEqual(self.calls, [('/sequences/getid_list', {'sequences': ['TTTT', 'GGGG'], 'use_sequence_translator': True})])
+		self.calls = []
+		self.seq_index = self._get_index(['AAAA', 'GGGG'])
+		self.assertEqual(Site_Main_Flask.test_if_sequences_exist(['GGGG', 'AAAA']), [True, True])
+		self.assertEqual(self.calls, [])
+
+	def test_left_trim(self):
+		# the left-trimmed sequence with the fewest nucleotides removed is used
+		self.db_seqs = {'CGTTACG': 1, 'GTTACG': 2}
+		trimmed, msg = Site_Main_Flask.trim_primers_from_sequence('TTACGTTACG')
+		self.assertEqual(trimmed, 'CGTTACG')
+		self.assertEqual(msg, 'Left-trimmed first 3 nucleotides')
+		self.assertEqual(len(self.calls), 1)
+		self.assertEqual(self.calls[0][1]['sequences'], ['TACGTTACG', 'ACGTTACG', 'CGTTACG', 'GTTACG', 'TTACG', 'TACG', 'ACG', 'CG', 'G', ''])
+		self.db_seqs = {}
+		self.assertEqual(Site_Main_Flask.trim_primers_from_sequence('TTACGTTACG'), (None, 'no region identified'))
+
+
+if __name__ == '__main__':
+	main()
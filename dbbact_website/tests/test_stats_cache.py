@@ -0,0 +1,109 @@
+import os
+import threading
+from unittest import TestCase, main, mock
+
+from dbbact_website import stats_cache
+from dbbact_website.utils import BackgroundRefresh
+
+
+class FakeResponse:
+	def __init__(self, json_data, status_code=200):
+		self._json = json_data
+		self.status_code = status_code
+		self.content = b''
+
+	def json(self):
+		return self._json
+
+
+class StatsCacheTests(TestCase):
+	def setUp(self):
+		self.stats = {'NumSequences': 10, 'NumAnnotations': 2}
+		self.status_code = 200
+		self.calls = 0
+		# the rest-api calls wait for the gate, so the test controls when a refresh finishes
+		self.gate = threading.Event()
+		self.gate.set()
+		patchers = [mock.patch.dict(os.environ, {'DBBACT_STATS_TTL': '300', 'DBBACT_STATS_FIRST_WAIT': '5'}),
+					mock.patch.object(stats_cache.rest_client, 'get', side_effect=self._get),
+					mock.patch.object(stats_cache, '_refresher', BackgroundRefresh(stats_cache._refresh, 'test-stats-refresh'))]
+		for cpatcher in patchers:
+			cpatcher.start()
+			self.addCleanup(cpatcher.stop)
+		self._clear()
+		self.addCleanup(self._clear)
+
+	def _clear(self):
+		stats_cache._stats = None
+		stats_cache._stats_time = 0
+		stats_cache._stats_version = None
+
+	def _get(self, path, **kwargs):
+		self.gate.wait(5)
+		self.calls += 1
+		return FakeResponse({'stats': dict(self.stats)}, self.status_code)
+
+	def _wait_refresh(self):
+		stats_cache._refresher._thread.join(5)
+
+	def test_get_stats(self):
+		self.assertEqual(stats_cache.get_stats(), self.stats)
+		self.assertEqual(stats_cache.get_stats(), self.stats)
+		self.assertEqual(self.calls, 1)
+
+	def test_no_wait(self):
+		self.gate.clear()
+		self.assertIsNone(stats_cache.get_stats(wait=False))
+		self.gate.set()
+		self._wait_refresh()
+		self.assertEqual(stats_cache.get_stats(wait=False), self.stats)
+
+	def test_ttl(self):
+		old_stats = dict(self.stats)
+		stats_cache.get_stats()
+		self.stats['NumAnnotations'] = 3
+		# expired - the old statistics are returned while the new ones are fetched in the background
+		stats_cache._stats_time -= 301
+		self.gate.clear()
+		self.assertEqual(stats_cache.get_stats(), old_stats)
+		# only one refresh runs at a time
+		self.assertEqual(stats_cache.get_stats(), old_stats)
+		self.gate.set()
+		self._wait_refresh()
+		self.assertEqual(stats_cache.get_stats(), self.stats)
+		self.assertEqual(self.calls, 2)
+
+	def test_failed_refresh(self):
+		self.status_code = 500
+		self.assertIsNone(stats_cache.get_stats())
+		self.assertIsNone(stats_cache.get_db_version())
+		self.status_code = 200
+		stats_cache.get_stats()
+		self._wait_refresh()
+		version = stats_cache.get_db_version()
+		# a failed refresh keeps the old statistics
+		stats_cache._stats_time -= 301
+		self.status_code = 500
+		stats_cache.get_stats()
+		self._wait_refresh()
+		self.assertEqual(stats_cache.get_stats(), self.stats)
+		self.assertEqual(stats_cache.get_db_version(), version)
+
+	def test_db_version(self):
+		version = stats_cache.get_db_version()
+		self.assertIsNotNone(version)
+		# the same statistics have the same version
+		stats_cache._stats_time -= 301
+		stats_cache.get_stats()
+		self._wait_refresh()
+		self.assertEqual(stats_cache.get_db_version(), version)
+		# and new annotations change the version
+		self.stats['NumAnnotations'] = 3
+		stats_cache._stats_time -= 301
+		stats_cache.get_stats()
+		self._wait_refresh()
+		self.assertNotEqual(stats_cache.get_db_version(), version)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,131 @@
+import os
+import threading
+from unittest import TestCase, main, mock
+
+from dbbact_website import term_index
+from dbbact_website.utils import BackgroundRefresh
+
+
+class FakeResponse:
+	def __init__(self, json_data, status_code=200):
+		self._json = json_data
+		self.status_code = status_code
+		self.content = b''
+
+	def json(self):
+		return self._json
+
+
+class PrefixIndexTests(TestCase):
+	def setUp(self):
+		self.index = term_index.PrefixIndex(['feces', 'human feces', 'Human', 'fecal  sample', 'soil', 'sea water', '', 'feces'])
+
+	def test_names(self):
+		# duplicate and empty names are removed
+		self.assertEqual(len(self.index), 6)
+
+	def test_search(self):
+		# names starting with the query first, then names with a word starting with the query
+		self.assertEqual(self.index.search('fec'), ['fecal  sample', 'feces', 'human feces'])
+		self.assertEqual(self.index.search('hum'), ['Human', 'human feces'])
+		self.assertEqual(self.index.search('water'), ['sea water'])
+		self.assertEqual(self.index.search('sample'), ['fecal  sample'])
+		self.assertEqual(self.index.search('xyz'), [])
+		self.assertEqual(self.index.search(''), [])
+
+	def test_search_normalize(self):
+		self.assertEqual(self.index.search('HUMAN F'), ['human feces'])
+		self.assertEqual(self.index.search('  human   feces '), ['human feces'])
+
+	def test_search_k(self):
+		self.assertEqual(self.index.search('fec', k=2), ['fecal  sample', 'feces'])
+		self.assertEqual(self.index.search('fec', k=1), ['fecal  sample'])
+
+	def test_contains(self):
+		self.assertIn('feces', self.index)
+		self.assertIn('HUMAN  Feces', self.index)
+		self.assertIn('human', self.index)
+		self.assertNotIn('fece', self.index)
+		self.assertNotIn('water', self.index)
+
+
+class TermIndexTests(TestCase):
+	def setUp(self):
+		self.names = {'/ontology/get_all_terms': ['feces', 'human feces', 'soil'],
+					  '/ontology/get_all_synonyms': {'stool': 'feces', 'dirt': 'soil'}}
+		self.db_version = '1'
+		self.calls = []
+		# the rest-api calls wait for the gate, so the test controls when a refresh finishes
+		self.gate = threading.Event()
+		self.gate.set()
+		patchers = [mock.patch.dict(os.environ, {'DBBACT_TERM_INDEX_TTL': '3600', 'DBBACT_TERM_INDEX_FIRST_WAIT': '5'}),
+					mock.patch.object(term_index.rest_client, 'get', side_effect=self._get),
+					mock.patch.object(term_index.stats_cache, 'get_db_version', side_effect=lambda: self.db_version),
+					mock.patch.object(term_index, '_refresher', BackgroundRefresh(term_index._refresh, 'test-term-index-refresh'))]
+		for cpatcher in patchers:
+			cpatcher.start()
+			self.addCleanup(cpatcher.stop)
+		self._clear()
+		self.addCleanup(self._clear)
+
+	def _clear(self):
+		term_index._indexes = None
+		term_index._indexes_time = 0
+		term_index._indexes_version = None
+
+	def _get(self, endpoint, **kwargs):
+		self.gate.wait(5)
+		self.calls.append(endpoint)
+		if endpoint not in self.names:
+			return FakeResponse(None, 404)
+		return FakeResponse(self.names[endpoint])
+
+	def _wait_refresh(self):
+		term_index._refresher._thread.join(5)
+
+	def test_autocomplete(self):
+		self.assertEqual(term_index.autocomplete('fe'), {'ontology': ['feces', 'human feces'], 'synonym': []})
+		self.assertEqual(term_index.autocomplete('s'), {'ontology': ['soil'], 'synonym': ['stool']})
+		self.assertEqual(term_index.autocomplete('s', groups=['synonym']), {'synonym': ['stool']})
+		self.assertEqual(term_index.autocomplete('s', k=1, groups=['ontology', 'nothing']), {'ontology': ['soil'], 'nothing': []})
+		# the index is built once
+		self.assertEqual(len(self.calls), 2)
+
+	def test_is_known_term(self):
+		# not waiting for the index
+		self.gate.clear()
+		self.assertIsNone(term_index.is_known_term('feces'))
+		self.gate.set()
+		self._wait_refresh()
+		self.assertTrue(term_index.is_known_term('Human Feces'))
+		self.assertTrue(term_index.is_known_term('dirt'))
+		self.assertFalse(term_index.is_known_term('human'))
+
+	def test_failed(self):
+		del self.names['/ontology/get_all_synonyms']
+		self.assertEqual(term_index.autocomplete('fe'), {'ontology': [], 'synonym': []})
+		self.assertIsNone(term_index.get_indexes(wait=False))
+
+	def test_db_version(self):
+		term_index.get_indexes()
+		self.names['/ontology/get_all_terms'].append('fecal sample')
+		self.assertEqual(term_index.autocomplete('fecal')['ontology'], [])
+		self.assertEqual(len(self.calls), 2)
+		# a new database version rebuilds the index in the background
+		self.db_version = '2'
+		term_index.get_indexes()
+		self._wait_refresh()
+		self.assertEqual(term_index.autocomplete('fecal')['ontology'], ['fecal sample'])
+		self.assertEqual(len(self.calls), 4)
+
+	def test_ttl(self):
+		term_index.get_indexes()
+		self.names['/ontology/get_all_terms'].append('fecal sample')
+		term_index._indexes_time -= 3601
+		term_index.get_indexes()
+		self._wait_refresh()
+		self.assertEqual(term_index.autocomplete('fecal')['ontology'], ['fecal sample'])
+
+
+if __name__ == '__main__':
+	main()
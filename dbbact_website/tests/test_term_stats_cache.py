@@ -0,0 +1,96 @@
+import os
+import tempfile
+from unittest import TestCase, main, mock
+
+from dbbact_website import term_stats_cache
+
+
+class TermStatsCacheTests(TestCase):
+	def setUp(self):
+		self.tempdir = tempfile.TemporaryDirectory()
+		self.db_version = '1'
+		self.term_info = {'feces': {'total_sequences': 10}, 'soil': {'total_sequences': 4}}
+		self.fetched = []
+		patchers = [mock.patch.dict(os.environ, {'DBBACT_TERM_STATS_CACHE_DIR': self.tempdir.name}),
+					mock.patch.object(term_stats_cache.stats_cache, 'get_db_version', side_effect=lambda: self.db_version),
+					mock.patch.object(term_stats_cache, '_fetch_term_stats', side_effect=self._fetch_term_stats)]
+		for cpatcher in patchers:
+			cpatcher.start()
+			self.addCleanup(cpatcher.stop)
+		self._clear_memory()
+
+	def tearDown(self):
+		self._clear_memory()
+		self.tempdir.cleanup()
+
+	def _clear_memory(self):
+		term_stats_cache._memory_cache = {}
+		term_stats_cache._memory_version = None
+
+	def _fetch_term_stats(self, terms):
+		self.fetched.append(terms)
+		return {k: v for k, v in self.term_info.items() if k in terms}
+
+	def test_get_term_stats(self):
+		res = term_stats_cache.get_term_stats(['feces', 'fish', 'feces'])
+		self.assertEqual(res, {'feces': {'total_sequences': 10}})
+		self.assertEqual(self.fetched, [['feces', 'fish']])
+
+	def test_memory_cache(self):
+		term_stats_cache.get_term_stats(['feces', 'fish'])
+		# only the missing terms are fetched. non-existing terms (fish) are cached too
+		res = term_stats_cache.get_term_stats(['feces', 'fish', 'soil'])
+		self.assertEqual(res, self.term_info)
+		self.assertEqual(self.fetched, [['feces', 'fish'], ['soil']])
+		with mock.patch.object(term_stats_cache, '_get_disk_file', return_value=None):
+			self.assertEqual(term_stats_cache.get_term_stats(['soil', 'fish']), {'soil': {'total_sequences': 4}})
+		self.assertEqual(len(self.fetched), 2)
+
+	def test_disk_cache(self):
+		term_stats_cache.get_term_stats(['feces', 'fish'])
+		# another worker process only has the on-disk cache
+		self._clear_memory()
+		self.assertEqual(term_stats_cache.get_term_stats(['feces', 'fish']), {'feces': {'total_sequences': 10}})
+		self.assertEqual(len(self.fetched), 1)
+
+	def test_db_version(self):
+		term_stats_cache.get_term_stats(['feces'])
+		self.db_version = '2'
+		self.term_info['feces'] = {'total_sequences': 11}
+		self.assertEqual(term_stats_cache.get_term_stats(['feces']), {'feces': {'total_sequences': 11}})
+		self.assertEqual(len(self.fetched), 2)
+		# the on-disk cache was cleared and updated to the new version
+		self._clear_memory()
+		self.assertEqual(term_stats_cache.get_term_stats(['feces']), {'feces': {'total_sequences': 11}})
+		self.assertEqual(len(self.fetched), 2)
+		# an older version worker does not use the new version on-disk cache
+		self._clear_memory()
+		self.db_version = '1'
+		term_stats_cache.get_term_stats(['feces'])
+		self.assertEqual(len(self.fetched), 3)
+
+	def test_no_db_version(self):
+		self.db_version = None
+		term_stats_cache.get_term_stats(['feces'])
+		term_stats_cache.get_term_stats(['feces'])
+		self.assertEqual(len(self.fetched), 2)
+
+	def test_fetch_failed(self):
+		with mock.patch.object(term_stats_cache, '_fetch_term_stats', return_value=None):
+			self.assertIsNone(term_stats_cache.get_term_stats(['feces']))
+		term_stats_cache.get_term_stats(['feces'])
+		self.assertEqual(self.fetched, [['feces']])
+
+	def test_disk_cache_disabled(self):
+		with mock.patch.dict(os.environ, {'DBBACT_TERM_STATS_CACHE_DIR': ''}):
+			self.assertIsNone(term_stats_cache._get_disk_file())
+
+	def test_default_dir(self):
+		with mock.patch.dict(os.environ), mock.patch.object(term_stats_cache, 'get_private_dir', return_value=self.tempdir.name) as get_private_dir:
+			del os.environ['DBBACT_TERM_STATS_CACHE_DIR']
+			self.assertEqual(term_stats_cache._get_disk_file(), os.path.join(self.tempdir.name, 'term_stats_cache.sqlite'))
+		get_private_dir.assert_called_once_with('DBBACT_TERM_STATS_CACHE_DIR', 'dbbact_cache')
+
+
+if __name__ == '__main__':
+	main()
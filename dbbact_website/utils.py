@@ -1,13 +1,41 @@
 import sys
 import smtplib
 import os
-import inspect
+import stat
+import tempfile
+import atexit
+import time
 import datetime
+import threading
+import queue
 
 debuglevel = 6
 
+# how debug messages are written (set by the DBBACT_LOG_MODE environment variable or SetLogMode()):
+# 'sync' - write and flush each message (default)
+# 'buffered' - collect the messages and write them together (when LOG_BUFFER_SIZE characters are waiting,
+#              every LOG_FLUSH_INTERVAL seconds and on exit)
+# 'async' - write and flush in a background thread
+log_mode = os.environ.get('DBBACT_LOG_MODE', 'sync')
 
-def debug(level, msg, request=None):
+# the output file for the debug messages
+log_file = sys.stderr
+
+# the queue and thread for the 'async' log mode
+_log_queue = None
+_log_thread = None
+_log_thread_pid = None
+_log_lock = threading.Lock()
+
+# the waiting messages of the 'buffered' log mode (of the process _log_buffer_pid)
+LOG_BUFFER_SIZE = 65536
+LOG_FLUSH_INTERVAL = 1
+_log_buffer = []
+_log_buffer_size = 0
+_log_buffer_pid = None
+
+
+def debug(level, msg, *args, request=None):
     """
     print a debug message
 
@@ -15,36 +43,167 @@ def debug(level, msg, request=None):
     level : int
         error level (0=debug, 4=info, 7=warning,...10=critical)
     msg : str
-        the debug message
+        the debug message. If args are supplied, msg is a format string
+        and the message is msg % args (only formatted if the message is written)
+    args :
+        the arguments for formatting msg
     request: requests.Request or None, optional
         not None to write the source address of the request
-    ofile: str or None, optional
-        name of file to write the debug info into, or None to print to stderr
     """
-    global debuglevel
+    if level < debuglevel:
+        return
 
-    if level >= debuglevel:
+    try:
+        cf = sys._getframe(1)
+        cfile = os.path.basename(cf.f_code.co_filename)
+        cline = cf.f_lineno
+        cfunction = cf.f_code.co_name
+    except:
+        cfile = 'NA'
+        cline = 'NA'
+        cfunction = 'NA'
+    omsg = '[%s] [%d] [%s:%s:%s] ' % (datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), level, cfile, cfunction, cline)
+    if request is not None:
         try:
-            cf = inspect.stack()[1]
-            cfile = cf.filename.split('/')[-1]
-            cline = cf.lineno
-            cfunction = cf.function
+            if request.environ.get('HTTP_X_FORWARDED_FOR') is None:
+                source = request.environ['REMOTE_ADDR']
+            else:
+                source = request.environ['HTTP_X_FORWARDED_FOR']
         except:
-            cfile = 'NA'
-            cline = 'NA'
-            cfunction = 'NA'
-        omsg = '[%s] [%d] [%s:%s:%s] ' % (datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), level, cfile, cfunction, cline)
-        if request is not None:
-            try:
-                if request.environ.get('HTTP_X_FORWARDED_FOR') is None:
-                    source = request.environ['REMOTE_ADDR']
-                else:
-                    source = request.environ['HTTP_X_FORWARDED_FOR']
-            except:
-                source = 'Failed'
-            omsg += '[IP: %s] ' % source
-        omsg += '%s' % msg
-        print(omsg, file=sys.stderr, flush=True)
+            source = 'Failed'
+        omsg += '[IP: %s] ' % source
+    if args:
+        try:
+            msg = msg % args
+        except Exception:
+            msg = '%s %s' % (msg, args)
+    omsg += '%s' % msg
+    _write_log(omsg)
+
+
+def _write_log(omsg):
+    """
+    write a formatted debug message according to the log mode
+
+    input:
+    omsg : str
+        the message to write
+    """
+    if log_mode == 'async':
+        _get_log_queue().put(omsg)
+    elif log_mode == 'buffered':
+        _buffer_log(omsg)
+    else:
+        print(omsg, file=log_file, flush=True)
+
+
+def _buffer_log(omsg):
+    """
+    add a message to the 'buffered' log mode buffer (starting the periodic flush thread in the current process if needed)
+    the buffer is written if it is larger than LOG_BUFFER_SIZE characters
+
+    input:
+    omsg : str
+        the message to write
+    """
+    global _log_buffer_size, _log_buffer_pid
+
+    pid = os.getpid()
+    with _log_lock:
+        if _log_buffer_pid != pid:
+            # the messages inherited from the parent process are written by the parent process
+            _log_buffer.clear()
+            _log_buffer_size = 0
+            _log_buffer_pid = pid
+            threading.Thread(target=_log_flusher, name='dbbact-log-flush', daemon=True).start()
+        _log_buffer.append(omsg)
+        _log_buffer_size += len(omsg) + 1
+        if _log_buffer_size < LOG_BUFFER_SIZE:
+            return
+    _flush_log_buffer()
+
+
+def _flush_log_buffer():
+    """
+    write the waiting messages of the 'buffered' log mode
+    """
+    global _log_buffer_size
+
+    with _log_lock:
+        if not _log_buffer or _log_buffer_pid != os.getpid():
+            return
+        text = '\n'.join(_log_buffer) + '\n'
+        _log_buffer.clear()
+        _log_buffer_size = 0
+        log_file.write(text)
+        log_file.flush()
+
+
+def _log_flusher():
+    """
+    write the 'buffered' log mode messages every LOG_FLUSH_INTERVAL seconds (runs in a background thread)
+    """
+    while True:
+        time.sleep(LOG_FLUSH_INTERVAL)
+        try:
+            _flush_log_buffer()
+        except Exception:
+            pass
+
+
+def _get_log_queue():
+    """
+    get the queue of the async log writer thread (starting the thread in the current process if needed)
+
+    output:
+    queue.SimpleQueue
+    """
+    global _log_queue, _log_thread, _log_thread_pid
+
+    pid = os.getpid()
+    if _log_thread_pid == pid:
+        return _log_queue
+    with _log_lock:
+        if _log_thread_pid != pid:
+            _log_queue = queue.SimpleQueue()
+            _log_thread = threading.Thread(target=_log_writer, args=(_log_queue,), name='dbbact-log', daemon=True)
+            _log_thread.start()
+            _log_thread_pid = pid
+    return _log_queue
+
+
+def _log_writer(log_queue):
+    """
+    write the messages from the async log queue (runs in a background thread)
+    a None message marks the end of the queue
+    """
+    while True:
+        omsg = log_queue.get()
+        if omsg is None:
+            break
+        print(omsg, file=log_file)
+        # flush only when there are no more waiting messages
+        if log_queue.empty():
+            log_file.flush()
+    log_file.flush()
+
+
+@atexit.register
+def flush_log():
+    """
+    write all the waiting debug messages (for the 'buffered' and 'async' log modes)
+    """
+    global _log_thread_pid
+
+    if _log_thread is not None and _log_thread_pid == os.getpid():
+        _log_queue.put(None)
+        _log_thread.join(timeout=5)
+        _log_thread_pid = None
+    try:
+        _flush_log_buffer()
+        log_file.flush()
+    except Exception:
+        pass
 
 
 def SetDebugLevel(level):
@@ -53,6 +212,124 @@ def SetDebugLevel(level):
     debuglevel = level
 
 
+def SetLogMode(mode):
+    """
+    set how the debug messages are written
+
+    input:
+    mode : str
+        'sync' / 'buffered' / 'async' (see log_mode)
+    """
+    global log_mode
+
+    if mode not in ('sync', 'buffered', 'async'):
+        raise ValueError('log mode %s not supported' % mode)
+    flush_log()
+    log_mode = mode
+
+
+def get_private_dir(env_name, dir_name):
+    """
+    get the directory for files shared by the worker processes (i.e. the enrichment job queue)
+
+    input:
+    env_name : str
+        the environment variable setting the directory
+    dir_name : str
+        the directory name in the system temp. dir (used if env_name is not set).
+        the user id is added to the name, and the directory is created accessible only by the current user
+    output:
+    str
+        the directory (created if needed)
+    """
+    cdir = os.environ.get(env_name)
+    if cdir:
+        os.makedirs(cdir, exist_ok=True)
+        return cdir
+    cdir = os.path.join(tempfile.gettempdir(), '%s_%d' % (dir_name, os.getuid()))
+    os.makedirs(cdir, mode=0o700, exist_ok=True)
+    # the temp. dir is shared, so make sure another user did not create the directory first
+    cstat = os.lstat(cdir)
+    if not stat.S_ISDIR(cstat.st_mode) or cstat.st_uid != os.getuid() or cstat.st_mode & 0o077:
+        raise PermissionError('%s is not a private directory of the current user. Please set %s' % (cdir, env_name))
+    return cdir
+
+
+class ProcessLocal:
+    '''A value created once in each process (i.e. a requests session or a thread pool)
+
+    gunicorn forks the workers after the modules are imported, so values created in the parent process
+    (with their threads and connections) cannot be used in the workers. get() creates the value again after a fork.
+    '''
+    def __init__(self, factory):
+        '''
+        Parameters
+        ----------
+        factory: function
+            creates the value of the current process (no arguments)
+        '''
+        self._factory = factory
+        self._value = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        '''Get the value of the current process (created on the first call in each process)
+        '''
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._value = self._factory()
+                    self._pid = pid
+        return self._value
+
+
+class BackgroundRefresh:
+    '''Run a refresh function in a background (daemon) thread, with at most one running refresh in each process
+
+    Used by the caches that are refreshed after a TTL while the old values are still used (i.e. stats_cache and term_index)
+    '''
+    def __init__(self, target, name):
+        '''
+        Parameters
+        ----------
+        target: function
+            the refresh function (no arguments). it should catch its own errors
+        name: str
+            the thread name
+        '''
+        self.target = target
+        self.name = name
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self, wait=None):
+        '''Start a refresh, if one is not already running in the current process
+
+        Parameters
+        ----------
+        wait: float or None, optional
+            number of seconds to wait for the refresh to finish, or None to return immediately
+
+        Returns
+        -------
+        threading.Thread
+            the refresh thread
+        '''
+        pid = os.getpid()
+        with self._lock:
+            if self._thread is None or self._pid != pid or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.target, name=self.name, daemon=True)
+                self._pid = pid
+                self._thread.start()
+            thread = self._thread
+        if wait is not None:
+            thread.join(wait)
+        return thread
+
+
 def getdoc(func):
     """
     return the json version of the doc for the function func
@@ -167,7 +444,7 @@ def get_dbbact_server_address():
     # first lets try defaults based on the server type
     if 'DBBACT_WEBSITE_TYPE' in os.environ:
         cenv = os.environ['DBBACT_WEBSITE_TYPE']
-        debug(1, 'using server type %s from DBBACT_WEBSITE_TYPE' % cenv)
+        debug(1, 'using server type %s from DBBACT_WEBSITE_TYPE', cenv)
         if cenv == 'main':
             cport = 5001
         elif cenv == 'develop':
@@ -175,18 +452,18 @@ def get_dbbact_server_address():
         elif cenv == 'test':
             cport = 5002
         else:
-            debug(2, 'server type %s not recognized (should be main/develop/test. ignoring' % cenv)
+            debug(2, 'server type %s not recognized (should be main/develop/test. ignoring', cenv)
 
     # now override with host/port
     if 'DBBACT_SERVER_HOST' in os.environ:
         caddress = os.environ['DBBACT_SERVER_HOST']
-        debug(1, 'dbbact server address from DBBACT_SERVER_HOST set to %s' % caddress)
+        debug(1, 'dbbact server address from DBBACT_SERVER_HOST set to %s', caddress)
     if 'DBBACT_SERVER_PORT' in os.environ:
         cport = os.environ['DBBACT_SERVER_PORT']
-        debug(1, 'dbbact server port from DBBACT_SERVER_PORT set to %s' % cport)
+        debug(1, 'dbbact server port from DBBACT_SERVER_PORT set to %s', cport)
 
     server_address = 'http://%s:%s' % (caddress, cport)
-    debug(2, 'using final dbbact api sever address %s' % server_address)
+    debug(2, 'using final dbbact api sever address %s', server_address)
     return server_address
 
 